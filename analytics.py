@@ -0,0 +1,274 @@
+"""Analytics queries shared by the /analytics page and other reports.
+
+Functions take an open sqlite3 connection (row_factory=sqlite3.Row) and never
+commit, so they can be reused from views, CLI commands and scripts.
+"""
+import datetime
+
+import numpy as np
+
+from schedule import scheduled_ordinals, slot_sql
+
+REASON_WINDOWS = (30, 90, 365)
+ROLLING_WINDOWS = (7, 30)
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+# Grouping column for reason_stats(group_by=...)
+_REASON_GROUPS = {
+    None: None,
+    "habit": "h.id",
+    "week": "strftime('%Y-W%W', dr.date)",
+    "month": "strftime('%Y-%m', dr.date)",
+}
+
+
+def entry_missed_sql(habit="h", date="dr.date"):
+    """(join, condition) SQL telling whether `habit` missed `date`, for habit_entry rows.
+
+    A habit missed a day when it had a slot there (scheduled, or an entry was
+    stored) that is not completed.
+    """
+    return (
+        f"LEFT JOIN habit_entry he ON he.habit_id = {habit}.id AND he.date = {date}",
+        f"COALESCE(he.completed, 0) = 0 AND (he.id IS NOT NULL OR {slot_sql(habit, date)})",
+    )
+
+
+def reason_stats(db, user_id, days=90, today=None, habit_id=None, group_by=None, limit=None,
+                 missed_sql=entry_missed_sql, day_rollup=False):
+    """Count missed-day reasons over the `days` days ending `today`.
+
+    A day counts once per normalized reason (trimmed, case-insensitive) when
+    the user left a reason and missed at least one habit that day. With
+    `habit_id`, only misses of that habit count. `group_by` splits the counts
+    per "habit", "week" or "month" (for breakdowns and trends). `missed_sql`
+    adapts the query to the storage layout (see storage.py). With
+    `day_rollup`, counts that are not per habit read the missed days from
+    user_day_rollup instead; it must be current through `today` (rollup.py).
+
+    Returns dicts with "reason", "count" and, when grouped, "group", ordered
+    by group then count descending. `limit` applies per group.
+    """
+    if group_by not in _REASON_GROUPS:
+        raise ValueError(f"unknown group_by: {group_by!r}")
+    today = today or datetime.date.today()
+    start = today - datetime.timedelta(days=days - 1)
+
+    group_col = _REASON_GROUPS[group_by]
+    entries, missed = missed_sql("h", "dr.date")
+    missed = f"""
+        h.user_id = dr.user_id AND {missed}
+        {"AND h.id = ?" if habit_id is not None else ""}
+    """
+    # Per-habit counts need one row per missed habit; otherwise one row per day.
+    if day_rollup and habit_id is None and group_by != "habit":
+        source = "FROM day_reason dr JOIN user_day_rollup r ON r.user_id = dr.user_id AND r.date = dr.date"
+        missed = "AND r.done < r.scheduled"
+    elif group_by == "habit":
+        source = f"FROM day_reason dr JOIN habit h ON h.user_id = dr.user_id {entries}"
+        missed = f"AND {missed}"
+    else:
+        source = "FROM day_reason dr"
+        missed = f"AND EXISTS (SELECT 1 FROM habit h {entries} WHERE {missed})"
+
+    params = [user_id, start.isoformat(), today.isoformat()]
+    if habit_id is not None:
+        params.append(habit_id)
+
+    rows = db.execute(f"""
+        SELECT {group_col or 'NULL'} AS grp,
+               MIN(TRIM(dr.reason)) AS reason,
+               COUNT(*) AS count
+        {source}
+        WHERE dr.user_id = ? AND dr.date >= ? AND dr.date <= ?
+          AND TRIM(COALESCE(dr.reason, '')) != ''
+          {missed}
+        GROUP BY grp, LOWER(TRIM(dr.reason))
+        ORDER BY grp, count DESC, reason ASC
+    """, params).fetchall()
+
+    out, per_group = [], {}
+    for r in rows:
+        n = per_group.get(r["grp"], 0)
+        if limit is not None and n >= limit:
+            continue
+        per_group[r["grp"]] = n + 1
+        item = {"reason": r["reason"], "count": r["count"]}
+        if group_by:
+            item["group"] = r["grp"]
+        out.append(item)
+    return out
+
+
+def load_entry_arrays(db, user_id=None, habit_id=None, since=None, until=None):
+    """Stored entries as (habit_ids, day ordinals, completed) int64 arrays.
+
+    Sorted by habit, then date. Filter by user, by habit, and/or to dates in
+    [since, until]; with no filter every entry is loaded (rebuild tools).
+
+    SQLite hands back one packed string of dates and one of completion flags
+    per habit, which NumPy decodes without a Python object per entry.
+    """
+    where, params = [], []
+    if user_id is not None:
+        where.append("he.habit_id IN (SELECT id FROM habit WHERE user_id = ?)")
+        params.append(user_id)
+    if habit_id is not None:
+        where.append("he.habit_id = ?")
+        params.append(habit_id)
+    if since is not None:
+        where.append("he.date >= ?")
+        params.append(since.isoformat())
+    if until is not None:
+        where.append("he.date <= ?")
+        params.append(until.isoformat())
+
+    cur = db.cursor()
+    cur.row_factory = None
+    cur.execute(f"""
+        SELECT habit_id, group_concat(date, ''), group_concat(COALESCE(completed, 0) = 1, '')
+        FROM (
+            SELECT he.habit_id, he.date, he.completed
+            FROM habit_entry he
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY he.habit_id, he.date
+        )
+        GROUP BY habit_id
+        ORDER BY habit_id
+    """, params)
+
+    ids, days, done = [], [], []
+    for hid, dates, flags in cur:
+        flags = np.frombuffer(flags.encode(), dtype=np.uint8) - ord("0")
+        dates = np.frombuffer(dates.encode(), dtype="S10")  # ISO dates are fixed width
+        if len(dates) != len(flags):
+            raise ValueError(f"habit {hid} has malformed entry dates")
+        ids.append(np.full(len(flags), hid, dtype=np.int64))
+        days.append(dates.astype("datetime64[D]").astype(np.int64))
+        done.append(flags.astype(np.int64))
+    if not ids:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    # datetime64[D] counts days from 1970-01-01; shift to date.toordinal()
+    return np.concatenate(ids), np.concatenate(days) + _EPOCH_ORDINAL, np.concatenate(done)
+
+
+def load_habit_schedules(db, user_id=None, habit_id=None):
+    """(id, frequency, created_on) rows of the habits load_entry_arrays() would cover."""
+    where, params = [], []
+    if user_id is not None:
+        where.append("user_id = ?")
+        params.append(user_id)
+    if habit_id is not None:
+        where.append("id = ?")
+        params.append(habit_id)
+    return db.execute(f"""
+        SELECT id, frequency, created_on FROM habit
+        {"WHERE " + " AND ".join(where) if where else ""}
+    """, params).fetchall()
+
+
+def merge_slots(habit_ids, days, completed, habits, until, since=None):
+    """Add the computed slots of `habits` up to `until` to stored entry arrays.
+
+    A stored entry wins over the computed slot of the same habit and day; a
+    slot without one counts as not completed. Keeps the (habit, date) order.
+    """
+    slot_ids, slot_days = [], []
+    for h in habits:
+        if not h["created_on"]:
+            continue
+        start = datetime.date.fromisoformat(h["created_on"])
+        if since is not None:
+            start = max(start, since)
+        d = scheduled_ordinals(h["frequency"], start, until)
+        slot_ids.append(np.full(len(d), h["id"], dtype=np.int64))
+        slot_days.append(d)
+    if not slot_ids:
+        return habit_ids, days, completed
+
+    n_slots = sum(len(d) for d in slot_days)
+    ids = np.concatenate(slot_ids + [habit_ids])
+    all_days = np.concatenate(slot_days + [days])
+    done = np.concatenate([np.zeros(n_slots, dtype=np.int64), completed])
+    stored = np.concatenate([np.zeros(n_slots, dtype=bool), np.ones(len(habit_ids), dtype=bool)])
+
+    order = np.lexsort((stored, all_days, ids))
+    ids, all_days, done = ids[order], all_days[order], done[order]
+    # Keep the last row of each (habit, day): the stored one when both exist
+    keep = np.ones(len(ids), dtype=bool)
+    keep[:-1] = (ids[1:] != ids[:-1]) | (all_days[1:] != all_days[:-1])
+    return ids[keep], all_days[keep], done[keep]
+
+
+def habit_metrics(habit_ids, days, completed, today):
+    """Per-habit metrics from sorted entry arrays, in one vectorized pass.
+
+    Returns {habit_id: {...}} with total, done, consistency, current_streak,
+    longest_streak, rate_7d/rate_30d (completion % over scheduled entries in
+    the trailing window, None when nothing was scheduled) and weekday_rates
+    (Mon..Sun completion % of entries up to today, None for empty weekdays).
+    Streaks follow entry order: consecutive completed entries, with the
+    current streak ending at the latest entry on or before `today`.
+    """
+    n = len(habit_ids)
+    if n == 0:
+        return {}
+    today_ord = today.toordinal()
+    idx = np.arange(n)
+
+    # Segment boundaries: one segment per habit
+    is_start = np.ones(n, dtype=bool)
+    is_start[1:] = habit_ids[1:] != habit_ids[:-1]
+    starts = np.flatnonzero(is_start)
+    ids = habit_ids[starts]
+
+    total = np.diff(np.append(starts, n))
+    done = np.add.reduceat(completed, starts)
+
+    # Run-length encoding of completed runs: the length of the run ending at
+    # each position is its distance to the last reset (a miss, or the slot
+    # before the habit's first entry).
+    reset = np.where(completed == 0, idx, -1)
+    reset[is_start & (completed == 1)] = idx[is_start & (completed == 1)] - 1
+    run_len = np.where(completed == 1, idx - np.maximum.accumulate(reset), 0)
+    longest = np.maximum.reduceat(run_len, starts)
+
+    past = days <= today_ord
+    last_past = np.maximum.reduceat(np.where(past, idx, -1), starts)
+    has_past = last_past >= starts
+    current = np.where(has_past, run_len[np.maximum(last_past, 0)], 0)
+
+    rolling = {}
+    for w in ROLLING_WINDOWS:
+        in_window = past & (days > today_ord - w)
+        sched = np.add.reduceat(in_window.astype(np.int64), starts)
+        hit = np.add.reduceat((in_window & (completed == 1)).astype(np.int64), starts)
+        rolling[w] = (sched, hit)
+
+    # date(1, 1, 1) has ordinal 1 and is a Monday
+    weekday = (days - 1) % 7
+    seg = np.repeat(np.arange(len(starts)), total)
+    key = seg * 7 + weekday
+    wd_total = np.bincount(key[past], minlength=len(starts) * 7).reshape(-1, 7)
+    wd_done = np.bincount(key[past], weights=completed[past], minlength=len(starts) * 7).reshape(-1, 7)
+
+    out = {}
+    for i, hid in enumerate(ids.tolist()):
+        t, d = int(total[i]), int(done[i])
+        m = {
+            "total": t,
+            "done": d,
+            "consistency": int((d / t) * 100) if t else 0,
+            "current_streak": int(current[i]),
+            "longest_streak": int(longest[i]),
+            "weekday_rates": [
+                int((wd_done[i, k] / wd_total[i, k]) * 100) if wd_total[i, k] else None
+                for k in range(7)
+            ],
+        }
+        for w, (sched, hit) in rolling.items():
+            m[f"rate_{w}d"] = int((hit[i] / sched[i]) * 100) if sched[i] else None
+        out[hid] = m
+    return out
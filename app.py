@@ -1,14 +1,26 @@
-import os, sqlite3, calendar, datetime
-from flask import Flask, render_template, request, redirect, url_for, session, g, jsonify, send_file
+import os, io, csv, sqlite3, calendar, collections, contextlib, datetime, hashlib, tempfile, threading
+import click, time
+import numpy as np
+from flask import Flask, render_template, request, redirect, url_for, session, g, jsonify, send_file, Response, has_app_context, has_request_context
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
-from io import BytesIO
-from openpyxl import Workbook
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from analytics import REASON_WINDOWS, reason_stats
+from cache import ALL_SCOPES, StatsCache
+from export_jobs import ExportJobs, TooManyJobs
+from importer import BadImportFile, import_rows, read_rows
+from passwords import HashingBusy, PasswordHasher
+from schedule import is_slot, local_date, local_today, zone
+from shards import ShardRouter
+import history, profiling, rollup, shards, storage
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "streakly-secret")
+app.config["RATELIMIT_ENABLED"] = os.environ.get("RATELIMIT_ENABLED", "1") != "0"
+# Largest accepted request body (imports are the only uploads)
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_BYTES", str(64 * 1024 * 1024)))
 
 # Rate limiter
 limiter = Limiter(
@@ -17,23 +29,137 @@ limiter = Limiter(
 )
 limiter.init_app(app)
 
-DB = "streakly.db"
+DB = os.environ.get("DATABASE", "streakly.db")
+
+# SQLite connection settings, overridable from the environment.
+# WAL lets readers run alongside the single writer; "normal" sync is safe in
+# WAL mode and skips the fsync on every commit.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "wal"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "normal"),
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", "5000")),     # ms
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", "-16000")),       # negative = KiB
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024))),
+}
+# Reuse one connection per thread (and process) instead of opening one per request.
+DB_POOL = os.environ.get("SQLITE_POOL", "1") != "0"
+# Files each thread keeps a pooled connection to (the catalog and recent shards)
+DB_POOL_FILES = int(os.environ.get("SQLITE_POOL_FILES", "8"))
+
+_pool = threading.local()
+_migrated = set()  # database files this process has brought up to date
+_migrate_lock = threading.Lock()
+
+# User data can be spread over SHARD_COUNT files, or one file per user with
+# SHARD_PER_USER=1, in SHARD_DIR; DB then is the catalog of users (shards.py).
+# Existing users move with `flask rebalance-shards`.
+router = ShardRouter(
+    DB,
+    os.environ.get("SHARD_DIR", os.path.join(os.path.dirname(os.path.abspath(DB)), "shards")),
+    count=int(os.environ.get("SHARD_COUNT", "0")),
+    per_user=os.environ.get("SHARD_PER_USER", "0") == "1",
+)
+
+# Layout of recorded completions: "rows" (habit_entry) or "bitset"
+# (habit_month masks); see storage.py and `flask convert-storage`.
+store = storage.get_backend(os.environ.get("STORAGE", "rows"))
+
+# Opt-in per-request SQL counters and route latency histograms (see /admin).
+PROFILING = os.environ.get("PROFILING", "0") == "1"
+PROFILING_SERVER_TIMING = os.environ.get("PROFILING_SERVER_TIMING", "0") == "1"
+
+# Zone for users who have not signed in from a browser that reports one
+# (IANA name, e.g. "Asia/Kolkata"); unset means the server's local time.
+DEFAULT_TIMEZONE = os.environ.get("DEFAULT_TIMEZONE") or None
+
+def connect_db(path=None):
+    """New connection to `path` (default: the catalog DB); files are created
+    and migrated the first time this process opens them."""
+    path = path or DB
+    if path != DB and path not in _migrated:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(
+        path,
+        timeout=SQLITE_PRAGMAS["busy_timeout"] / 1000,
+        factory=profiling.ProfiledConnection if PROFILING else sqlite3.Connection
+    )
+    db.row_factory = sqlite3.Row
+    for name, value in SQLITE_PRAGMAS.items():
+        db.execute(f"PRAGMA {name}={value}")
+    if path not in _migrated:
+        with _migrate_lock:
+            if path not in _migrated:
+                migrate(db)
+                _migrated.add(path)
+    return db
+
+def _pooled_db(path):
+    # Keyed by pid so forked workers never share a parent's connection.
+    if getattr(_pool, "pid", None) != os.getpid():
+        _pool.dbs = collections.OrderedDict()
+        _pool.pid = os.getpid()
+    db = _pool.dbs.pop(path, None) or connect_db(path)
+    _pool.dbs[path] = db
+    # Close the least recently used files, except those the current context holds
+    in_use = g.get("dbs", {}) if has_app_context() else {}
+    idle = [p for p in _pool.dbs if p != path and p not in in_use]
+    for p in idle[:len(_pool.dbs) - DB_POOL_FILES]:
+        _pool.dbs.pop(p).close()
+    return db
+
+def _request_db(path):
+    dbs = g.setdefault("dbs", {})
+    if path not in dbs:
+        dbs[path] = _pooled_db(path) if DB_POOL else connect_db(path)
+    return dbs[path]
+
+def get_catalog_db():
+    """Users and where their data lives (with sharding off, all the data)."""
+    return _request_db(DB)
+
+def user_db_path(user_id):
+    return router.path(router.shard_of(get_catalog_db(), user_id))
+
+def get_user_db(user_id):
+    return _request_db(user_db_path(user_id))
 
 def get_db():
-    if "db" not in g:
-        g.db = sqlite3.connect(DB)
-        g.db.row_factory = sqlite3.Row
-    return g.db
+    """The signed-in user's data file, or the catalog outside a signed-in request."""
+    user_id = session.get("user_id") if has_request_context() else None
+    return get_catalog_db() if user_id is None else get_user_db(user_id)
+
+def connect_user_db(user_id):
+    """New connection to a user's data file, for work that outlives the request."""
+    with contextlib.closing(connect_db()) as catalog:
+        path = router.path(router.shard_of(catalog, user_id))
+    return connect_db(path)
+
+def iter_data_dbs():
+    """(shard, connection) for every file holding user data, the catalog first."""
+    catalog = get_catalog_db()
+    for shard in router.shards(catalog):
+        if shard is None:
+            yield shard, catalog
+            continue
+        with contextlib.closing(connect_db(router.path(shard))) as db:
+            yield shard, db
 
 @app.teardown_appcontext
 def close_db(e=None):
-    db = g.pop("db", None)
-    if db:
-        db.close()
+    for db in g.pop("dbs", {}).values():
+        if DB_POOL:
+            # Hand the connection back clean; an unfinished write must not
+            # leak into the next request on this thread.
+            if db.in_transaction:
+                db.rollback()
+        else:
+            db.close()
 
-def init_db():
-    db = get_db()
-    db.executescript("""
+# Schema migrations. Each step runs once, in order, and PRAGMA user_version
+# records how many have been applied. Append new steps; never edit shipped ones.
+MIGRATIONS = [
+    # 1: base schema
+    """
     CREATE TABLE IF NOT EXISTS user (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         email TEXT UNIQUE,
@@ -61,11 +187,155 @@ def init_db():
         reason TEXT,
         PRIMARY KEY(user_id, date)
     );
-    """)
-    db.commit()
+    """,
+    # 2: one entry per habit and day (keep the completed duplicate, else the oldest)
+    """
+    DELETE FROM habit_entry WHERE id IN (
+        SELECT a.id
+        FROM habit_entry a
+        JOIN habit_entry b
+          ON b.habit_id = a.habit_id AND b.date = a.date
+         AND (b.completed > a.completed OR (b.completed = a.completed AND b.id < a.id))
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_habit_entry_habit_date ON habit_entry(habit_id, date);
+    """,
+    # 3: habit lookups by user and entry scans by date range
+    """
+    CREATE INDEX IF NOT EXISTS idx_habit_user ON habit(user_id);
+    CREATE INDEX IF NOT EXISTS idx_habit_entry_date ON habit_entry(date);
+    """,
+    # 4: per-habit streak/consistency aggregates, kept current by the writers
+    """
+    CREATE TABLE IF NOT EXISTS habit_aggregate (
+        habit_id INTEGER PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0,
+        done INTEGER NOT NULL DEFAULT 0,
+        current_streak INTEGER NOT NULL DEFAULT 0,
+        longest_streak INTEGER NOT NULL DEFAULT 0,
+        as_of TEXT
+    );
+    """,
+    # 5: covering index so per-habit history scans never touch the table
+    """
+    CREATE INDEX IF NOT EXISTS idx_habit_entry_habit_date_completed
+        ON habit_entry(habit_id, date, completed);
+    """,
+    # 6: per-user data generations; cached pages are keyed by them so every
+    # worker notices writes made by the others
+    """
+    CREATE TABLE IF NOT EXISTS cache_generation (
+        user_id INTEGER,
+        scope TEXT,
+        gen INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(user_id, scope)
+    );
+    """,
+    # 7: scheduled slots are computed from frequency and created_on (see
+    # schedule.py); drop the not-completed rows that only repeated them, and
+    # the aggregates counted over them
+    """
+    DELETE FROM habit_entry
+    WHERE COALESCE(completed, 0) != 1
+      AND (
+        habit_id NOT IN (SELECT id FROM habit)
+        OR id IN (
+            SELECT he.id
+            FROM habit_entry he
+            JOIN habit h ON h.id = he.habit_id
+            WHERE h.created_on <= he.date AND (
+                h.frequency = 'daily'
+                OR (h.frequency = 'weekly' AND strftime('%w', he.date) = '6')
+                OR (h.frequency = 'monthly'
+                    AND he.date = date(he.date, 'start of month', '+1 month', '-2 days'))
+            )
+        )
+      );
+    DELETE FROM habit_aggregate;
+    """,
+    # 8: background export jobs (see export_jobs.py)
+    """
+    CREATE TABLE IF NOT EXISTS export_job (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        format TEXT NOT NULL,
+        start_date TEXT,
+        end_date TEXT,
+        status TEXT NOT NULL DEFAULT 'queued',
+        progress INTEGER NOT NULL DEFAULT 0,
+        rows INTEGER NOT NULL DEFAULT 0,
+        path TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        finished_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_export_job_user ON export_job(user_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_export_job_created ON export_job(created_at);
+    """,
+    # 9: bitset layout of recorded completions (STORAGE=bitset, see storage.py)
+    """
+    CREATE TABLE IF NOT EXISTS habit_month (
+        habit_id INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        done_mask INTEGER NOT NULL DEFAULT 0,
+        sched_mask INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(habit_id, month)
+    ) WITHOUT ROWID;
+    """,
+    # 10: per-user daily slot/completion counts (see rollup.py); built
+    # lazily per user, so existing data needs no backfill here
+    """
+    CREATE TABLE IF NOT EXISTS user_day_rollup (
+        user_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        scheduled INTEGER NOT NULL DEFAULT 0,
+        done INTEGER NOT NULL DEFAULT 0,
+        has_reason INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(user_id, date)
+    ) WITHOUT ROWID;
 
-with app.app_context():
+    CREATE TABLE IF NOT EXISTS user_rollup_state (
+        user_id INTEGER PRIMARY KEY,
+        through TEXT NOT NULL
+    );
+    """,
+    # 11: catalog of which shard file holds each user's data (see shards.py)
+    """
+    CREATE TABLE IF NOT EXISTS user_shard (
+        user_id INTEGER PRIMARY KEY,
+        shard TEXT NOT NULL
+    );
+    """,
+    # 12: the IANA time zone a user's days are counted in (NULL: DEFAULT_TIMEZONE)
+    """
+    ALTER TABLE user ADD COLUMN timezone TEXT;
+    """,
+]
+
+def migrate(db, target=None):
+    """Apply pending migrations up to `target` (default: all). Returns the new version."""
+    target = len(MIGRATIONS) if target is None else target
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    while version < target:
+        # executescript commits first; the explicit transaction makes each
+        # step and its version bump atomic.
+        db.executescript(
+            "BEGIN;\n" + MIGRATIONS[version] +
+            f"\nPRAGMA user_version = {version + 1};\nCOMMIT;"
+        )
+        version += 1
+    return version
+
+def init_db():
+    """Bring the catalog up to date. Connections do this on first use, so this
+    only moves the work to startup (create_app) or a deploy step (init-db)."""
+    with contextlib.closing(connect_db()):
+        pass
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Create or migrate the catalog database."""
     init_db()
+    click.echo(f"{DB} is at schema version {len(MIGRATIONS)}")
 
 def login_required(f):
     @wraps(f)
@@ -75,22 +345,462 @@ def login_required(f):
         return f(*args, **kwargs)
     return wrapped
 
-# Jinja filter: habit_id -> habit name
-@app.template_filter("habit_name")
-def habit_name(habit_id):
-    db = get_db()
-    h = db.execute("SELECT name FROM habit WHERE id=?", (habit_id,)).fetchone()
-    return h["name"] if h else "Unknown"
+# ---------------- Scheduling ----------------
+# Slots are computed from each habit's schedule (schedule.py); the storage
+# backend only keeps what the user recorded, and merges the two on read.
+def user_timezone():
+    """The signed-in user's time zone (kept in the session at sign-in), else
+    DEFAULT_TIMEZONE; None for the server's."""
+    tz = session.get("tz") if has_request_context() else None
+    return tz or DEFAULT_TIMEZONE
+
+def user_today():
+    """Today in user_timezone()."""
+    return local_today(user_timezone())
+
+def load_month_cells(db, user_id, month, habits):
+    """Calendar grid for `month`: leading blanks, then one dict per day.
+
+    Slots and reasons for the whole month come from two range queries and
+    are grouped by date here, so the cost does not grow with month length.
+    """
+    # calendar.monthrange => (weekday_of_first_day Mon=0..Sun=6, num_days)
+    first_weekday, num_days = calendar.monthrange(month.year, month.month)
+    month_start = month.replace(day=1).isoformat()
+    month_end = month.replace(day=num_days).isoformat()
+
+    names = {h["id"]: h["name"] for h in habits}
+    entries_by_date = {}
+    for e in store.month_slots(db, user_id, habits, month):
+        e["habit_name"] = names[e["habit_id"]]
+        entries_by_date.setdefault(e["date"], []).append(e)
+
+    reasons = {
+        r["date"]: r["reason"]
+        for r in db.execute(
+            "SELECT date, reason FROM day_reason WHERE user_id=? AND date>=? AND date<=?",
+            (user_id, month_start, month_end)
+        )
+    }
+
+    # Leading blanks (Mon=0 means no blanks; Tue=1 means 1 blank, etc.)
+    month_cells = [None] * first_weekday
+    for d in range(1, num_days + 1):
+        date = datetime.date(month.year, month.month, d)
+        iso = date.isoformat()
+        month_cells.append({
+            "date": date,
+            "entries": entries_by_date.get(iso, []),
+            "reason": reasons.get(iso) or ""
+        })
+    return month_cells
+
+# ---------------- Aggregates ----------------
+# habit_aggregate keeps each habit's figures as of a day (as_of). Rows are
+# computed from the whole history once, then kept current from bounded reads:
+# the days since as_of when the date moves on, and the stretch between the
+# nearest misses around a change when completions are written.
+AGGREGATE_FIELDS = ("total", "done", "current_streak", "longest_streak")
+AGGREGATE_STEP_DAYS = 62  # first read when looking for the misses around a change; doubles
+
+def compute_habit_aggregate(db, habit_id, today, since=None):
+    """Total/done/streak figures of one habit from its slots up to `today`
+    (from `since` on, when given, with runs starting there)."""
+    m = store.habit_metrics(db, today, habit_id=habit_id, since=since).get(habit_id)
+    return {k: m[k] if m else 0 for k in AGGREGATE_FIELDS}
+
+def save_habit_aggregate(db, habit_id, a, today):
+    db.execute("""
+        INSERT INTO habit_aggregate (habit_id,total,done,current_streak,longest_streak,as_of)
+        VALUES (?,?,?,?,?,?)
+        ON CONFLICT(habit_id) DO UPDATE SET
+            total=excluded.total,
+            done=excluded.done,
+            current_streak=excluded.current_streak,
+            longest_streak=excluded.longest_streak,
+            as_of=excluded.as_of
+    """, (habit_id, a["total"], a["done"], a["current_streak"], a["longest_streak"], today.isoformat()))
+
+def refresh_habit_aggregates(db, habit_ids, today):
+    """Recompute the stored aggregates of the given habits from their whole
+    history (new rows, imports, rebuilds; caller commits)."""
+    for hid in set(habit_ids):
+        save_habit_aggregate(db, hid, compute_habit_aggregate(db, hid, today), today)
+
+def advance_habit_aggregate(db, habit, agg, today):
+    """Carry `agg`, computed as of an earlier day, forward over the slots up to `today`."""
+    since = datetime.date.fromisoformat(agg["as_of"]) + datetime.timedelta(days=1)
+    _, completed = store.slot_arrays(db, habit, since, today)
+    for c in completed.tolist():
+        agg["total"] += 1
+        agg["done"] += c
+        agg["current_streak"] = agg["current_streak"] + 1 if c else 0
+        agg["longest_streak"] = max(agg["longest_streak"], agg["current_streak"])
+    save_habit_aggregate(db, habit["id"], agg, today)
+
+def load_habit_aggregates(db, habits, today):
+    """{habit_id: aggregate} for `habits` (rows with id, frequency and
+    created_on), bringing rows missing or computed on another day up to date.
+
+    The current streak depends on the date, so rows move forward once per
+    day even when nothing was written.
+    """
+    ids = [h["id"] for h in habits]
+    if not ids:
+        return {}
+    marks = ",".join("?" * len(ids))
+    aggs = {
+        r["habit_id"]: dict(r)
+        for r in db.execute(f"SELECT * FROM habit_aggregate WHERE habit_id IN ({marks})", ids)
+    }
+    stale = [h for h in habits if h["id"] not in aggs or aggs[h["id"]]["as_of"] != today.isoformat()]
+    if stale:
+        for h in stale:
+            a = aggs.get(h["id"])
+            if a is not None and a["as_of"] < today.isoformat():
+                advance_habit_aggregate(db, h, a, today)
+            else:  # new, or ahead of a user who moved to an earlier time zone
+                refresh_habit_aggregates(db, [h["id"]], today)
+        db.commit()
+        for h in stale:
+            aggs[h["id"]] = dict(db.execute(
+                "SELECT * FROM habit_aggregate WHERE habit_id=?", (h["id"],)
+            ).fetchone())
+    return aggs
+
+def _miss_before(db, habit, date):
+    """The last day before `date` with a missed slot (None: all completed)."""
+    created = datetime.date.fromisoformat(habit["created_on"]) if habit["created_on"] else None
+    until, step = date - datetime.timedelta(days=1), AGGREGATE_STEP_DAYS
+    while True:
+        since = until - datetime.timedelta(days=step)
+        if created is None or since < created:
+            since = None  # the rest, with anything recorded before created_on
+        days, completed = store.slot_arrays(db, habit, since, until)
+        misses = np.flatnonzero(completed == 0)
+        if misses.size:
+            return datetime.date.fromordinal(int(days[misses[-1]]))
+        if since is None:
+            return None
+        until, step = since - datetime.timedelta(days=1), step * 2
+
+def _miss_after(db, habit, date, today):
+    """The first day after `date`, up to `today`, with a missed slot (or None)."""
+    since, step = date + datetime.timedelta(days=1), AGGREGATE_STEP_DAYS
+    while since <= today:
+        until = min(since + datetime.timedelta(days=step), today)
+        days, completed = store.slot_arrays(db, habit, since, until)
+        misses = np.flatnonzero(completed == 0)
+        if misses.size:
+            return datetime.date.fromordinal(int(days[misses[0]]))
+        since, step = until + datetime.timedelta(days=1), step * 2
+    return None
+
+def aggregate_windows(db, habits, keys, today):
+    """Before writing `keys` ((habit_id, iso_date)): per habit, the stretch
+    bounded by the misses around its changed days up to `today`, and the
+    figures of that stretch. No run crosses those misses, so the change only
+    shows inside it."""
+    dates = {}
+    for hid, iso in keys:
+        if iso <= today.isoformat():
+            dates.setdefault(hid, []).append(datetime.date.fromisoformat(iso))
+    load_habit_aggregates(db, [habits[hid] for hid in dates], today)
+    windows = {}
+    for hid, ds in dates.items():
+        before = _miss_before(db, habits[hid], min(ds))
+        after = _miss_after(db, habits[hid], max(ds), today)
+        since = before + datetime.timedelta(days=1) if before else None
+        until = after - datetime.timedelta(days=1) if after else today
+        windows[hid] = (since, until, compute_habit_aggregate(db, hid, until, since))
+    return windows
+
+def apply_aggregate_windows(db, windows, today):
+    """After the write: update each stored aggregate by what changed in its window."""
+    for hid, (since, until, old) in windows.items():
+        new = compute_habit_aggregate(db, hid, until, since)
+        a = dict(db.execute("SELECT * FROM habit_aggregate WHERE habit_id=?", (hid,)).fetchone())
+        if new["longest_streak"] < a["longest_streak"] == old["longest_streak"]:
+            # The longest run was in the window and got shorter; the next
+            # longest may be anywhere.
+            refresh_habit_aggregates(db, [hid], today)
+            continue
+        a["total"] += new["total"] - old["total"]
+        a["done"] += new["done"] - old["done"]
+        a["longest_streak"] = max(a["longest_streak"], new["longest_streak"])
+        if until == today:
+            a["current_streak"] = new["current_streak"]
+        save_habit_aggregate(db, hid, a, today)
+
+@app.cli.command("rebuild-aggregates")
+@click.option("--check", is_flag=True, help="Only report habits whose stored aggregates are wrong.")
+def rebuild_aggregates_command(check):
+    """Recompute every habit's aggregates from the recorded completions."""
+    today = user_today()
+    checked = bad = 0
+    for shard, db in iter_data_dbs():
+        habit_ids = [r["id"] for r in db.execute("SELECT id FROM habit")]
+        checked += len(habit_ids)
+
+        if check:
+            metrics = store.habit_metrics(db, today)  # one pass over every entry
+            for hid in habit_ids:
+                row = db.execute("SELECT * FROM habit_aggregate WHERE habit_id=?", (hid,)).fetchone()
+                if row is None or row["as_of"] != today.isoformat():
+                    continue  # refreshed lazily on next read
+                m = metrics.get(hid)
+                expected = {k: m[k] if m else 0 for k in AGGREGATE_FIELDS}
+                stored = {k: row[k] for k in AGGREGATE_FIELDS}
+                if stored != expected:
+                    bad += 1
+                    where = f"{shard} " if shard else ""
+                    click.echo(f"{where}habit {hid}: stored {stored} != expected {expected}")
+            continue
+
+        db.execute("DELETE FROM habit_aggregate")
+        refresh_habit_aggregates(db, habit_ids, today)
+        db.commit()
+
+    if check:
+        click.echo(f"{checked} habits checked, {bad} mismatched")
+        if bad:
+            raise SystemExit(1)
+        return
+    click.echo(f"Rebuilt aggregates for {checked} habits")
+
+@app.cli.command("convert-storage")
+@click.argument("target", type=click.Choice(sorted(storage.BACKENDS)))
+def convert_storage_command(target):
+    """Copy recorded completions into the TARGET layout (then set STORAGE=TARGET)."""
+    n = 0
+    for _, db in iter_data_dbs():
+        n += storage.convert(db, target)
+        db.execute("DELETE FROM habit_aggregate")  # recomputed lazily from the new layout
+        db.commit()
+    click.echo(f"Wrote {n} {target} rows; start the app with STORAGE={target}")
+
+@app.cli.command("rebalance-shards")
+@click.option("--dry-run", is_flag=True, help="Only list the users that would move.")
+def rebalance_shards_command(dry_run):
+    """Move users whose data is not where SHARD_COUNT / SHARD_PER_USER place it.
+
+    Workers remember where each user lives, so run this with the app stopped.
+    Each user is copied, remapped, then deleted from the old file; running it
+    again after an interruption finishes the job.
+    """
+    catalog = get_catalog_db()
+    moves = [
+        (r["id"], router.shard_of(catalog, r["id"]), router.target(r["id"]))
+        for r in catalog.execute("SELECT id FROM user ORDER BY id")
+    ]
+    moves = [m for m in moves if m[1] != m[2]]
+    for user_id, src, dst in moves:
+        click.echo(f"user {user_id}: {src or 'catalog'} -> {dst or 'catalog'}")
+        if dry_run:
+            continue
+        with contextlib.ExitStack() as stack:
+            src_db, dst_db = (
+                catalog if shard is None else stack.enter_context(contextlib.closing(connect_db(router.path(shard))))
+                for shard in (src, dst)
+            )
+            n = shards.move_user(src_db, dst_db, user_id)
+            dst_db.commit()
+            router.set_shard(catalog, user_id, dst)
+            catalog.commit()
+            shards.delete_user_data(src_db, user_id)
+            src_db.commit()
+        click.echo(f"  moved {n} rows")
+
+    # Leftovers of a move that stopped between remapping and deleting
+    strays = 0
+    if not dry_run:
+        for shard, db in iter_data_dbs():
+            for user_id in shards.stored_users(db) - set(router.users(catalog, shard)):
+                shards.delete_user_data(db, user_id)
+                strays += 1
+            db.commit()
+    click.echo(f"{len(moves)} users {'to move' if dry_run else 'moved'}, {strays} stray copies removed")
+
+# ---------------- Daily rollups ----------------
+# user_day_rollup holds each user's per-day slot and completion counts (see
+# rollup.py). Rows reach to the end of the current month, extended on read.
+def rollup_horizon(today):
+    return (today.replace(day=1) + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+
+def ensure_rollup(db, user_id, today):
+    """Make the user's rollup rows current through rollup_horizon(today)."""
+    if rollup.ensure(db, store, user_id, rollup_horizon(today)):
+        db.commit()
+
+def rollup_pct(db, user_id, start, end):
+    scheduled, done = rollup.totals(db, user_id, start, end)
+    return int((done / scheduled) * 100) if scheduled else 0
+
+@app.cli.command("rebuild-rollups")
+@click.option("--check", is_flag=True, help="Only report days whose stored rollups are wrong.")
+def rebuild_rollups_command(check):
+    """Recompute every user's daily rollups from the recorded completions."""
+    today = user_today()
+    users = bad = 0
+    for shard, db in iter_data_dbs():
+        for user_id in router.users(get_catalog_db(), shard):
+            users += 1
+            if check:
+                for iso, stored, expected in rollup.check(db, store, user_id):
+                    bad += 1
+                    click.echo(f"user {user_id} {iso}: stored {stored} != expected {expected}")
+                continue
+            rollup.reset(db, user_id)
+            rollup.ensure(db, store, user_id, rollup_horizon(today))
+            db.commit()
+
+    if check:
+        click.echo(f"{users} users checked, {bad} mismatched days")
+        if bad:
+            raise SystemExit(1)
+        return
+    click.echo(f"Rebuilt rollups for {users} users")
+
+# ---------------- Page cache ----------------
+# Computed home/analytics data per user and month. Keys carry the data
+# generations from cache_generation, which writers bump in their transaction.
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "1") != "0"
+stats_cache = StatsCache(
+    max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", "1024")),
+    max_bytes=int(os.environ.get("CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    ttl=int(os.environ.get("CACHE_TTL", "300")),
+)
+
+def month_scope(date):
+    return date.strftime("%Y-%m")
+
+def cache_generations(db, user_id):
+    return {
+        r["scope"]: r["gen"]
+        for r in db.execute("SELECT scope, gen FROM cache_generation WHERE user_id=?", (user_id,))
+    }
+
+def invalidate_user_cache(db, user_id, scopes):
+    """Mark `scopes` ("YYYY-MM" months or "habits") of a user as changed (caller commits)."""
+    scopes = set(scopes)
+    db.executemany("""
+        INSERT INTO cache_generation (user_id,scope,gen) VALUES (?,?,1)
+        ON CONFLICT(user_id,scope) DO UPDATE SET gen=gen+1
+    """, [(user_id, s) for s in scopes])
+    stats_cache.invalidate(user_id, scopes)
+
+def cached_view(key, user_id, scopes, build):
+    if not CACHE_ENABLED:
+        return build()
+    view = stats_cache.get(key)
+    if view is None:
+        view = build()
+        stats_cache.put(key, view, user_id, scopes)
+    return view
+
+def admin_required(f):
+    @wraps(f)
+    def wrapped(*args, **kwargs):
+        admin = os.environ.get("ADMIN_EMAIL", "").strip().lower()
+        if not admin or session.get("user_email") != admin:
+            return jsonify(success=False), 403
+        return f(*args, **kwargs)
+    return wrapped
+
+@app.route("/admin/cache_stats")
+@admin_required
+def cache_stats():
+    return jsonify(stats_cache.stats())
+
+# ---------------- Profiling ----------------
+route_metrics = profiling.RouteMetrics()
+
+# Hooks are only registered when profiling is on, so it costs nothing otherwise.
+if PROFILING:
+    @app.before_request
+    def start_profile():
+        g.profile_started = time.perf_counter()
+        profiling.begin_request()
+
+    @app.after_request
+    def finish_profile(response):
+        stats = profiling.end_request()
+        started = g.pop("profile_started", None)
+        if started is None:
+            return response
+        wall_ms = (time.perf_counter() - started) * 1000
+        rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+        route_metrics.record(f"{request.method} {rule}", wall_ms, stats)
+        if PROFILING_SERVER_TIMING and stats is not None:
+            response.headers.add(
+                "Server-Timing",
+                f'db;dur={stats.sql_ms:.1f};desc="{stats.queries} queries, {stats.rows} rows", '
+                f"app;dur={wall_ms:.1f}"
+            )
+        return response
+
+def admin_metrics_data():
+    return {
+        "profiling": PROFILING,
+        "routes": route_metrics.snapshot(),
+        "cache": stats_cache.stats(),
+    }
+
+@app.route("/admin")
+@admin_required
+def admin():
+    return render_template("admin.html", metrics=admin_metrics_data())
+
+@app.route("/admin/metrics", methods=["GET", "DELETE"])
+@admin_required
+def admin_metrics():
+    if request.method == "DELETE":
+        route_metrics.reset()
+        return jsonify(success=True)
+    return jsonify(admin_metrics_data())
 
 # ---------------- Auth ----------------
-@app.route("/", methods=["GET", "POST"])
+# Hashing runs in PASSWORD_HASH_WORKERS processes (0: on the request thread);
+# sign-ins beyond PASSWORD_HASH_MAX_PENDING waiting hashes get a 503. Changing
+# PASSWORD_HASH_METHOD rehashes each password at its next sign-in.
+hasher = PasswordHasher(
+    method=os.environ.get("PASSWORD_HASH_METHOD", "scrypt"),
+    workers=int(os.environ.get("PASSWORD_HASH_WORKERS", "2")),
+    max_pending=int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "32")),
+)
 
+BUSY_ERROR = "Too many sign-ins right now, please try again in a moment"
 
 @app.route("/register", methods=["GET", "POST"])
 @limiter.limit("10/hour")
 def register():
     if request.method == "POST":
-        email = request.form.get("ema@app.route("/login", methods=["GET", "POST"])
+        email = request.form.get("email", "").strip().lower()
+        password = request.form.get("password", "")
+        if not email or not password:
+            return render_template("register.html", error="Email and password required")
+
+        try:
+            hashed = hasher.hash(password)
+        except HashingBusy:
+            return render_template("register.html", error=BUSY_ERROR), 503
+
+        db = get_catalog_db()
+        try:
+            cur = db.execute(
+                "INSERT INTO user (email, password) VALUES (?,?)",
+                (email, hashed)
+            )
+            router.assign(db, cur.lastrowid)
+            db.commit()
+            return redirect("/login")
+        except sqlite3.IntegrityError:
+            return render_template("register.html", error="Email already registered")
+
+    return render_template("register.html")
+
+@app.route("/", methods=["GET", "POST"])
+@app.route("/login", methods=["GET", "POST"])
 @limiter.limit("20/hour")
 def login():
     # ✅ If already logged in, don't show login page (and thus no sidebar confusion)
@@ -104,35 +814,35 @@ def login():
         if not email or not password:
             return render_template("login.html", error="Email and password required")
 
-        db = get_db()
+        db = get_catalog_db()
         user = db.execute("SELECT * FROM user WHERE email=?", (email,)).fetchone()
 
-        if user and check_password_hash(user["password"], password):
+        try:
+            valid = user is not None and hasher.verify(user["password"], password)
+        except HashingBusy:
+            return render_template("login.html", error=BUSY_ERROR), 503
+
+        if valid:
+            with contextlib.suppress(HashingBusy, TimeoutError):  # otherwise at the next sign-in
+                if hasher.needs_rehash(user["password"]):
+                    db.execute("UPDATE user SET password=? WHERE id=?", (hasher.hash(password), user["id"]))
+                    db.commit()
+            # The login form reports the browser's zone; keep the last valid one
+            tz = request.form.get("timezone", "").strip()
+            if zone(tz) is not None and tz != user["timezone"]:
+                db.execute("UPDATE user SET timezone=? WHERE id=?", (tz, user["id"]))
+                db.commit()
+            elif zone(tz) is None:
+                tz = user["timezone"]
             session.clear()  # ✅ clears any stale session keys
             session["user_id"] = user["id"]
             session["user_email"] = user["email"]
+            session["tz"] = tz
             return redirect("/home")
 
         return render_template("login.html", error="Invalid credentials")
 
     return render_template("login.html")
-il", "").strip().lower()
-        password = request.form.get("password", "")
-        if not email or not password:
-            return render_template("register.html", error="Email and password required")
-
-        db = get_db()
-        try:
-            db.execute(
-                "INSERT INTO user (email, password) VALUES (?,?)",
-                (email, generate_password_hash(password))
-            )
-            db.commit()
-            return redirect("/login")
-        except sqlite3.IntegrityError:
-            return render_template("register.html", error="Email already registered")
-
-    return render_template("register.html")
 
 @app.route("/logout")
 def logout():
@@ -140,20 +850,111 @@ def logout():
     return redirect("/login")
 
 # ---------------- Home ----------------
+def build_home_view(db, user_id, habits, current_month):
+    """Month grid, per-habit month stats and overall percentages for home().
+
+    Everything here depends only on the habits and the stored data of the
+    viewed and previous month, so the result is cached by their generations.
+    The viewed month's figures come from its grid; the previous month's
+    percentage from the daily rollups.
+    """
+    month_cells = load_month_cells(db, user_id, current_month, habits)
+
+    # ---- Per-habit: consistency % for the viewed month ----
+    month_counts = {}
+    for cell in month_cells:
+        for e in (cell["entries"] if cell else []):
+            c = month_counts.setdefault(e["habit_id"], [0, 0])
+            c[0] += 1
+            c[1] += e["completed"] == 1
+
+    habit_stats = []
+    for h in habits:
+        # Month consistency (viewed month)
+        m_total, m_done = month_counts.get(h["id"], (0, 0))
+        m_consistency = int((m_done / m_total) * 100) if m_total else 0
+
+        # Simple status bucket for icon
+        if m_total == 0:
+            vibe = "🌱"   # no scheduled days this month
+        elif m_consistency >= 85:
+            vibe = "🔥"
+        elif m_consistency >= 60:
+            vibe = "✨"
+        else:
+            vibe = "🧠"
+
+        habit_stats.append({
+            "id": h["id"],
+            "name": h["name"],
+            "frequency": h["frequency"],
+            "m_total": m_total,
+            "m_done": m_done,
+            "m_consistency": m_consistency,
+            "vibe": vibe
+        })
+
+    # Overall consistency for viewed month and previous month (2 numbers, no charts)
+    this_total = sum(t for t, _ in month_counts.values())
+    this_done = sum(d for _, d in month_counts.values())
+    this_pct = int((this_done / this_total) * 100) if this_total else 0
+
+    prev_month_last = current_month - datetime.timedelta(days=1)
+    prev_month_first = prev_month_last.replace(day=1)
+    today = user_today()
+    if prev_month_last <= rollup_horizon(today):
+        ensure_rollup(db, user_id, today)
+        last_pct = rollup_pct(db, user_id, prev_month_first, prev_month_last)
+    else:
+        # Months past the rollup horizon have no completions worth storing yet
+        last_slots = store.month_slots(db, user_id, habits, prev_month_first)
+        last_total = len(last_slots)
+        last_done = sum(1 for e in last_slots if e["completed"] == 1)
+        last_pct = int((last_done / last_total) * 100) if last_total else 0
+
+    return {
+        "month_cells": month_cells,
+        "habit_stats": habit_stats,
+        "this_pct": this_pct,
+        "last_pct": last_pct,
+    }
+
+def parse_month(value):
+    """First day of a "YYYY-MM" month; ValueError if malformed or at the ends
+    of the calendar (pages also show the neighbouring months)."""
+    year, month = map(int, value.split("-"))
+    if not 1 < year < datetime.MAXYEAR:
+        raise ValueError(f"year out of range: {year}")
+    return datetime.date(year, month, 1)
+
+def home_scopes(current_month):
+    prev_month = (current_month - datetime.timedelta(days=1)).replace(day=1)
+    return (month_scope(current_month), month_scope(prev_month), "habits")
+
+def load_home_view(db, user_id, habits, current_month, gens):
+    scopes = home_scopes(current_month)
+    return cached_view(
+        ("home", user_id) + scopes + tuple(gens.get(s, 0) for s in scopes),
+        user_id, scopes,
+        lambda: build_home_view(db, user_id, habits, current_month)
+    )
+
+def habit_stats_with_streaks(db, view, habits, today):
+    # Streaks move with the date, so they come from the aggregates, not the cache
+    aggs = load_habit_aggregates(db, habits, today)
+    return [dict(s, streak=aggs[s["id"]]["current_streak"]) for s in view["habit_stats"]]
+
 @app.route("/home", methods=["GET", "POST"])
 @login_required
 def home():
     db = get_db()
     user_id = session["user_id"]
-    today = datetime.date.today()
+    today = user_today()
 
     # Month navigation
-    month_param = request.args.get("month")
-    if month_param:
-        year, month = map(int, month_param.split("-"))
-        current_month = datetime.date(year, month, 1)
-    else:
-        current_month = today.replace(day=1)
+    current_month = today.replace(day=1)
+    with contextlib.suppress(ValueError):  # malformed ?month= shows this month
+        current_month = parse_month(request.args.get("month") or "")
 
     prev_month = (current_month - datetime.timedelta(days=1)).replace(day=1)
     next_month = (current_month + datetime.timedelta(days=32)).replace(day=1)
@@ -171,43 +972,23 @@ def home():
                     (user_id, name, freq, today.isoformat())
                 )
                 habit_id = db.execute("SELECT last_insert_rowid()").fetchone()[0]
-
-                # create entries only from today onward in the current view month (no backfill)
-                month_last = calendar.monthrange(current_month.year, current_month.month)[1]
-                start_day = 1
-
-                if current_month.year == today.year and current_month.month == today.month:
-                    start_day = today.day
-                elif current_month < today.replace(day=1):
-                    start_day = month_last + 1  # don't create in past month view
-
-                for d in range(start_day, month_last + 1):
-                    date = datetime.date(current_month.year, current_month.month, d)
-                    if date < today:
-                        continue
-
-                    should_exist = (
-                        freq == "daily" or
-                        (freq == "weekly" and date.weekday() == 5) or
-                        (freq == "monthly" and d == month_last - 1)
-                    )
-                    if should_exist:
-                        db.execute(
-                            "INSERT INTO habit_entry (habit_id,date) VALUES (?,?)",
-                            (habit_id, date.isoformat())
-                        )
+                # No entries to create: slots are scheduled from created_on (no backfill)
+                refresh_habit_aggregates(db, [habit_id], today)
+                rollup.refresh_from(db, store, user_id, today)
+                invalidate_user_cache(db, user_id, ["habits"])
 
         elif action == "remove":
             hid = request.form.get("habit_id")
             if hid:
-                db.execute(
-                    "DELETE FROM habit_entry WHERE habit_id=? AND date>=?",
-                    (hid, today.isoformat())
-                )
-                db.execute(
+                deleted = db.execute(
                     "DELETE FROM habit WHERE id=? AND user_id=?",
                     (hid, user_id)
-                )
+                ).rowcount
+                if deleted:
+                    store.delete_from(db, int(hid), today)
+                    db.execute("DELETE FROM habit_aggregate WHERE habit_id=?", (hid,))
+                    rollup.reset(db, user_id)  # its past slots are gone too
+                    invalidate_user_cache(db, user_id, ["habits"])
 
         db.commit()
         return redirect(request.url)
@@ -218,190 +999,256 @@ def home():
         (user_id,)
     ).fetchall()
 
-    # Ensure future entries exist for this month (never create past entries)
-    month_last = calendar.monthrange(current_month.year, current_month.month)[1]
-    for d in range(1, month_last + 1):
-        date = datetime.date(current_month.year, current_month.month, d)
-
-        if date >= today:
-            for h in habits:
-                should_exist = (
-                    h["frequency"] == "daily" or
-                    (h["frequency"] == "weekly" and date.weekday() == 5) or
-                    (h["frequency"] == "monthly" and d == month_last - 1)
-                )
-                if should_exist:
-                    existing = db.execute(
-                        "SELECT 1 FROM habit_entry WHERE habit_id=? AND date=?",
-                        (h["id"], date.isoformat())
-                    ).fetchone()
-                    if not existing:
-                        db.execute(
-                            "INSERT INTO habit_entry (habit_id,date) VALUES (?,?)",
-                            (h["id"], date.isoformat())
-                        )
-            db.commit()
-
-    # Build real calendar grid: Mon..Sun headers + leading blanks
-    # calendar.monthrange => (weekday_of_first_day Mon=0..Sun=6, num_days)
-    first_weekday, num_days = calendar.monthrange(current_month.year, current_month.month)
-
-    month_cells = []
-    # Add leading blanks (Mon=0 means no blanks; Tue=1 means 1 blank, etc.)
-    for _ in range(first_weekday):
-        month_cells.append(None)
-
-    # Add day objects
-    for d in range(1, num_days + 1):
-        date = datetime.date(current_month.year, current_month.month, d)
-
-        entries = db.execute("""
-            SELECT * FROM habit_entry
-            WHERE date=? AND habit_id IN (SELECT id FROM habit WHERE user_id=?)
-            ORDER BY habit_id ASC
-        """, (date.isoformat(), user_id)).fetchall()
-
-        reason_row = db.execute(
-            "SELECT reason FROM day_reason WHERE user_id=? AND date=?",
-            (user_id, date.isoformat())
-        ).fetchone()
-
-        month_cells.append({
-            "date": date,
-            "entries": entries,
-            "reason": reason_row["reason"] if reason_row else ""
-        })
-
-    # ---- Per-habit current streak (show on Home) ----
-       # ---- Per-habit: current streak + consistency % for the viewed month ----
-    habit_stats = []
-
-    month_start = current_month.isoformat()
-    month_end = datetime.date(
-        current_month.year,
-        current_month.month,
-        calendar.monthrange(current_month.year, current_month.month)[1]
-    ).isoformat()
-
-    for h in habits:
-        # All entries for the habit (for streak calc)
-        rows_all = db.execute(
-            "SELECT date, completed FROM habit_entry WHERE habit_id=? ORDER BY date ASC",
-            (h["id"],)
-        ).fetchall()
-
-        # Current streak (ending at latest <= today)
-        current_streak = 0
-        for r in reversed(rows_all):
-            d = datetime.date.fromisoformat(r["date"])
-            if d > today:
-                continue
-            if r["completed"] == 1:
-                current_streak += 1
-            else:
-                break
-
-        # Month consistency (viewed month)
-        rows_month = db.execute("""
-            SELECT completed
-            FROM habit_entry
-            WHERE habit_id=? AND date>=? AND date<=?
-        """, (h["id"], month_start, month_end)).fetchall()
-
-        m_total = len(rows_month)
-        m_done = sum(1 for r in rows_month if r["completed"] == 1)
-        m_consistency = int((m_done / m_total) * 100) if m_total else 0
-
-        # Simple status bucket for icon
-        if m_total == 0:
-            vibe = "🌱"   # no scheduled days this month
-        elif m_consistency >= 85:
-            vibe = "🔥"
-        elif m_consistency >= 60:
-            vibe = "✨"
-        else:
-            vibe = "🧠"
-
-        habit_stats.append({
-            "name": h["name"],
-            "frequency": h["frequency"],
-            "streak": current_streak,
-            "m_total": m_total,
-            "m_done": m_done,
-            "m_consistency": m_consistency,
-            "vibe": vibe
-        })
-        
-    def month_range(d: datetime.date):
-        first = d.replace(day=1)
-        last_day = calendar.monthrange(d.year, d.month)[1]
-        last = d.replace(day=last_day)
-        return first.isoformat(), last.isoformat()
-
-    # Overall consistency for viewed month and previous month (2 numbers, no charts)
-    this_start, this_end = month_range(current_month)
-    prev_month_first = (current_month - datetime.timedelta(days=1)).replace(day=1)
-    last_start, last_end = month_range(prev_month_first)
-
-    this_rows = db.execute("""
-        SELECT he.completed
-        FROM habit_entry he
-        JOIN habit h ON h.id = he.habit_id
-        WHERE h.user_id=? AND he.date>=? AND he.date<=?
-    """, (user_id, this_start, this_end)).fetchall()
-
-    last_rows = db.execute("""
-        SELECT he.completed
-        FROM habit_entry he
-        JOIN habit h ON h.id = he.habit_id
-        WHERE h.user_id=? AND he.date>=? AND he.date<=?
-    """, (user_id, last_start, last_end)).fetchall()
-
-    this_total = len(this_rows)
-    this_done = sum(1 for r in this_rows if r["completed"] == 1)
-    this_pct = int((this_done / this_total) * 100) if this_total else 0
-
-    last_total = len(last_rows)
-    last_done = sum(1 for r in last_rows if r["completed"] == 1)
-    last_pct = int((last_done / last_total) * 100) if last_total else 0
-
+    view = load_home_view(db, user_id, habits, current_month, cache_generations(db, user_id))
+    habit_stats = habit_stats_with_streaks(db, view, habits, today)
 
     return render_template(
         "home.html",
         habits=habits,
-       habit_stats=habit_stats,
-        month_cells=month_cells,
+        habit_stats=habit_stats,
+        month_cells=view["month_cells"],
         today=today,
         current_month=current_month,
         prev_month=prev_month,
         next_month=next_month,
-        this_pct=this_pct,
-        last_pct=last_pct,
-
+        this_pct=view["this_pct"],
+        last_pct=view["last_pct"],
     )
 
 
+# ---------------- Home API ----------------
+# The three parts of the home page as JSON, so the page can refetch only the
+# part that changed (the stats after a toggle, say). ETags are derived from
+# the cache generations, so an unchanged part costs one small query and a 304.
+HOME_API_VERSION = 1
+HOME_PARTS = ("grid", "stats", "summary")
+
+def home_etag(user_id, part, current_month, gens, today):
+    key = [HOME_API_VERSION, store.name, user_id, part, month_scope(current_month)]
+    if part == "stats":
+        # Streaks count back across months and roll over at midnight
+        key += [today.isoformat(), sorted(gens.items())]
+    else:
+        key += [gens.get(s, 0) for s in home_scopes(current_month)]
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+def home_part_json(part, view, habit_stats, current_month):
+    month = month_scope(current_month)
+    if part == "grid":
+        return {
+            "month": month,
+            "first_weekday": sum(1 for c in view["month_cells"] if c is None),
+            "days": [
+                {
+                    "date": c["date"].isoformat(),
+                    "reason": c["reason"],
+                    "entries": [
+                        {"habit_id": e["habit_id"], "habit_name": e["habit_name"], "completed": e["completed"]}
+                        for e in c["entries"]
+                    ],
+                }
+                for c in view["month_cells"] if c is not None
+            ],
+        }
+    if part == "stats":
+        return {"month": month, "habits": habit_stats}
+    return {"month": month, "this_pct": view["this_pct"], "last_pct": view["last_pct"]}
+
+@app.route("/api/home/<month>/<part>")
+@limiter.limit("600 per hour")  # refetched after every batch of toggles; mostly 304s
+@login_required
+def home_api(month, part):
+    """One part of the home page for `month` ("YYYY-MM"), with If-None-Match support."""
+    if part not in HOME_PARTS:
+        return jsonify(error="unknown part"), 404
+    try:
+        current_month = parse_month(month)
+    except ValueError:
+        return jsonify(error="month must be YYYY-MM"), 400
+
+    db = get_db()
+    user_id = session["user_id"]
+    today = user_today()
+    gens = cache_generations(db, user_id)
+    etag = home_etag(user_id, part, current_month, gens, today)
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        habits = db.execute(
+            "SELECT * FROM habit WHERE user_id=? ORDER BY id DESC",
+            (user_id,)
+        ).fetchall()
+        view = load_home_view(db, user_id, habits, current_month, gens)
+        habit_stats = habit_stats_with_streaks(db, view, habits, today) if part == "stats" else None
+        resp = jsonify(home_part_json(part, view, habit_stats, current_month))
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+# ---------------- History API ----------------
+# Slots and reasons over a date range, a page of whole days at a time. The
+# cursor carries the range, the habit filter and the last day served, signed
+# so a client can only hand back what it was given.
+history_cursors = URLSafeSerializer(app.secret_key, salt="history-cursor")
+
+def history_day_json(iso, slots, reason):
+    return {
+        "date": iso,
+        "reason": reason,
+        "slots": [
+            {"habit_id": h["id"], "habit": h["name"], "completed": completed == 1}
+            for h, completed in slots
+        ],
+    }
+
+@app.route("/api/history")
+@limiter.limit("600 per hour")
+@login_required
+def history_api():
+    """GET ?start=&end=YYYY-MM-DD&habit_id=&limit=, then ?cursor=<next_cursor>."""
+    db = get_db()
+    user_id = session["user_id"]
+    limit = min(max(request.args.get("limit", history.PAGE_SIZE, type=int), 1), history.MAX_PAGE_SIZE)
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            c = history_cursors.loads(cursor)
+        except BadSignature:
+            return jsonify(error="invalid cursor"), 400
+        if c.get("u") != user_id:
+            return jsonify(error="invalid cursor"), 400
+        start, end, habit_id, after = c["s"], c["e"], c["h"], c["a"]
+    else:
+        try:
+            start = _parse_export_date(request.args.get("start"))
+            end = _parse_export_date(request.args.get("end"))
+        except ValueError:
+            return jsonify(error="dates must be YYYY-MM-DD"), 400
+        habit_id = request.args.get("habit_id", type=int)
+        start, end = export_range(db, user_id, start, end)
+        after = None
+
+    habits = history.load_habits(db, user_id, habit_id)
+    if habit_id is not None and not habits:
+        return jsonify(error="unknown habit"), 404
+    days, last = history.page(
+        db, store, user_id, habits, start, end, after, limit, reason_days=habit_id is None
+    )
+    next_cursor = None
+    if last is not None:
+        next_cursor = history_cursors.dumps({"u": user_id, "s": start, "e": end, "h": habit_id, "a": last})
+    return jsonify(
+        start=start, end=end, habit_id=habit_id,
+        days=[history_day_json(*d) for d in days],
+        next_cursor=next_cursor,
+    )
+
 # ---------------- AJAX ----------------
+MAX_COMPLETION_BATCH = 500
+
+def completion_slot(db, user_id, change):
+    """(habit_id, iso_date) a change refers to, by {habit_id, date} or a stored {entry_id}.
+
+    Returns None for an entry id the user does not own (or any entry id when
+    the storage backend has none); raises KeyError, TypeError or ValueError
+    for malformed input.
+    """
+    if change.get("entry_id") is not None:
+        return store.entry_slot(db, user_id, int(change["entry_id"]))
+    return int(change["habit_id"]), datetime.date.fromisoformat(change["date"]).isoformat()
+
+def apply_completion_changes(db, user_id, changes):
+    """Record completions for the user's own habit slots in one transaction.
+
+    `changes` maps (habit_id, iso_date) -> 0/1. Completions are recorded.
+    Clearing one forgets it when the day is on the habit's schedule (the
+    computed slot already means "not done") and records an explicit miss
+    otherwise. Other users' habits and days that are neither scheduled nor
+    recorded are skipped. Returns the (habit_id, date) keys that were applied.
+    """
+    if not changes:
+        return []
+    habit_ids = sorted({hid for hid, _ in changes})
+    habits = {
+        r["id"]: r
+        for r in db.execute(f"""
+            SELECT id, frequency, created_on FROM habit
+            WHERE user_id=? AND id IN ({",".join("?" * len(habit_ids))})
+        """, [user_id, *habit_ids])
+    }
+    recorded = store.recorded(db, list(habits), sorted({d for hid, d in changes if hid in habits}))
+
+    done, missed, cleared = [], [], []
+    for (hid, iso), completed in changes.items():
+        h = habits.get(hid)
+        if h is None:
+            continue
+        scheduled = is_slot(h, datetime.date.fromisoformat(iso))
+        if not scheduled and (hid, iso) not in recorded:
+            continue
+        (done if completed else missed if not scheduled else cleared).append((hid, iso))
+    applied = done + missed + cleared
+    today = user_today()
+    windows = aggregate_windows(db, habits, applied, today)
+    store.write(db, habits, done, missed, cleared)
+
+    apply_aggregate_windows(db, windows, today)
+    rollup.refresh(db, store, user_id, {iso for _, iso in applied})
+    invalidate_user_cache(db, user_id, {iso[:7] for _, iso in applied})
+    db.commit()
+    return applied
+
 @app.route("/update_completion", methods=["POST"])
 @login_required
 def update_completion():
-    data = request.get_json()
-    entry_id = data.get("entry_id")
-    completed = data.get("completed")
-    if entry_id is None:
-        return jsonify(success=False), 400
+    """Set one slot, given as {habit_id, date, completed} (or {entry_id, completed})."""
+    data = request.get_json(silent=True) or {}
     db = get_db()
-    db.execute("UPDATE habit_entry SET completed=? WHERE id=?", (completed, entry_id))
-    db.commit()
+    user_id = session["user_id"]
+    try:
+        slot = completion_slot(db, user_id, data)
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify(success=False), 400
+    if slot is None or not apply_completion_changes(db, user_id, {slot: 1 if data.get("completed") else 0}):
+        return jsonify(success=False), 404
     return jsonify(success=True)
 
+@app.route("/update_completions", methods=["POST"])
+@login_required
+def update_completions():
+    """Apply a batch of {habit_id, date, completed} toggles; later duplicates win."""
+    data = request.get_json(silent=True) or {}
+    changes = data.get("changes")
+    if not isinstance(changes, list) or len(changes) > MAX_COMPLETION_BATCH:
+        return jsonify(success=False), 400
+
+    db = get_db()
+    user_id = session["user_id"]
+    merged, skipped = {}, []
+    try:
+        for c in changes:
+            slot = completion_slot(db, user_id, c)
+            if slot is None:
+                skipped.append({"entry_id": int(c["entry_id"])})
+                continue
+            merged[slot] = 1 if c.get("completed") else 0
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify(success=False), 400
+
+    applied = set(apply_completion_changes(db, user_id, merged))
+    skipped += [{"habit_id": hid, "date": iso} for hid, iso in merged if (hid, iso) not in applied]
+    return jsonify(success=not skipped, updated=len(applied), skipped=skipped)
+
 @app.route("/update_reason", methods=["POST"])
 @login_required
 def update_reason():
     data = request.get_json()
     date = data.get("date")
     reason = data.get("reason", "")
-    if not date:
+    try:
+        date = datetime.date.fromisoformat(date).isoformat()
+    except (TypeError, ValueError):
         return jsonify(success=False), 400
     db = get_db()
     db.execute("""
@@ -410,6 +1257,8 @@ def update_reason():
         ON CONFLICT(user_id,date)
         DO UPDATE SET reason=excluded.reason
     """, (session["user_id"], date, reason))
+    rollup.refresh(db, store, session["user_id"], [date])
+    invalidate_user_cache(db, session["user_id"], [date[:7]])
     db.commit()
     return jsonify(success=True)
 
@@ -418,98 +1267,102 @@ def update_reason():
 def mark_all_done_today():
     db = get_db()
     user_id = session["user_id"]
-    today = datetime.date.today().isoformat()
-
-    db.execute("""
-        UPDATE habit_entry
-        SET completed=1
-        WHERE date=?
-          AND habit_id IN (SELECT id FROM habit WHERE user_id=?)
-    """, (today, user_id))
-    db.commit()
+    today = user_today()
+    iso = today.isoformat()
+
+    # Today's open slots
+    habits = db.execute("SELECT id, frequency, created_on FROM habit WHERE user_id=?", (user_id,)).fetchall()
+    apply_completion_changes(db, user_id, {
+        (e["habit_id"], iso): 1
+        for e in store.month_slots(db, user_id, habits, today)
+        if e["date"] == iso and e["completed"] != 1
+    })
     return jsonify(success=True)
 
 
 # ---------------- Analytics ----------------
-@app.route("/analytics")
-@login_required
-def analytics():
-    db = get_db()
-    user_id = session["user_id"]
-    today = datetime.date.today()
-
+def build_analytics_view(db, user_id, today, days):
+    """Per-habit cards and top missed-day reasons over the last `days` days."""
     habits = db.execute(
-        "SELECT id, name, frequency FROM habit WHERE user_id=? ORDER BY id DESC",
+        "SELECT id, name, frequency, created_on FROM habit WHERE user_id=? ORDER BY id DESC",
         (user_id,)
     ).fetchall()
 
+    aggs = load_habit_aggregates(db, habits, today)
+    # Rolling rates and the weekday heatmap only need the last year of entries
+    recent = store.habit_metrics(db, today, user_id=user_id, since=today - datetime.timedelta(days=364))
     habit_cards = []
     for h in habits:
-        rows = db.execute(
-            "SELECT date, completed FROM habit_entry WHERE habit_id=? ORDER BY date ASC",
-            (h["id"],)
-        ).fetchall()
-
-        total = len(rows)
-        done = sum(1 for r in rows if r["completed"] == 1)
-        consistency = int((done / total) * 100) if total else 0
-
-        # current streak (ending at latest <= today)
-        current_streak = 0
-        for r in reversed(rows):
-            d = datetime.date.fromisoformat(r["date"])
-            if d > today:
-                continue
-            if r["completed"] == 1:
-                current_streak += 1
-            else:
-                break
-
-        # longest streak
-        longest_streak = 0
-        run = 0
-        for r in rows:
-            if r["completed"] == 1:
-                run += 1
-                longest_streak = max(longest_streak, run)
-            else:
-                run = 0
-
+        a = aggs[h["id"]]
+        r = recent.get(h["id"], {})
         habit_cards.append({
             "name": h["name"],
             "frequency": h["frequency"],
-            "total": total,
-            "done": done,
-            "consistency": consistency,
-            "current_streak": current_streak,
-            "longest_streak": longest_streak
+            "total": a["total"],
+            "done": a["done"],
+            "consistency": int((a["done"] / a["total"]) * 100) if a["total"] else 0,
+            "current_streak": a["current_streak"],
+            "longest_streak": a["longest_streak"],
+            "rate_7d": r.get("rate_7d"),
+            "rate_30d": r.get("rate_30d"),
+            "weekday_rates": r.get("weekday_rates", [None] * 7)
         })
 
+    # Consistency so far this month, quarter and year, from the daily rollups
+    ensure_rollup(db, user_id, today)
+    quarter = today.replace(month=(today.month - 1) // 3 * 3 + 1, day=1)
+    periods = [
+        (label, rollup_pct(db, user_id, start, today))
+        for label, start in (
+            ("This month", today.replace(day=1)),
+            ("This quarter", quarter),
+            ("This year", today.replace(month=1, day=1)),
+        )
+    ]
+
     # Top reasons on missed days
-    missed_days = db.execute("""
-        SELECT he.date
-        FROM habit_entry he
-        JOIN habit h ON h.id = he.habit_id
-        WHERE h.user_id=?
-        GROUP BY he.date
-        HAVING SUM(CASE WHEN he.completed=0 THEN 1 ELSE 0 END) > 0
-        ORDER BY he.date DESC
-        LIMIT 90
-    """, (user_id,)).fetchall()
-
-    reason_counts = {}
-    for md in missed_days:
-        rr = db.execute(
-            "SELECT reason FROM day_reason WHERE user_id=? AND date=?",
-            (user_id, md["date"])
-        ).fetchone()
-        if rr and (rr["reason"] or "").strip():
-            txt = rr["reason"].strip()
-            reason_counts[txt] = reason_counts.get(txt, 0) + 1
-
-    top_reasons = sorted(reason_counts.items(), key=lambda x: x[1], reverse=True)[:10]
-
-    return render_template("analytics.html", habit_cards=habit_cards, top_reasons=top_reasons)
+    top_reasons = [
+        (r["reason"], r["count"])
+        for r in reason_stats(db, user_id, days=days, today=today, limit=10, day_rollup=True)
+    ]
+
+    # Most common reason per habit, shown on its card
+    habit_reason = {}
+    for r in reason_stats(db, user_id, days=days, today=today, group_by="habit", limit=1,
+                          missed_sql=store.missed_sql):
+        habit_reason[r["group"]] = r["reason"]
+    for h, card in zip(habits, habit_cards):
+        card["top_reason"] = habit_reason.get(h["id"])
+
+    return {"habit_cards": habit_cards, "top_reasons": top_reasons, "periods": periods}
+
+@app.route("/analytics")
+@login_required
+def analytics():
+    db = get_db()
+    user_id = session["user_id"]
+    today = user_today()
+
+    days = request.args.get("days", 90, type=int)
+    if days not in REASON_WINDOWS:
+        days = 90
+
+    # Analytics spans every month, so any write (any generation bump) invalidates it
+    data_gen = sum(cache_generations(db, user_id).values())
+    view = cached_view(
+        ("analytics", user_id, today.isoformat(), days, data_gen),
+        user_id, [ALL_SCOPES],
+        lambda: build_analytics_view(db, user_id, today, days)
+    )
+
+    return render_template(
+        "analytics.html",
+        habit_cards=view["habit_cards"],
+        top_reasons=view["top_reasons"],
+        periods=view["periods"],
+        days=days,
+        reason_windows=REASON_WINDOWS
+    )
 
 # ---------------- Export ----------------
 @app.route("/export")
@@ -517,52 +1370,310 @@ def analytics():
 def export_page():
     return render_template("export.html")
 
+EXPORT_HEADER = ["Habit", "Frequency", "Date", "Completed", "Day Reason"]
+EXPORT_BATCH = 1000
+EXPORT_MIMETYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+}
+
+# Background exports: files land in EXPORT_DIR and are kept EXPORT_RETENTION seconds.
+export_jobs = ExportJobs(
+    connect=connect_user_db,
+    directory=os.environ.get("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "streakly-exports")),
+    workers=int(os.environ.get("EXPORT_WORKERS", "2")),
+    max_active_per_user=int(os.environ.get("EXPORT_MAX_JOBS_PER_USER", "2")),
+    retention=int(os.environ.get("EXPORT_RETENTION", "3600")),
+)
+
+def export_range(db, user_id, start=None, end=None):
+    """(start, end) ISO dates of an export or history read; by default from
+    the user's first day (history.first_day) through today. An earlier start
+    is moved up to that day."""
+    end = end or user_today().isoformat()
+    first = min(d for d in (history.first_day(db, store, user_id), end) if d)
+    return max(start or first, first), end
+
+def iter_export_rows(db, user_id, start=None, end=None):
+    """Yield export rows for a user: every slot in export_range(), day by day
+    (history.iter_days, which reads a month at a time)."""
+    habits = history.load_habits(db, user_id)
+    start, end = export_range(db, user_id, start, end)
+    for iso, slots, reason in history.iter_days(db, store, user_id, habits, start, end, reason_days=False):
+        for h, completed in slots:
+            yield [h["name"], h["frequency"], iso, "Yes" if completed == 1 else "No", reason]
+
+def write_export(fileobj, fmt, rows, on_batch=None):
+    """Write the header and `rows` to the binary file `fileobj` as CSV or XLSX.
+
+    Calls on_batch(rows_written, last_row) every EXPORT_BATCH rows and
+    returns the number of rows written.
+    """
+    n = 0
+    if fmt == "csv":
+        text = io.TextIOWrapper(fileobj, encoding="utf-8", newline="")
+        writer = csv.writer(text)
+        writer.writerow(EXPORT_HEADER)
+        for n, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if on_batch and n % EXPORT_BATCH == 0:
+                on_batch(n, row)
+        text.flush()
+        text.detach()
+        return n
+
+    from openpyxl import Workbook  # only XLSX exports pay for importing openpyxl
+
+    # Write-only workbooks stream rows to disk instead of holding cells in memory.
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Streakly Export")
+    ws.append(EXPORT_HEADER)
+    for n, row in enumerate(rows, 1):
+        ws.append(row)
+        if on_batch and n % EXPORT_BATCH == 0:
+            on_batch(n, row)
+    wb.save(fileobj)
+    return n
+
+def _parse_export_date(value):
+    if not value:
+        return None
+    return datetime.date.fromisoformat(value).isoformat()
+
 @app.route("/export_excel")
 @login_required
 def export_excel():
-    db = get_db()
     user_id = session["user_id"]
 
-    rows = db.execute("""
-        SELECT
-          h.name AS habit_name,
-          h.frequency AS frequency,
-          he.date AS date,
-          he.completed AS completed,
-          COALESCE(dr.reason, '') AS day_reason
-        FROM habit_entry he
-        JOIN habit h ON h.id = he.habit_id
-        LEFT JOIN day_reason dr ON dr.user_id = h.user_id AND dr.date = he.date
-        WHERE h.user_id=?
-        ORDER BY he.date ASC, h.name ASC
-    """, (user_id,)).fetchall()
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Streakly Export"
-
-    ws.append(["Habit", "Frequency", "Date", "Completed", "Day Reason"])
-    for r in rows:
-        ws.append([
-            r["habit_name"],
-            r["frequency"],
-            r["date"],
-            "Yes" if r["completed"] == 1 else "No",
-            r["day_reason"]
-        ])
-
-    bio = BytesIO()
-    wb.save(bio)
-    bio.seek(0)
-
-    filename = f"streakly_export_{datetime.date.today().isoformat()}.xlsx"
+    fmt = request.args.get("format", "xlsx")
+    try:
+        start = _parse_export_date(request.args.get("start"))
+        end = _parse_export_date(request.args.get("end"))
+    except ValueError:
+        return jsonify(success=False, error="Dates must be YYYY-MM-DD"), 400
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify(success=False, error="Unknown format"), 400
+
+    filename = f"streakly_export_{user_today().isoformat()}.{fmt}"
+
+    if fmt == "csv":
+        end = end or user_today().isoformat()  # the stream runs after this request
+        def generate():
+            # The response outlives the request's connection, so the stream
+            # reads through its own.
+            conn = connect_user_db(user_id)
+            try:
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                writer.writerow(EXPORT_HEADER)
+                for i, row in enumerate(iter_export_rows(conn, user_id, start, end), 1):
+                    writer.writerow(row)
+                    if i % EXPORT_BATCH == 0:
+                        yield buf.getvalue()
+                        buf.seek(0)
+                        buf.truncate()
+                yield buf.getvalue()
+            finally:
+                conn.close()
+
+        return Response(
+            generate(),
+            mimetype=EXPORT_MIMETYPES["csv"],
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
+
+    tmp = tempfile.TemporaryFile()
+    write_export(tmp, fmt, iter_export_rows(get_db(), user_id, start, end))
+    tmp.seek(0)
+
     return send_file(
-        bio,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        tmp,
+        mimetype=EXPORT_MIMETYPES[fmt],
         as_attachment=True,
         download_name=filename
     )
 
+# ---------------- Export jobs ----------------
+def run_export_job(db, job, path, progress):
+    """export_jobs worker: write the job's export to `path`, reporting progress by date."""
+    start, end = export_range(db, job["user_id"], job["start_date"], job["end_date"])
+    first = datetime.date.fromisoformat(start).toordinal()
+    days = max(1, datetime.date.fromisoformat(end).toordinal() - first + 1)
+
+    def on_batch(n, row):
+        done_days = datetime.date.fromisoformat(row[2]).toordinal() - first
+        progress(min(99, 100 * done_days // days), n)
+
+    with open(path, "wb") as f:
+        return write_export(f, job["format"], iter_export_rows(db, job["user_id"], start, end), on_batch)
+
+def export_job_json(job):
+    out = {
+        "id": job["id"],
+        "status": job["status"],
+        "format": job["format"],
+        "start": job["start_date"],
+        "end": job["end_date"],
+        "progress": job["progress"],
+        "rows": job["rows"],
+        "created_at": datetime.datetime.fromtimestamp(job["created_at"]).isoformat(timespec="seconds"),
+        "error": job["error"],
+        "status_url": url_for("export_job_status", job_id=job["id"]),
+    }
+    if job["status"] == "done":
+        out["download_url"] = url_for("export_job_download", job_id=job["id"])
+    return out
+
+@app.route("/export_jobs", methods=["GET", "POST"])
+@login_required
+def export_jobs_list():
+    """GET: the user's recent jobs. POST {format, start, end}: start a job (202)."""
+    db = get_db()
+    user_id = session["user_id"]
+    if request.method == "GET":
+        return jsonify(jobs=[export_job_json(j) for j in export_jobs.recent(db, user_id)])
+
+    data = request.get_json(silent=True) if request.is_json else request.form
+    if not isinstance(data, dict):
+        return jsonify(success=False), 400
+    fmt = data.get("format", "xlsx")
+    try:
+        start = _parse_export_date(data.get("start"))
+        end = _parse_export_date(data.get("end"))
+    except (TypeError, ValueError):
+        return jsonify(success=False, error="Dates must be YYYY-MM-DD"), 400
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify(success=False, error="Unknown format"), 400
+
+    end = end or user_today().isoformat()  # the job runs outside this request
+    try:
+        job_id = export_jobs.submit(db, user_id, fmt, start, end, run_export_job)
+    except TooManyJobs:
+        return jsonify(success=False, error="Too many exports in progress"), 429
+    return jsonify(success=True, job=export_job_json(export_jobs.get(db, job_id, user_id))), 202
+
+@app.route("/export_jobs/<job_id>")
+@limiter.exempt  # polled while the job runs
+@login_required
+def export_job_status(job_id):
+    job = export_jobs.get(get_db(), job_id, session["user_id"])
+    if job is None:
+        return jsonify(success=False), 404
+    return jsonify(export_job_json(job))
+
+@app.route("/export_jobs/<job_id>/download")
+@login_required
+def export_job_download(job_id):
+    job = export_jobs.get(get_db(), job_id, session["user_id"])
+    if job is None:
+        return jsonify(success=False), 404
+    if job["status"] != "done" or not os.path.exists(job["path"]):
+        return jsonify(success=False, error="Export is not ready"), 409
+    created = local_date(job["created_at"], user_timezone()).isoformat()
+    return send_file(
+        job["path"],
+        mimetype=EXPORT_MIMETYPES[job["format"]],
+        as_attachment=True,
+        download_name=f"streakly_export_{created}.{job['format']}"
+    )
+
+@app.cli.command("cleanup-exports")
+def cleanup_exports_command():
+    """Delete export jobs and files older than EXPORT_RETENTION."""
+    removed = sum(export_jobs.cleanup(db) for _, db in iter_data_dbs())
+    click.echo(f"Removed {removed} export jobs")
+
+# ---------------- Import ----------------
+def import_file(db, user_id, fileobj, fmt):
+    """Import a CSV/XLSX file in the export layout and refresh what derives
+    from the imported days. Returns the importer's summary."""
+    result = import_rows(db, store, user_id, read_rows(fileobj, fmt), EXPORT_HEADER)
+    refresh_habit_aggregates(db, result["habit_ids"], user_today())
+    rollup.reset(db, user_id)  # rebuilt on the next read; cheaper than per-day refreshes
+    invalidate_user_cache(db, user_id, result["months"] | {"habits"})
+    db.commit()
+    return result
+
+@app.route("/import", methods=["POST"])
+@limiter.limit("10/hour")
+@login_required
+def import_upload():
+    """Multipart upload of `file` (.csv or .xlsx, or say so in `format`)."""
+    upload = request.files.get("file")
+    if upload is None or not upload.filename:
+        return jsonify(success=False, error="No file uploaded"), 400
+    fmt = request.form.get("format") or upload.filename.rsplit(".", 1)[-1].lower()
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify(success=False, error="Upload a .csv or .xlsx file"), 400
+
+    try:
+        result = import_file(get_db(), session["user_id"], upload.stream, fmt)
+    except BadImportFile as e:
+        return jsonify(success=False, error=str(e)), 400
+    return jsonify(
+        success=not result["error_count"] and "error" not in result,
+        rows=result["rows"],
+        imported=result["imported"],
+        reasons=result["reasons"],
+        habits_created=result["habits_created"],
+        error_count=result["error_count"],
+        errors=result["errors"],
+        error=result.get("error"),
+    )
+
+@app.cli.command("import-data")
+@click.argument("email")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(sorted(EXPORT_MIMETYPES)),
+              help="File format (default: from the extension).")
+def import_data_command(email, path, fmt):
+    """Import a CSV/XLSX file in the export layout for the user EMAIL."""
+    user = get_catalog_db().execute("SELECT id FROM user WHERE email=?", (email,)).fetchone()
+    if user is None:
+        raise click.ClickException(f"No user {email}")
+    db = get_user_db(user["id"])
+    fmt = fmt or path.rsplit(".", 1)[-1].lower()
+    if fmt not in EXPORT_MIMETYPES:
+        raise click.ClickException("Pass --format csv or --format xlsx")
+
+    t0 = time.perf_counter()
+    with open(path, "rb") as f:
+        try:
+            result = import_file(db, user["id"], f, fmt)
+        except BadImportFile as e:
+            raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - t0
+    for e in result["errors"]:
+        click.echo(f"row {e['row']}: {e['error']}", err=True)
+    if result.get("error"):
+        click.echo(result["error"], err=True)
+    click.echo(
+        f"Imported {result['imported']} of {result['rows']} rows "
+        f"({result['habits_created']} new habits, {result['error_count']} errors) "
+        f"in {elapsed:.1f}s"
+    )
+
+# ---------------- Startup ----------------
+# Importing this module only defines the app; nothing touches the database or
+# loads openpyxl until it is needed. Servers should go through the factory:
+#   gunicorn "app:create_app()"                      each worker warms up lazily
+#   PRELOAD=1 gunicorn --preload "app:create_app()"  warm once, before forking
+PRELOAD = os.environ.get("PRELOAD", "0") == "1"
+
+def warm_up():
+    """Do the one-time work of first requests now: compile every template and
+    import the export/import dependencies."""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    from openpyxl import Workbook, load_workbook  # noqa: F401
+
+def create_app(preload=None):
+    """The app with the catalog migrated, and with `preload` (default: PRELOAD)
+    also warmed up, so that forked workers inherit the work."""
+    init_db()
+    if PRELOAD if preload is None else preload:
+        warm_up()
+    return app
+
 if __name__ == "__main__":
- with app.app_context():
-        app.run(host="0.0.0.0", port=5000)
+    create_app().run(host="0.0.0.0", port=5000)
@@ -0,0 +1,82 @@
+"""Per-habit statistics: the old per-row Python loops vs the vectorized engine.
+
+The data keeps every scheduled slot as a row (datagen --store-misses), which
+is what the loops expect; the engine (the rows storage backend's
+habit_metrics(), as the app calls it) merges the same slots from the schedule.
+
+    python benchmarks/bench_analytics.py --entries 10000 1000000
+"""
+import argparse, datetime, os, statistics, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE", os.path.join(tempfile.mkdtemp(), "import.db"))
+
+import datagen  # noqa: E402
+from storage import get_backend  # noqa: E402
+
+
+def legacy(db, user_id, today):
+    """The loops analytics() used to run for every habit."""
+    out = {}
+    for h in db.execute("SELECT id FROM habit WHERE user_id=?", (user_id,)).fetchall():
+        rows = db.execute(
+            "SELECT date, completed FROM habit_entry WHERE habit_id=? AND date<=? ORDER BY date ASC",
+            (h["id"], today.isoformat())
+        ).fetchall()
+        total = len(rows)
+        done = sum(1 for r in rows if r["completed"] == 1)
+        current = 0
+        for r in reversed(rows):
+            if datetime.date.fromisoformat(r["date"]) > today:
+                continue
+            if r["completed"] == 1:
+                current += 1
+            else:
+                break
+        longest = run = 0
+        for r in rows:
+            if r["completed"] == 1:
+                run += 1
+                longest = max(longest, run)
+            else:
+                run = 0
+        out[h["id"]] = (total, done, current, longest)
+    return out
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000, result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--entries", type=int, nargs="+", default=[10000, 1000000])
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+
+    today = datetime.date.today()
+    store = get_backend("rows")  # datagen writes habit_entry rows
+    print(f"{'entries':>9}{'habits':>8}{'loops ms':>11}{'engine ms':>11}{'speedup':>9}")
+    for n in args.entries:
+        habits = 10 if n <= 100000 else 100
+        db = datagen.connect(os.path.join(tempfile.mkdtemp(), "bench.db"))
+        (user_id,), _ = datagen.generate(db, 1, habits, n // habits, today=today, frequencies=["daily"],
+                                        store_misses=True)
+
+        old_ms, old = timed(lambda: legacy(db, user_id, today), args.runs)
+        new_ms, new = timed(lambda: store.habit_metrics(db, today, user_id=user_id), args.runs)
+        for hid, (total, done, current, longest) in old.items():
+            m = new[hid]
+            assert (m["total"], m["done"], m["current_streak"], m["longest_streak"]) == (total, done, current, longest)
+        print(f"{n:>9}{habits:>8}{old_ms:>11.1f}{new_ms:>11.1f}{old_ms / new_ms:>8.1f}x")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Peak RSS and time of /export_excel against row count.
+
+Each export runs in a fresh child process so its peak RSS is not polluted by
+the seeding or by earlier runs. "legacy" replays the old fetchall + in-memory
+Workbook export for comparison.
+
+    python benchmarks/bench_export.py --rows 10000 100000 500000
+"""
+import argparse, json, os, resource, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("legacy", "xlsx", "csv")
+
+
+def child(mode, db_path):
+    os.environ["DATABASE"] = db_path
+    sys.path.insert(0, ROOT)
+    import app as streakly
+
+    streakly.app.config["TESTING"] = True
+    streakly.limiter.enabled = False
+    client = streakly.app.test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = 1
+
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    size = 0
+    if mode == "legacy":
+        from io import BytesIO
+        from openpyxl import Workbook
+        with streakly.app.app_context():
+            rows = streakly.get_db().execute("""
+                SELECT h.name, h.frequency, he.date, he.completed, COALESCE(dr.reason, '')
+                FROM habit_entry he
+                JOIN habit h ON h.id = he.habit_id
+                LEFT JOIN day_reason dr ON dr.user_id = h.user_id AND dr.date = he.date
+                WHERE h.user_id=?
+                ORDER BY he.date ASC, h.name ASC
+            """, (1,)).fetchall()
+            wb = Workbook()
+            ws = wb.active
+            ws.append(["Habit", "Frequency", "Date", "Completed", "Day Reason"])
+            for r in rows:
+                ws.append([r[0], r[1], r[2], "Yes" if r[3] == 1 else "No", r[4]])
+            bio = BytesIO()
+            wb.save(bio)
+            size = bio.tell()
+    else:
+        rv = client.get(f"/export_excel?format={mode}", buffered=False)
+        assert rv.status_code == 200, rv.status_code
+        for chunk in rv.response:
+            size += len(chunk)
+        rv.close()
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(json.dumps({
+        "seconds": elapsed,
+        "bytes": size,
+        "peak_rss_mb": peak / 1024,
+        "export_rss_mb": (peak - base_rss) / 1024,
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 300000])
+    ap.add_argument("--habits", type=int, default=10)
+    ap.add_argument("--child", nargs=2, metavar=("MODE", "DB"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        return child(*args.child)
+
+    import datagen
+
+    print(f"{'rows':>8}  {'mode':<7}{'seconds':>9}{'peak MB':>10}{'export MB':>11}")
+    for n in args.rows:
+        db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        env = dict(os.environ, DATABASE=db_path)
+        db = datagen.connect(db_path)
+        datagen.generate(db, 1, args.habits, n // args.habits, frequencies=["daily"], store_misses=True)
+        db.close()
+
+        for mode in MODES:
+            out = subprocess.run([sys.executable, __file__, "--child", mode, db_path],
+                                 env=env, check=True, capture_output=True, text=True).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{n:>8}  {mode:<7}{r['seconds']:>9.2f}{r['peak_rss_mb']:>10.1f}{r['export_rss_mb']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Import throughput (rows/sec) for CSV and XLSX files in the export layout.
+
+Writes a file of --rows rows (daily habits, about half completed, a reason
+every few days), then imports it into a fresh database for each format,
+twice: into an empty account and again over the same data (all upserts).
+
+    python benchmarks/bench_import.py --rows 100000 500000
+"""
+import argparse, csv, datetime, os, random, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE", os.path.join(tempfile.mkdtemp(), "import.db"))
+
+from openpyxl import Workbook  # noqa: E402
+
+import datagen  # noqa: E402
+import app as streakly  # noqa: E402
+from importer import import_rows, read_rows  # noqa: E402
+
+
+def make_rows(n, habits=8, seed=1):
+    rng = random.Random(seed)
+    days = -(-n // habits)
+    start = datetime.date.today() - datetime.timedelta(days=days)
+    for i in range(n):
+        date = start + datetime.timedelta(days=i // habits)
+        reason = "busy" if date.day % 5 == 0 else ""
+        yield [f"Habit {i % habits}", "daily", date.isoformat(), "Yes" if rng.random() < 0.5 else "No", reason]
+
+
+def write_file(path, fmt, n):
+    if fmt == "csv":
+        with open(path, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(streakly.EXPORT_HEADER)
+            w.writerows(make_rows(n))
+        return
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Streakly Export")
+    ws.append(streakly.EXPORT_HEADER)
+    for row in make_rows(n):
+        ws.append(row)
+    wb.save(path)
+
+
+def run_import(db, path, fmt):
+    t0 = time.perf_counter()
+    with open(path, "rb") as f:
+        result = import_rows(db, streakly.store, 1, read_rows(f, fmt), streakly.EXPORT_HEADER)
+    elapsed = time.perf_counter() - t0
+    assert result["error_count"] == 0, result["errors"][:5]
+    return elapsed, result["rows"]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, nargs="+", default=[100_000])
+    ap.add_argument("--formats", nargs="+", default=["csv", "xlsx"], choices=["csv", "xlsx"])
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    print(f"storage={streakly.store.name}")
+    print(f"{'rows':>9} {'format':<7}{'file MiB':>9}{'new rows/s':>12}{'upsert rows/s':>15}")
+    for n in args.rows:
+        for fmt in args.formats:
+            path = os.path.join(tmp, f"import_{n}.{fmt}")
+            write_file(path, fmt, n)
+            db = datagen.connect(os.path.join(tmp, f"{fmt}_{n}.db"))
+            for name, value in streakly.SQLITE_PRAGMAS.items():  # as the app runs
+                db.execute(f"PRAGMA {name}={value}")
+            db.execute("INSERT INTO user (id,email,password) VALUES (1,'bench@example.com','x')")
+            db.commit()
+            first, rows = run_import(db, path, fmt)
+            again, _ = run_import(db, path, fmt)
+            db.close()
+            size = os.path.getsize(path) / 2**20
+            print(f"{rows:>9} {fmt:<7}{size:>9.1f}{rows / first:>12,.0f}{rows / again:>15,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Time /home and /analytics with and without the schema indexes.
+
+Seeds a throwaway database with one heavy user (100k+ habit entries by
+default), drops the indexes that migrations 2, 3 and 5 create, measures both
+pages, recreates the indexes from the same DDL and measures again. The rest
+of the schema (and PRAGMA user_version) is left alone.
+
+    python benchmarks/bench_indexes.py --habits 30 --days 3650 --runs 5
+"""
+import argparse, os, re, statistics, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INDEX_MIGRATIONS = (2, 3, 5)  # numbered as in app.MIGRATIONS' comments
+
+
+def index_ddl(migrations):
+    """{index name: CREATE INDEX statement} from the index migrations."""
+    ddl = {}
+    for n in INDEX_MIGRATIONS:
+        for stmt in migrations[n - 1].split(";"):
+            m = re.search(r"CREATE (?:UNIQUE )?INDEX IF NOT EXISTS (\w+)", stmt)
+            if m:
+                ddl[m.group(1)] = stmt.strip()
+    return ddl
+
+
+def time_pages(client, runs):
+    out = {}
+    for path in ("/home", "/analytics"):
+        client.get(path)  # warm-up
+        samples = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            rv = client.get(path)
+            samples.append((time.perf_counter() - t0) * 1000)
+            assert rv.status_code == 200, (path, rv.status_code)
+        out[path] = statistics.median(samples)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--habits", type=int, default=30)
+    ap.add_argument("--days", type=int, default=3650)
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    os.environ["DATABASE"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    sys.path.insert(0, ROOT)
+    import app as streakly
+    import datagen
+
+    streakly.app.config["TESTING"] = True
+    streakly.limiter.enabled = False
+    streakly.CACHE_ENABLED = False  # measure the queries, not the page cache
+
+    with streakly.app.app_context():
+        db = streakly.get_db()
+        (user_id,), n = datagen.generate(db, 1, args.habits, args.days, frequencies=["daily"])
+        indexes = index_ddl(streakly.MIGRATIONS)
+        # Without those indexes for the "before" run.
+        for name in indexes:
+            db.execute(f"DROP INDEX IF EXISTS {name}")
+        db.commit()
+
+    client = streakly.app.test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = user_id
+
+    print(f"{n} habit entries, {args.habits} habits, median of {args.runs} runs")
+    before = time_pages(client, args.runs)
+
+    with streakly.app.app_context():
+        db = streakly.get_db()
+        for stmt in indexes.values():
+            db.execute(stmt)
+        db.execute("ANALYZE")
+        db.commit()
+    after = time_pages(client, args.runs)
+
+    print(f"{'route':<12}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for path in before:
+        print(f"{path:<12}{before[path]:>12.1f}{after[path]:>12.1f}{before[path] / after[path]:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Sign-in throughput and /home tail latency during a sign-in burst.
+
+For each PASSWORD_HASH_WORKERS value, a fresh process seeds a database
+(datagen.py), then for --seconds runs --logins threads posting valid
+sign-ins while one thread loads /home as a signed-in user, all through the
+Flask test client as a threaded server's request threads would. /home is
+also timed alone first for reference. 0 workers hashes on the request
+threads, as before hashing moved to a process pool.
+
+    python benchmarks/bench_login.py --workers 0 1 2 --logins 8
+"""
+import argparse, json, os, subprocess, sys, tempfile, threading, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def percentile(samples, q):
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(q * len(s)))] if s else float("nan")
+
+
+def time_home(client, stop, samples):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        assert client.get("/home").status_code == 200
+        samples.append((time.perf_counter() - t0) * 1000)
+
+
+def child(args):
+    os.environ["DATABASE"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, HERE)
+    import app as streakly
+    import datagen
+
+    streakly.app.config["TESTING"] = True
+    streakly.limiter.enabled = False
+    with streakly.app.app_context():
+        db = streakly.get_db()
+        (user_id,), _ = datagen.generate(db, users=1, habits=args.habits, days=365)
+        db.commit()
+        email = db.execute("SELECT email FROM user WHERE id=?", (user_id,)).fetchone()["email"]
+    creds = {"email": email, "password": datagen.PASSWORD}
+
+    home = streakly.app.test_client()
+    with home.session_transaction() as s:
+        s["user_id"] = user_id
+    login = streakly.app.test_client()
+    assert login.post("/login", data=creds).status_code == 302  # starts the hashing pool
+
+    idle = []
+    stop = threading.Event()
+    threading.Timer(min(2, args.seconds), stop.set).start()
+    time_home(home, stop, idle)
+
+    logins, busy, loaded = [], [0], []
+
+    def sign_in():
+        client = streakly.app.test_client()
+        while not stop.is_set():
+            rv = client.post("/login", data=creds)
+            if rv.status_code == 503:
+                busy[0] += 1
+                continue
+            assert rv.status_code == 302, rv.status_code
+            logins.append(1)
+            client.get("/logout")
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=sign_in) for _ in range(args.logins)]
+    threads.append(threading.Thread(target=time_home, args=(home, stop, loaded)))
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    print(json.dumps({
+        "logins_per_s": len(logins) / elapsed,
+        "busy": busy[0],
+        "idle_p50": percentile(idle, 0.5),
+        "p50": percentile(loaded, 0.5),
+        "p95": percentile(loaded, 0.95),
+        "p99": percentile(loaded, 0.99),
+        "home_requests": len(loaded),
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2])
+    ap.add_argument("--logins", type=int, default=8, help="Threads signing in.")
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--habits", type=int, default=10)
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        return child(args)
+
+    method = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+    print(f"{args.logins} sign-in threads for {args.seconds:.0f}s, {method}, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8}{'logins/s':>10}{'503s':>6}{'/home alone':>13}"
+          f"{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}")
+    for workers in args.workers:
+        env = dict(os.environ, PASSWORD_HASH_WORKERS=str(workers))
+        cmd = [sys.executable, __file__, "--child", "--logins", str(args.logins),
+               "--seconds", str(args.seconds), "--habits", str(args.habits)]
+        out = subprocess.run(cmd, env=env, check=True, capture_output=True, text=True).stdout
+        r = json.loads(out.splitlines()[-1])
+        print(f"{workers:>8}{r['logins_per_s']:>10.1f}{r['busy']:>6}{r['idle_p50']:>13.1f}"
+              f"{r['p50']:>8.1f}{r['p95']:>8.1f}{r['p99']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
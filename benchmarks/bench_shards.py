@@ -0,0 +1,110 @@
+"""Concurrent write throughput against the number of SQLite shards.
+
+For each shard count, seeds --users users (a few daily habits and 90 days of
+history each) and starts --workers processes that all begin at the same
+moment and toggle completions for their own users through
+apply_completion_changes(), one committed transaction per toggle, as
+/update_completion does. 0 shards means the single shared database file.
+Each file has its own write lock, so throughput grows with the shard count
+until the CPUs (or the disk) are saturated.
+
+    python benchmarks/bench_shards.py --shards 0 2 4 8 --workers 8
+"""
+import argparse, datetime, multiprocessing, os, random, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_app(db_path, shards, synchronous):
+    os.environ["DATABASE"] = db_path
+    os.environ["SQLITE_SYNCHRONOUS"] = synchronous
+    os.environ["SHARD_COUNT"] = str(shards)
+    os.environ["SHARD_DIR"] = os.path.join(os.path.dirname(db_path), "shards")
+    sys.path.insert(0, ROOT)
+    import app
+    return app
+
+
+def seed(db_path, shards, synchronous, users, habits):
+    streakly = _load_app(db_path, shards, synchronous)
+    today = datetime.date.today()
+    start = (today - datetime.timedelta(days=90)).isoformat()
+    with streakly.app.app_context():
+        catalog = streakly.get_catalog_db()
+        for i in range(users):
+            user_id = catalog.execute(
+                "INSERT INTO user (email,password) VALUES (?,?)", (f"shard-{i}@example.com", "x")
+            ).lastrowid
+            streakly.router.assign(catalog, user_id)
+            catalog.commit()
+            db = streakly.get_user_db(user_id)
+            db.executemany(
+                "INSERT INTO habit (user_id,name,frequency,created_on) VALUES (?,?,'daily',?)",
+                [(user_id, f"Habit {h}", start) for h in range(habits)]
+            )
+            db.commit()
+
+
+def worker(db_path, shards, synchronous, user_ids, writes, start_at, seed_):
+    streakly = _load_app(db_path, shards, synchronous)
+    rng = random.Random(seed_)
+    today = datetime.date.today()
+    with streakly.app.app_context():
+        slots = {}
+        for user_id in user_ids:
+            db = streakly.get_user_db(user_id)
+            slots[user_id] = [r["id"] for r in db.execute("SELECT id FROM habit WHERE user_id=?", (user_id,))]
+        time.sleep(max(0.0, start_at - time.time()))
+        for i in range(writes):
+            user_id = user_ids[i % len(user_ids)]
+            day = (today - datetime.timedelta(days=rng.randrange(90))).isoformat()
+            streakly.apply_completion_changes(
+                streakly.get_user_db(user_id), user_id, {(rng.choice(slots[user_id]), day): rng.randint(0, 1)}
+            )
+    return time.time()
+
+
+def run(shards, args):
+    tmp = tempfile.mkdtemp()
+    db_path = os.path.join(tmp, "catalog.db")
+    ctx = multiprocessing.get_context("spawn")  # every process imports app with this config
+    with ctx.Pool(1) as pool:
+        pool.apply(seed, (db_path, shards, args.synchronous, args.users, args.habits))
+
+    user_ids = list(range(1, args.users + 1))
+    per_worker = [user_ids[w::args.workers] for w in range(args.workers)]
+    start_at = time.time() + 3  # after every worker has imported the app
+    with ctx.Pool(args.workers) as pool:
+        finished = pool.starmap(worker, [
+            (db_path, shards, args.synchronous, ids, args.writes, start_at, w)
+            for w, ids in enumerate(per_worker)
+        ])
+    elapsed = max(finished) - start_at
+    return args.workers * args.writes / elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--shards", type=int, nargs="+", default=[0, 2, 4, 8])
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--users", type=int, default=32)
+    ap.add_argument("--habits", type=int, default=4)
+    ap.add_argument("--writes", type=int, default=300, help="Toggles per worker.")
+    ap.add_argument("--synchronous", default="normal", choices=["off", "normal", "full"],
+                    help="SQLITE_SYNCHRONOUS; \"full\" adds an fsync to every commit.")
+    args = ap.parse_args()
+    if args.users < args.workers:
+        ap.error("--users must be at least --workers")
+
+    print(f"{args.workers} workers x {args.writes} writes, {args.users} users, "
+          f"synchronous={args.synchronous}, {os.cpu_count()} CPUs")
+    print(f"{'shards':>7}{'writes/s':>10}{'speedup':>9}")
+    base = None
+    for shards in args.shards:
+        rate = run(shards, args)
+        base = base or rate
+        print(f"{shards:>7}{rate:>10,.0f}{rate / base:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
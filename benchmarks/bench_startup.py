@@ -0,0 +1,73 @@
+"""Start-up cost: import time and time to the first request.
+
+Each run is a fresh interpreter that imports app.py, calls create_app()
+(lazy: migrate only; preload: also warm_up() as a --preload master would)
+and then serves GET /login and a signed-in GET /home through the test
+client. The database is new on the first run of each mode and already
+migrated on the others.
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+import argparse, json, os, sqlite3, statistics, subprocess, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app as streakly
+t1 = time.perf_counter()
+imported = sorted(m for m in ("openpyxl", "numpy") if m in sys.modules)
+streakly.create_app(preload=sys.argv[2] == "preload")
+t2 = time.perf_counter()
+streakly.app.config["TESTING"] = True
+streakly.limiter.enabled = False
+client = streakly.app.test_client()
+assert client.get("/login").status_code == 200
+t3 = time.perf_counter()
+with client.session_transaction() as s:
+    s["user_id"] = 1
+assert client.get("/home").status_code == 200
+t4 = time.perf_counter()
+print(json.dumps({
+    "import": t1 - t0, "factory": t2 - t1, "login": t3 - t2, "home": t4 - t3,
+    "imported": imported,
+}))
+"""
+
+
+def child(mode, db_path):
+    env = dict(os.environ, DATABASE=db_path)
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, ROOT, mode], env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--modes", nargs="+", default=["lazy", "preload"], choices=["lazy", "preload"])
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    print(f"{'mode':<16}{'import ms':>10}{'factory ms':>11}{'1st /login':>11}{'1st /home':>10}  loaded at import")
+    for mode in args.modes:
+        db_path = os.path.join(tmp, f"{mode}.db")
+        results = []
+        for i in range(args.runs + 1):
+            results.append(child(mode, db_path))
+            if i == 0:  # the signed-in request needs the user to exist
+                with sqlite3.connect(db_path) as db:
+                    db.execute("INSERT INTO user (id,email,password) VALUES (1,'bench@example.com','x')")
+        first, rest = results[0], results[1:]
+        for label, runs in (("new db", [first]), ("", rest)):
+            med = {k: statistics.median(r[k] for r in runs) * 1000 for k in ("import", "factory", "login", "home")}
+            name = f"{mode} ({label})" if label else mode
+            print(f"{name:<16}{med['import']:>10.0f}{med['factory']:>11.0f}{med['login']:>11.0f}"
+                  f"{med['home']:>10.0f}  {', '.join(first['imported']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
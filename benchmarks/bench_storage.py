@@ -0,0 +1,102 @@
+"""Database size and read time: habit_entry rows vs habit_month bitsets.
+
+Generates one database in the row layout, converts a copy to the bitset
+layout (see storage.py) and drops the other table from each, then times the
+storage reads behind /home (month grid), /analytics (habit metrics, missed-day
+reasons) and the export rows for every user. Results must match.
+
+    python benchmarks/bench_storage.py --users 20 --habits 8 --days 1095
+"""
+import argparse, datetime, os, shutil, sqlite3, statistics, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE", os.path.join(tempfile.mkdtemp(), "import.db"))
+
+import datagen  # noqa: E402
+import storage  # noqa: E402
+import app as streakly  # noqa: E402
+from analytics import reason_stats  # noqa: E402
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000, result
+
+
+def export_rows(backend, db, user_id):
+    streakly.store = backend  # iter_export_rows reads through the app's backend
+    return list(streakly.iter_export_rows(db, user_id))
+
+
+def reads(backend, db, user_id, habits, today):
+    return {
+        "month grid": lambda: backend.month_slots(db, user_id, habits, today),
+        "habit metrics": lambda: backend.habit_metrics(db, today, user_id=user_id),
+        "reasons": lambda: reason_stats(db, user_id, days=365, today=today, group_by="habit",
+                                        missed_sql=backend.missed_sql),
+        "export": lambda: export_rows(backend, db, user_id),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--habits", type=int, default=8)
+    ap.add_argument("--days", type=int, default=1095)
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    today = datetime.date.today()
+    tmp = tempfile.mkdtemp()
+    rows_path, bits_path = os.path.join(tmp, "rows.db"), os.path.join(tmp, "bitset.db")
+
+    db = datagen.connect(rows_path)
+    user_ids, n_entries = datagen.generate(db, args.users, args.habits, args.days, today=today)
+    db.close()
+    shutil.copy(rows_path, bits_path)
+
+    dbs = {}
+    for name, path, drop in (("rows", rows_path, "habit_month"), ("bitset", bits_path, "habit_entry")):
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        if name == "bitset":
+            storage.convert(conn, "bitset")
+        conn.execute(f"DELETE FROM {drop}")
+        conn.commit()
+        conn.execute("VACUUM")
+        dbs[name] = conn
+
+    print(f"{args.users} users x {args.habits} habits, {args.days} days, {n_entries} recorded days")
+    print(f"{'layout':<8}{'rows':>10}{'file KiB':>11}")
+    for name, conn in dbs.items():
+        table = "habit_entry" if name == "rows" else "habit_month"
+        count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        print(f"{name:<8}{count:>10}{os.path.getsize(conn.execute('PRAGMA database_list').fetchone()[2]) // 1024:>11}")
+
+    times = {}
+    for user_id in user_ids:
+        habits = dbs["rows"].execute("SELECT * FROM habit WHERE user_id=?", (user_id,)).fetchall()
+        results = {}
+        for name, conn in dbs.items():
+            for label, fn in reads(storage.get_backend(name), conn, user_id, habits, today).items():
+                ms, results[name, label] = timed(fn, args.runs)
+                times.setdefault(label, {}).setdefault(name, []).append(ms)
+        for label in times:
+            a, b = results["rows", label], results["bitset", label]
+            if label == "month grid":  # only the row layout has entry ids
+                a, b = ([dict(s, id=None) for s in x] for x in (a, b))
+            assert a == b, f"{label} differs for user {user_id}"
+
+    print(f"\n{'read (median per user)':<24}{'rows ms':>9}{'bitset ms':>11}{'speedup':>9}")
+    for label, by_layout in times.items():
+        r, b = statistics.median(by_layout["rows"]), statistics.median(by_layout["bitset"])
+        print(f"{label:<24}{r:>9.2f}{b:>11.2f}{r / b:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Synthetic users, habits and history in the real Streakly schema.
+
+    python benchmarks/datagen.py /tmp/bench.db --users 50 --habits 8 --days 1095
+
+Every habit is scheduled (schedule.py rules) from its creation date; past
+slots are completed with --completion-rate and only completions are stored,
+as the app does. A share of missed days get a reason. --store-misses also
+writes the not-completed slots through the end of the current month (the
+layout before slots were computed). All users share the password "bench".
+"""
+import argparse, calendar, datetime, os, random, sqlite3, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "bench"
+REASONS = ["Tired", "Travel", "Sick", "Busy at work", "Forgot", "Weather", "Family"]
+FREQUENCIES = ["daily"] * 6 + ["weekly"] * 3 + ["monthly"]
+
+
+def _app():
+    # app.py creates the schema of whatever DATABASE points at on first use;
+    # make sure that is never a real database when a script only wants the helpers.
+    os.environ.setdefault("DATABASE", os.path.join(tempfile.mkdtemp(), "import.db"))
+    sys.path.insert(0, ROOT)
+    import app
+    return app
+
+
+def connect(path):
+    """Open (and migrate) a benchmark database."""
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    _app().migrate(db)
+    return db
+
+
+def generate(db, users=1, habits=10, days=365, today=None, completion_rate=0.7,
+             reason_rate=0.3, frequencies=None, seed=42, store_misses=False):
+    """Insert synthetic data; returns (user_ids, number of stored habit entries)."""
+    _app()
+    from schedule import is_scheduled
+    from werkzeug.security import generate_password_hash
+
+    today = today or datetime.date.today()
+    start = today - datetime.timedelta(days=days)
+    end = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+    rng = random.Random(seed)
+    password = generate_password_hash(PASSWORD)
+    frequencies = frequencies or FREQUENCIES
+
+    user_ids, n_entries = [], 0
+    for u in range(users):
+        email = f"bench-{seed}-{u}@example.com"
+        cur = db.execute("INSERT INTO user (email, password) VALUES (?,?)", (email, password))
+        user_id = cur.lastrowid
+        user_ids.append(user_id)
+
+        entries, missed = [], set()
+        for i in range(habits):
+            freq = rng.choice(frequencies)
+            cur = db.execute(
+                "INSERT INTO habit (user_id,name,frequency,created_on) VALUES (?,?,?,?)",
+                (user_id, f"Habit {i + 1}", freq, start.isoformat())
+            )
+            habit_id = cur.lastrowid
+            day = start
+            while day <= end:
+                if is_scheduled(freq, day):
+                    done = 1 if day <= today and rng.random() < completion_rate else 0
+                    if done or store_misses:
+                        entries.append((habit_id, day.isoformat(), done))
+                    if not done and day <= today:
+                        missed.add(day.isoformat())
+                day += datetime.timedelta(days=1)
+
+        db.executemany("INSERT INTO habit_entry (habit_id,date,completed) VALUES (?,?,?)", entries)
+        db.executemany(
+            "INSERT INTO day_reason (user_id,date,reason) VALUES (?,?,?)",
+            [(user_id, d, rng.choice(REASONS)) for d in sorted(missed) if rng.random() < reason_rate]
+        )
+        n_entries += len(entries)
+    db.commit()
+    return user_ids, n_entries
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("path")
+    ap.add_argument("--users", type=int, default=10)
+    ap.add_argument("--habits", type=int, default=8)
+    ap.add_argument("--days", type=int, default=730)
+    ap.add_argument("--completion-rate", type=float, default=0.7)
+    ap.add_argument("--reason-rate", type=float, default=0.3)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--store-misses", action="store_true", help="also store not-completed slots")
+    args = ap.parse_args()
+
+    db = connect(args.path)
+    users, n = generate(db, args.users, args.habits, args.days, completion_rate=args.completion_rate,
+                        reason_rate=args.reason_rate, seed=args.seed, store_misses=args.store_misses)
+    print(f"{len(users)} users, {args.users * args.habits} habits, {n} habit entries -> {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Concurrent load against a running server: requests/sec on /home and /update_completion.
+
+Start the server with rate limiting off, e.g.
+
+    RATELIMIT_ENABLED=0 DATABASE=/tmp/load.db gunicorn -w 4 app:app
+
+then run
+
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --clients 1 4 16 --seconds 10
+
+Each client registers its own user, adds a few habits and then loops over
+GET /home and POST /update_completion until the time is up.
+"""
+import argparse, http.cookiejar, json, random, re, statistics, threading, time, urllib.parse, urllib.request, uuid
+
+SLOT_RE = re.compile(rb'data-entry="(\d+):([0-9-]+)"')
+
+
+class Client:
+    def __init__(self, base):
+        self.base = base.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, path, form=None, payload=None):
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+        elif payload is not None:
+            data = json.dumps(payload).encode()
+            headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(self.base + path, data=data, headers=headers)
+        with self.opener.open(req, timeout=30) as res:
+            return res.status, res.read()
+
+    def setup(self, habits):
+        creds = {"email": f"load-{uuid.uuid4().hex[:12]}@example.com", "password": "load-test"}
+        self.request("/register", form=creds)
+        self.request("/login", form=creds)
+        for i in range(habits):
+            self.request("/home", form={"action": "add", "habit_name": f"Habit {i}", "frequency": "daily"})
+        _, body = self.request("/home")
+        self.slots = [
+            {"habit_id": int(h), "date": d.decode()} for h, d in SLOT_RE.findall(body)
+        ] or [{"habit_id": 0, "date": "1970-01-01"}]
+
+
+def worker(client, route, deadline, latencies, errors):
+    rng = random.Random()
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        try:
+            if route == "/home":
+                client.request("/home")
+            else:
+                client.request("/update_completion", payload=dict(
+                    rng.choice(client.slots), completed=rng.randint(0, 1)
+                ))
+            latencies.append(time.perf_counter() - t0)
+        except Exception:
+            errors.append(1)
+
+
+def run(base, route, n, seconds, habits):
+    clients = [Client(base) for _ in range(n)]
+    for c in clients:
+        c.setup(habits)
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=worker, args=(c, route, deadline, latencies, errors)) for c in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0
+    return {
+        "rps": len(latencies) / seconds,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "p95_ms": p(0.95),
+        "errors": len(errors),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--url", default="http://127.0.0.1:5000")
+    ap.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--habits", type=int, default=5)
+    args = ap.parse_args()
+
+    print(f"{'route':<20}{'clients':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+    for route in ("/home", "/update_completion"):
+        for n in args.clients:
+            r = run(args.url, route, n, args.seconds, args.habits)
+            print(f"{route:<20}{n:>8}{r['rps']:>10.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
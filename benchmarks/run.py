@@ -0,0 +1,167 @@
+"""Benchmark suite: latency percentiles and throughput of the main routes.
+
+Generates a synthetic database (see datagen.py), drives the routes through
+the Flask test client and writes the results as JSON so runs can be compared
+across commits:
+
+    python benchmarks/run.py --users 20 --habits 8 --days 1095
+    python benchmarks/run.py --compare benchmarks/results/<earlier>.json
+    STORAGE=bitset python benchmarks/run.py
+"""
+import argparse, datetime, json, os, random, statistics, subprocess, sys, tempfile, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def percentile(samples, q):
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def scenarios(today):
+    prev = (today.replace(day=1) - datetime.timedelta(days=1)).strftime("%Y-%m")
+    return [
+        # (name, method, path, body factory, share of --requests)
+        ("home", "GET", "/home", None, 1.0),
+        ("home_prev_month", "GET", f"/home?month={prev}", None, 0.5),
+        ("analytics", "GET", "/analytics", None, 1.0),
+        ("update_completion", "POST", "/update_completion", "toggle", 1.0),
+        ("export_csv", "GET", "/export_excel?format=csv", None, 0.1),
+        ("export_xlsx", "GET", "/export_excel", None, 0.05),
+    ]
+
+
+def run(args):
+    os.environ["DATABASE"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    sys.path.insert(0, ROOT)
+    import datagen
+    import app as streakly
+    from schedule import is_slot
+
+    streakly.app.config["TESTING"] = True
+    streakly.limiter.enabled = False
+    streakly.CACHE_ENABLED = not args.no_cache
+
+    today = datetime.date.today()
+    with streakly.app.app_context():
+        db = streakly.get_db()
+        t0 = time.perf_counter()
+        user_ids, n_entries = datagen.generate(db, args.users, args.habits, args.days, today=today, seed=args.seed)
+        if streakly.store.name != "rows":  # datagen writes habit_entry rows
+            streakly.storage.convert(db, streakly.store.name)
+            db.commit()
+        gen_s = time.perf_counter() - t0
+        # Toggle targets: each user's slots over the last 60 days
+        recent = [today - datetime.timedelta(days=i) for i in range(60)]
+        slots = {
+            uid: [
+                {"habit_id": h["id"], "date": d.isoformat()}
+                for h in db.execute("SELECT * FROM habit WHERE user_id=?", (uid,))
+                for d in recent if is_slot(h, d)
+            ]
+            for uid in user_ids
+        }
+    print(f"generated {n_entries} entries for {len(user_ids)} users in {gen_s:.1f}s")
+
+    clients = {}
+    for uid in user_ids:
+        c = streakly.app.test_client()
+        with c.session_transaction() as s:
+            s["user_id"] = uid
+        clients[uid] = c
+
+    rng = random.Random(args.seed)
+    results = {}
+    for name, method, path, body, share in scenarios(today):
+        n = max(1, int(args.requests * share))
+        samples = []
+        started = time.perf_counter()
+        for _ in range(n):
+            uid = rng.choice(user_ids)
+            kwargs = {}
+            if body == "toggle":
+                kwargs["json"] = dict(rng.choice(slots[uid]), completed=rng.randint(0, 1))
+            t0 = time.perf_counter()
+            rv = clients[uid].open(path, method=method, **kwargs)
+            rv.get_data()
+            samples.append((time.perf_counter() - t0) * 1000)
+            if rv.status_code != 200:
+                raise SystemExit(f"{name}: HTTP {rv.status_code}")
+        elapsed = time.perf_counter() - started
+        results[name] = {
+            "requests": n,
+            "rps": round(n / elapsed, 1),
+            "p50_ms": round(statistics.median(samples), 2),
+            "p90_ms": round(percentile(samples, 0.90), 2),
+            "p99_ms": round(percentile(samples, 0.99), 2),
+            "max_ms": round(max(samples), 2),
+        }
+
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "users": args.users, "habits": args.habits, "days": args.days,
+            "entries": n_entries, "requests": args.requests, "seed": args.seed,
+            "cache": not args.no_cache,
+            "storage": streakly.store.name,
+        },
+        "results": results,
+    }
+
+
+def print_report(report, baseline=None):
+    head = f"{'scenario':<20}{'req':>6}{'req/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}"
+    if baseline:
+        head += f"{'Δp50':>9}{'Δreq/s':>9}"
+    print(head)
+    for name, r in report["results"].items():
+        line = f"{name:<20}{r['requests']:>6}{r['rps']:>9.1f}{r['p50_ms']:>9.1f}{r['p90_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+        old = (baseline or {}).get("results", {}).get(name)
+        if old:
+            line += f"{(r['p50_ms'] / old['p50_ms'] - 1) * 100:>+8.0f}%{(r['rps'] / old['rps'] - 1) * 100:>+8.0f}%"
+        print(line)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--users", type=int, default=10)
+    ap.add_argument("--habits", type=int, default=8)
+    ap.add_argument("--days", type=int, default=730)
+    ap.add_argument("--requests", type=int, default=200, help="requests per main scenario")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--no-cache", action="store_true", help="disable the page cache")
+    ap.add_argument("--out", help="result file (default: benchmarks/results/<time>-<commit>.json)")
+    ap.add_argument("--compare", help="earlier result file to compare against")
+    args = ap.parse_args()
+
+    report = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("config", {}).get("entries") != report["config"]["entries"]:
+            print("note: baseline was run on a different data set")
+    print_report(report, baseline)
+
+    out = args.out or os.path.join(
+        HERE, "results",
+        f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{report['commit'] or 'nogit'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved {out}")
+
+
+if __name__ == "__main__":
+    main()
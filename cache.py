@@ -0,0 +1,87 @@
+"""In-process LRU/TTL cache for computed page data.
+
+Entries are tagged with the user and the data scopes they were built from
+(a month like "2024-05", "habits", or "*" for everything), so writers can
+drop exactly the entries they affect. Sizes are estimated from the pickled
+value and the cache evicts least-recently-used entries to stay under both
+an entry count and a byte budget.
+"""
+import pickle, threading, time
+from collections import OrderedDict
+
+ALL_SCOPES = "*"
+
+
+class StatsCache:
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024, ttl=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (expires, size, user_id, scopes, value)
+        self._bytes = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            if item[0] < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[4]
+
+    def put(self, key, value, user_id, scopes):
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + self.ttl, size, user_id, frozenset(scopes), value)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate(self, user_id, scopes):
+        """Drop the user's entries built from any of `scopes` (and every "*" entry)."""
+        scopes = set(scopes)
+        with self._lock:
+            stale = [
+                k for k, item in self._data.items()
+                if item[2] == user_id and (ALL_SCOPES in item[3] or item[3] & scopes)
+            ]
+            for k in stale:
+                self._drop(k)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, key):
+        item = self._data.pop(key)
+        self._bytes -= item[1]
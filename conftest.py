@@ -0,0 +1,57 @@
+import contextlib
+import itertools
+import os
+import tempfile
+
+import pytest
+
+# app.py reads its settings at import time: point it at a scratch database,
+# hash passwords on the calling thread and lift the rate limits before any
+# test module imports it.
+_TMP = tempfile.mkdtemp(prefix="streakly-tests-")
+os.environ.update({
+    "DATABASE": os.path.join(_TMP, "streakly.db"),
+    "EXPORT_DIR": os.path.join(_TMP, "exports"),
+    "RATELIMIT_ENABLED": "0",
+    "PASSWORD_HASH_WORKERS": "0",
+    "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+})
+
+_emails = itertools.count(1)
+
+
+@pytest.fixture
+def streakly():
+    import app as streakly
+    streakly.app.config["TESTING"] = True
+    return streakly
+
+
+def sign_up(streakly, password="pass"):
+    """A test client signed in as a new user; its user id is in .user_id."""
+    client = streakly.app.test_client()
+    email = f"user{next(_emails)}@example.com"
+    client.post("/register", data={"email": email, "password": password})
+    client.post("/login", data={"email": email, "password": password})
+    with client.session_transaction() as s:
+        client.user_id = s["user_id"]
+    return client
+
+
+@pytest.fixture
+def client(streakly):
+    return sign_up(streakly)
+
+
+@pytest.fixture
+def user_db(streakly):
+    """Open a connection to a user's data file (closed after the test)."""
+    with contextlib.ExitStack() as stack:
+        yield lambda user_id: stack.enter_context(contextlib.closing(streakly.connect_user_db(user_id)))
+
+
+@pytest.fixture
+def data_db(streakly, tmp_path):
+    """A fresh, fully migrated database file."""
+    with contextlib.closing(streakly.connect_db(str(tmp_path / "data.db"))) as db:
+        yield db
@@ -0,0 +1,149 @@
+"""Background export jobs.
+
+Jobs are rows in the export_job table of the user's database (`connect`
+opens it by user id), so any worker process can report a job's status or
+serve its file; the export itself runs on a small thread
+pool in the process that accepted it and writes to a file under the export
+directory. Each job reports its progress (0-100) and row count as it goes.
+
+Jobs left queued or running longer than `timeout` (for example by a worker
+that was restarted) count as failed, and finished jobs are removed together
+with their files once they are older than `retention`.
+"""
+import logging, os, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+ACTIVE = ("queued", "running")
+
+
+class TooManyJobs(Exception):
+    pass
+
+
+class ExportJobs:
+    def __init__(self, connect, directory, workers=2, max_active_per_user=2,
+                 retention=3600, timeout=1800):
+        self.connect = connect
+        self.directory = directory
+        self.workers = workers
+        self.max_active_per_user = max_active_per_user
+        self.retention = retention
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _pool(self):
+        # Threads do not survive a fork; start a fresh pool in each worker.
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export")
+                self._pid = os.getpid()
+            return self._executor
+
+    def path(self, job):
+        return os.path.join(self.directory, f"{job['id']}.{job['format']}")
+
+    def submit(self, db, user_id, fmt, start, end, run):
+        """Queue `run(db, job, path, progress)` as a new job and return its id.
+
+        `progress(percent, rows)` may be called any number of times. Raises
+        TooManyJobs when the user already has `max_active_per_user` jobs in
+        flight. Commits.
+        """
+        self.cleanup(db)
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        # Count and insert in one statement so concurrent submits cannot
+        # both slip under the cap.
+        cur = db.execute("""
+            INSERT INTO export_job (id,user_id,format,start_date,end_date,status,created_at)
+            SELECT ?,?,?,?,?,'queued',?
+            WHERE (
+                SELECT COUNT(*) FROM export_job
+                WHERE user_id=? AND status IN ('queued','running') AND created_at>=?
+            ) < ?
+        """, (job_id, user_id, fmt, start, end, now, user_id, now - self.timeout, self.max_active_per_user))
+        db.commit()
+        if cur.rowcount == 0:
+            raise TooManyJobs()
+        self._pool().submit(self._run, job_id, user_id, run)
+        return job_id
+
+    def _run(self, job_id, user_id, run):
+        db = self.connect(user_id)
+        path = None
+        try:
+            job = dict(db.execute("SELECT * FROM export_job WHERE id=?", (job_id,)).fetchone())
+            db.execute("UPDATE export_job SET status='running' WHERE id=?", (job_id,))
+            db.commit()
+
+            def progress(percent, rows):
+                db.execute("UPDATE export_job SET progress=?, rows=? WHERE id=?", (int(percent), rows, job_id))
+                db.commit()
+
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.path(job)
+            rows = run(db, job, path + ".part", progress)
+            os.replace(path + ".part", path)
+            db.execute("""
+                UPDATE export_job SET status='done', progress=100, rows=?, path=?, finished_at=?
+                WHERE id=?
+            """, (rows, path, time.time(), job_id))
+            db.commit()
+        except Exception as e:
+            log.exception("export job %s failed", job_id)
+            if db.in_transaction:
+                db.rollback()
+            db.execute(
+                "UPDATE export_job SET status='failed', error=?, finished_at=? WHERE id=?",
+                (type(e).__name__, time.time(), job_id)
+            )
+            db.commit()
+            if path:
+                _remove(path + ".part")
+        finally:
+            db.close()
+
+    def get(self, db, job_id, user_id):
+        """The user's job as a dict (None if unknown); stale active jobs read as failed."""
+        row = db.execute("SELECT * FROM export_job WHERE id=? AND user_id=?", (job_id, user_id)).fetchone()
+        return self._view(row) if row else None
+
+    def recent(self, db, user_id, limit=10):
+        return [
+            self._view(r)
+            for r in db.execute(
+                "SELECT * FROM export_job WHERE user_id=? ORDER BY created_at DESC LIMIT ?",
+                (user_id, limit)
+            )
+        ]
+
+    def _view(self, row):
+        job = dict(row)
+        if job["status"] in ACTIVE and job["created_at"] < time.time() - self.timeout:
+            job["status"], job["error"] = "failed", "timeout"
+        return job
+
+    def cleanup(self, db, now=None):
+        """Drop jobs (and files) older than the retention period. Returns how many. Commits."""
+        now = time.time() if now is None else now
+        old = db.execute(
+            "SELECT id, format, path FROM export_job WHERE created_at<? AND (status NOT IN ('queued','running') OR created_at<?)",
+            (now - self.retention, now - self.timeout)
+        ).fetchall()
+        for job in old:
+            _remove(job["path"] or self.path(job))
+            _remove(self.path(job) + ".part")
+        db.executemany("DELETE FROM export_job WHERE id=?", [(job["id"],) for job in old])
+        db.commit()
+        return len(old)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
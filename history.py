@@ -0,0 +1,117 @@
+"""Date-bounded reads of a user's history, whole or a page at a time.
+
+iter_days() walks a date range a month at a time, merging each habit's
+computed schedule with what the storage backend recorded and with the
+day's reasons. Each month is read with index range queries bounded to that
+month, and months that can hold nothing (before a habit starts, with no
+entries or reasons) are skipped with one index seek per habit, so memory
+stays flat however many years an account holds. page() cuts that walk into
+pages of whole days; the next page starts after the last day returned
+(keyset pagination on the date), so reading page 100 costs the same as
+page 1: the months it spans, never the ones before it.
+
+Functions take an open connection (row_factory=sqlite3.Row) and the storage
+backend (storage.py), and never write.
+"""
+import calendar
+import datetime
+
+from schedule import month_mask
+
+PAGE_SIZE = 200
+MAX_PAGE_SIZE = 2000
+
+
+def load_habits(db, user_id, habit_id=None):
+    """The user's habits (or the one `habit_id`) in export order: by name, then id."""
+    sql = "SELECT id, name, frequency, created_on FROM habit WHERE user_id=?"
+    params = [user_id]
+    if habit_id is not None:
+        sql += " AND id=?"
+        params.append(habit_id)
+    return db.execute(sql + " ORDER BY name ASC, id ASC", params).fetchall()
+
+
+def first_day(db, store, user_id):
+    """The user's first day with anything to show (ISO): the earliest habit
+    start, recorded day or reason; None for an empty account."""
+    candidates = [
+        db.execute("SELECT MIN(created_on) FROM habit WHERE user_id=?", (user_id,)).fetchone()[0],
+        store.first_date(db, user_id),
+        db.execute("SELECT MIN(date) FROM day_reason WHERE user_id=?", (user_id,)).fetchone()[0],
+    ]
+    candidates = [c for c in candidates if c]
+    return min(candidates) if candidates else None
+
+
+def _next_day(db, store, user_id, habits, since, reason_days):
+    """A day on or after `since` (ISO) before which nothing can show, or None."""
+    candidates = [max(h["created_on"], since) for h in habits if h["created_on"]]
+    candidates.append(store.next_date(db, user_id, since))
+    if reason_days:
+        row = db.execute(
+            "SELECT date FROM day_reason WHERE user_id=? AND date>=? ORDER BY date LIMIT 1", (user_id, since)
+        ).fetchone()
+        candidates.append(row and row["date"])
+    candidates = [c for c in candidates if c]
+    return min(candidates) if candidates else None
+
+
+def iter_days(db, store, user_id, habits, start, end, reason_days=True):
+    """(iso_date, slots, reason) for the days in [start, end] (ISO) that have
+    a slot of one of `habits`, or a reason when `reason_days` is set.
+
+    slots lists (habit, completed) in the order of `habits`; completed is
+    None for a slot with nothing recorded. reason is "" when there is none.
+    """
+    if not habits and not reason_days:
+        return
+    day, last = datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)
+    while day <= last:
+        until = min(day.replace(day=calendar.monthrange(day.year, day.month)[1]), last)
+        lo, hi = day.isoformat(), until.isoformat()
+        masks = [month_mask(h, day) for h in habits]
+        if not any(masks):
+            nxt = _next_day(db, store, user_id, habits, lo, reason_days)
+            if nxt is None or nxt > end:
+                return
+            if nxt > hi:  # nothing this month
+                day = datetime.date.fromisoformat(nxt)
+                continue
+
+        stored = dict(store.iter_days(db, user_id, lo, hi))
+        reasons = {
+            r["date"]: r["reason"] or ""
+            for r in db.execute(
+                "SELECT date, reason FROM day_reason WHERE user_id=? AND date>=? AND date<=?", (user_id, lo, hi)
+            )
+        }
+        for d in range(day.day, until.day + 1):
+            iso = day.replace(day=d).isoformat()
+            recorded = stored.get(iso, {})
+            reason = reasons.get(iso, "")
+            bit = 1 << (d - 1)
+            slots = [(h, recorded.get(h["id"])) for h, mask in zip(habits, masks) if mask & bit or h["id"] in recorded]
+            if slots or (reason_days and reason):
+                yield iso, slots, reason
+        if until == last:
+            return
+        day = until + datetime.timedelta(days=1)
+
+
+def page(db, store, user_id, habits, start, end, after=None, limit=PAGE_SIZE, reason_days=True):
+    """The days of iter_days() after `after` (ISO, exclusive) up to about
+    `limit` slots, always whole days (a day without slots counts as one).
+
+    Returns (days, last): `last` is the date to pass as `after` for the next
+    page, or None when the range is exhausted.
+    """
+    if after is not None:
+        start = max(start, (datetime.date.fromisoformat(after) + datetime.timedelta(days=1)).isoformat())
+    days, n = [], 0
+    for day in iter_days(db, store, user_id, habits, start, end, reason_days):
+        days.append(day)
+        n += len(day[1]) or 1
+        if n >= limit:
+            return days, day[0] if day[0] < end else None
+    return days, None
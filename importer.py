@@ -0,0 +1,211 @@
+"""Bulk import of habit history in the export layout.
+
+Files have the columns export_excel() writes (Habit, Frequency, Date,
+Completed, Day Reason; Day Reason may be left out) and are read one row at a
+time, CSV through the csv module and XLSX through a read-only workbook.
+Valid rows are written through the storage backend in batches, one
+transaction each: a habit is matched by name and frequency and created when
+missing, each row sets its slot the way /update_completions would, and
+non-empty reasons replace the day's reason. Rows that cannot be parsed are
+reported by row number and skipped.
+
+Functions take an open connection (row_factory=sqlite3.Row) and commit once
+per batch; derived data (aggregates, rollups, page cache) is left to the
+caller, using the habit ids and months in the summary.
+"""
+import csv, datetime, functools, io, zipfile
+
+from schedule import FREQUENCIES, is_slot
+
+BATCH = 20000
+MAX_ERRORS = 100
+
+_TRUE = {"yes", "y", "true", "1", "x", "done"}
+_FALSE = {"no", "n", "false", "0", ""}
+# Exact cell values seen in exports, checked before normalizing
+_FLAGS = {"Yes": 1, "No": 0, None: 0, "": 0, True: 1, False: 0, 1: 1, 0: 0}
+_READ_ERRORS = (csv.Error, UnicodeDecodeError, zipfile.BadZipFile, KeyError)
+
+
+class BadImportFile(Exception):
+    pass
+
+
+def read_rows(fileobj, fmt):
+    """Rows of the binary file `fileobj` ("csv" or "xlsx") as lists of cell values."""
+    if fmt == "csv":
+        yield from csv.reader(io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline=""))
+        return
+    from openpyxl import load_workbook  # imported on the first XLSX file, not at startup
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        wb = load_workbook(fileobj, read_only=True, data_only=True)
+    except InvalidFileException as e:
+        raise BadImportFile(f"Not a readable file ({type(e).__name__})") from None
+    try:
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        wb.close()
+
+
+def _columns(first, header):
+    """Index of each `header` column in the file's header row."""
+    names = [str(c).strip().lower() if c is not None else "" for c in first]
+    cols = {}
+    for name in header:
+        if name.lower() in names:
+            cols[name] = names.index(name.lower())
+        elif name != header[-1]:  # the reason column is optional
+            raise BadImportFile(f"Missing column: {name}")
+    return [cols.get(name) for name in header]
+
+
+@functools.lru_cache(maxsize=4096)
+def _iso_date(text):
+    """(date, iso) of a YYYY-MM-DD cell; files repeat each date once per habit."""
+    date = datetime.date.fromisoformat(text.strip())
+    return date, date.isoformat()
+
+
+def _date(value):
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    if isinstance(value, datetime.date):
+        return value, value.isoformat()
+    return _iso_date(str(value))
+
+
+@functools.lru_cache(maxsize=1024)
+def _habit_key(name, freq):
+    name = "" if name is None else str(name).strip()
+    if not name:
+        raise ValueError("Habit is empty")
+    freq = "" if freq is None else str(freq).strip().lower()
+    if freq not in FREQUENCIES:
+        raise ValueError(f"Frequency must be one of {', '.join(FREQUENCIES)}")
+    return name, freq
+
+
+def _completed(value):
+    flag = _FLAGS.get(value)
+    if flag is not None:
+        return flag
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return 1
+    if text in _FALSE:
+        return 0
+    raise ValueError(f"Completed must be Yes or No, not {value!r}")
+
+
+def _parse(raw, cols):
+    """((name, frequency), date, iso, completed, reason) of one row; ValueError if invalid."""
+    n = len(raw)
+    name, freq, date, done, reason = (raw[i] if i is not None and i < n else None for i in cols)
+    key = _habit_key(name, freq)
+    try:
+        date, iso = _date(date)
+    except (TypeError, ValueError):
+        raise ValueError("Date must be YYYY-MM-DD") from None
+    reason = "" if reason is None else str(reason).strip()
+    return key, date, iso, _completed(done), reason
+
+
+def import_rows(db, store, user_id, rows, header, batch=BATCH):
+    """Import `rows` (header row first, as from read_rows) for a user.
+
+    Returns a summary dict: rows (data rows read), imported, reasons,
+    habits_created, error_count, errors (the first MAX_ERRORS as
+    {row, error}), habit_ids and months ("YYYY-MM") written to, and "error"
+    if the file broke off part way (earlier batches stay imported). Raises
+    BadImportFile when the header cannot be read.
+    """
+    rows = iter(rows)
+    try:
+        first = next(rows, None)
+    except _READ_ERRORS as e:
+        raise BadImportFile(f"Not a readable file ({type(e).__name__})") from None
+    if first is None:
+        raise BadImportFile("The file is empty")
+    cols = _columns(first, header)
+
+    habits = {}
+    for h in db.execute(
+        "SELECT id, name, frequency, created_on FROM habit WHERE user_id=? ORDER BY id DESC", (user_id,)
+    ):
+        habits[h["name"], h["frequency"]] = dict(h)  # the oldest of same-named habits wins
+
+    summary = {
+        "rows": 0, "imported": 0, "reasons": 0, "habits_created": 0,
+        "error_count": 0, "errors": [], "habit_ids": set(), "months": set(),
+    }
+    created = set()
+    pending = []
+    row_no = 1
+    try:
+        for row_no, raw in enumerate(rows, 2):
+            if not any(raw):
+                continue
+            summary["rows"] += 1
+            try:
+                pending.append(_parse(raw, cols))
+            except ValueError as e:
+                summary["error_count"] += 1
+                if len(summary["errors"]) < MAX_ERRORS:
+                    summary["errors"].append({"row": row_no, "error": str(e)})
+                continue
+            if len(pending) >= batch:
+                _write_batch(db, store, user_id, habits, created, pending, summary)
+                pending = []
+    except _READ_ERRORS as e:
+        summary["error"] = f"Could not read past row {row_no} ({type(e).__name__})"
+    _write_batch(db, store, user_id, habits, created, pending, summary)
+    return summary
+
+
+def _write_batch(db, store, user_id, habits, created, parsed, summary):
+    if not parsed:
+        return
+    slots, dates, reasons, moved = {}, {}, {}, {}
+    for key, date, iso, completed, reason in parsed:
+        h = habits.get(key)
+        if h is None:
+            # Imported habits start at their earliest imported day
+            name, freq = key
+            cur = db.execute(
+                "INSERT INTO habit (user_id,name,frequency,created_on) VALUES (?,?,?,?)",
+                (user_id, name, freq, iso)
+            )
+            h = habits[key] = {"id": cur.lastrowid, "name": name, "frequency": freq, "created_on": iso}
+            created.add(h["id"])
+            summary["habits_created"] += 1
+        elif h["id"] in created and iso < h["created_on"]:
+            h["created_on"] = moved[h["id"]] = iso
+        slots[h["id"], iso] = completed
+        dates[iso] = date
+        if reason:
+            reasons[iso] = reason
+
+    db.executemany("UPDATE habit SET created_on=? WHERE id=?", [(iso, hid) for hid, iso in moved.items()])
+
+    by_id = {h["id"]: h for h in habits.values()}
+    done, missed, cleared = [], [], []
+    for key, completed in slots.items():
+        # Same rules as a toggle, except that a "No" on a day off the
+        # schedule is kept: the exported slot was an explicit miss.
+        hid, iso = key
+        (done if completed else cleared if is_slot(by_id[hid], dates[iso]) else missed).append(key)
+    store.write(db, by_id, done, missed, cleared)
+
+    db.executemany("""
+        INSERT INTO day_reason (user_id,date,reason) VALUES (?,?,?)
+        ON CONFLICT(user_id,date) DO UPDATE SET reason=excluded.reason
+    """, [(user_id, iso, reason) for iso, reason in reasons.items()])
+    db.commit()
+
+    summary["imported"] += len(slots)
+    summary["reasons"] += len(reasons)
+    summary["habit_ids"].update(hid for hid, _ in slots)
+    summary["months"].update(iso[:7] for iso in dates)
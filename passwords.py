@@ -0,0 +1,109 @@
+"""Password hashing off the request threads.
+
+Hashes are made and checked with werkzeug.security in a small process pool,
+so a burst of sign-ins costs at most `workers` CPUs and the threads serving
+other routes keep theirs. At most `max_pending` hashes may wait for the pool;
+past that, hash() and verify() raise HashingBusy at once instead of queueing
+requests behind each other; a hash holds its place until it finishes, even
+when the caller gave up waiting. A pool whose worker died is replaced, and
+the hashes it dropped raise HashingBusy. workers=0 hashes inline on the
+calling thread.
+
+`method` is anything generate_password_hash() accepts ("scrypt",
+"scrypt:32768:8:1", "pbkdf2:sha256:600000", ...). Hashes made with other
+parameters still verify; needs_rehash() tells the caller to replace them.
+"""
+import logging, multiprocessing, os, threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+log = logging.getLogger(__name__)
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def method_prefix(method):
+    """The "method:params" part werkzeug stores in front of hashes made with
+    `method`, defaults filled in as generate_password_hash() does."""
+    name, *args = method.split(":")
+    if name == "scrypt" and len(args) in (0, 3):
+        n, r, p = map(int, args) if args else (2**15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == "pbkdf2" and len(args) <= 2:
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Invalid hash method {method!r}")
+
+
+class PasswordHasher:
+    def __init__(self, method="scrypt", workers=2, max_pending=32, timeout=30):
+        method_prefix(method)  # fail at startup, not at the first sign-in
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._pid = None
+
+    def _pool(self):
+        # Pools do not survive a fork; start a fresh one in each worker.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # Spawned children start clean: they import this module and
+                # re-import the __main__ module (app.py under `python app.py`),
+                # which only defines things, but no forked app state.
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard(self, pool):
+        """Drop a broken pool; the next hash starts a new one."""
+        with self._lock:
+            if self._executor is pool:
+                self._executor = None
+        log.warning("password hashing pool broke; starting a new one")
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        pool = None
+        try:
+            pool = self._pool()
+            future = pool.submit(fn, *args)
+        except BaseException as e:
+            self._slots.release()
+            if isinstance(e, BrokenProcessPool):
+                self._discard(pool)
+                raise HashingBusy() from None
+            raise
+        # Freed when the hash finishes, not when the caller stops waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            raise HashingBusy() from None
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise HashingBusy() from None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored, password):
+        return self._run(check_password_hash, stored, password)
+
+    def needs_rehash(self, stored):
+        """Whether `stored` was made with other parameters than `method`."""
+        return stored.split("$", 1)[0] != method_prefix(self.method)
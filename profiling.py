@@ -0,0 +1,156 @@
+"""Opt-in request profiling: SQL statements, SQL time and rows per request,
+plus per-route latency histograms.
+
+Connections opened with ProfiledConnection report every statement and fetch
+to the stats of the request running on the current thread (see
+begin_request/end_request). The app only opens these connections and
+registers its request hooks when profiling is switched on, so there is no
+cost when it is off.
+"""
+import sqlite3, threading, time
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open.
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_local = threading.local()
+
+
+class RequestStats:
+    __slots__ = ("queries", "sql_ms", "rows")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.rows = 0
+
+
+def begin_request():
+    _local.stats = RequestStats()
+    return _local.stats
+
+
+def end_request():
+    stats = getattr(_local, "stats", None)
+    _local.stats = None
+    return stats
+
+
+def _record(started, queries=0, rows=0):
+    stats = getattr(_local, "stats", None)
+    if stats is not None:
+        stats.sql_ms += (time.perf_counter() - started) * 1000
+        stats.queries += queries
+        stats.rows += rows
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record(t0, queries=1)
+
+    def executemany(self, sql, seq_of_parameters):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record(t0, queries=1)
+
+    def executescript(self, sql_script):
+        t0 = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _record(t0, queries=1)
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        _record(t0, rows=row is not None)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(*args, **kwargs)
+        _record(t0, rows=len(rows))
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        _record(t0, rows=len(rows))
+        return rows
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        row = super().__next__()
+        _record(t0, rows=1)
+        return row
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements go through ProfiledCursor."""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+class RouteMetrics:
+    """Thread-safe per-route latency histograms and SQL totals."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, wall_ms, stats=None):
+        with self._lock:
+            r = self._routes.get(route)
+            if r is None:
+                r = self._routes[route] = {
+                    "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "buckets": [0] * (len(BUCKETS_MS) + 1),
+                    "queries": 0, "sql_ms": 0.0, "rows": 0,
+                }
+            r["count"] += 1
+            r["total_ms"] += wall_ms
+            r["max_ms"] = max(r["max_ms"], wall_ms)
+            i = 0
+            while i < len(BUCKETS_MS) and wall_ms > BUCKETS_MS[i]:
+                i += 1
+            r["buckets"][i] += 1
+            if stats is not None:
+                r["queries"] += stats.queries
+                r["sql_ms"] += stats.sql_ms
+                r["rows"] += stats.rows
+
+    def snapshot(self):
+        labels = [f"<={b}ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        with self._lock:
+            out = {}
+            for route, r in sorted(self._routes.items()):
+                n = r["count"]
+                out[route] = {
+                    "count": n,
+                    "avg_ms": round(r["total_ms"] / n, 2),
+                    "max_ms": round(r["max_ms"], 2),
+                    "histogram": [[label, c] for label, c in zip(labels, r["buckets"])],
+                    "avg_queries": round(r["queries"] / n, 1),
+                    "avg_sql_ms": round(r["sql_ms"] / n, 2),
+                    "avg_rows": round(r["rows"] / n, 1),
+                }
+            return out
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
@@ -0,0 +1,140 @@
+"""Per-user daily rollups (the user_day_rollup table).
+
+One row per user and day that has slots or a reason: how many habit slots
+the day had (scheduled), how many of them were completed (done) and whether
+the user left a reason. Period percentages and the missed-day list read
+these rows, at most 366 per year, instead of every habit's slots.
+
+Rows exist up to a per-user horizon (user_rollup_state.through) that readers
+extend with ensure(); writers refresh the days they touch at or before it.
+Removing a habit rewrites the past, so it reset()s the user's rows, which
+are then rebuilt on the next read.
+
+Functions take an open connection (row_factory=sqlite3.Row) and the storage
+backend (storage.py), and never commit.
+"""
+import datetime
+
+from history import first_day
+
+
+def horizon(db, user_id):
+    """Last day (ISO) covered by the user's rows, or None."""
+    row = db.execute("SELECT through FROM user_rollup_state WHERE user_id=?", (user_id,)).fetchone()
+    return row["through"] if row else None
+
+
+def _habits(db, user_id):
+    return db.execute("SELECT id, frequency, created_on FROM habit WHERE user_id=?", (user_id,)).fetchall()
+
+
+def compute_days(db, store, user_id, start, end, habits=None):
+    """{iso_date: (scheduled, done, has_reason)} for the days in [start, end] (ISO
+    strings) that have slots or a reason, from the stored data."""
+    habits = _habits(db, user_id) if habits is None else habits
+    days = {}
+    month = datetime.date.fromisoformat(start).replace(day=1)
+    while month.isoformat() <= end:
+        for s in store.month_slots(db, user_id, habits, month):
+            if start <= s["date"] <= end:
+                c = days.setdefault(s["date"], [0, 0, 0])
+                c[0] += 1
+                c[1] += s["completed"] == 1
+        month = (month + datetime.timedelta(days=32)).replace(day=1)
+    for r in db.execute("""
+        SELECT date FROM day_reason
+        WHERE user_id=? AND date>=? AND date<=? AND TRIM(COALESCE(reason, '')) != ''
+    """, (user_id, start, end)):
+        days.setdefault(r["date"], [0, 0, 0])[2] = 1
+    return {iso: tuple(c) for iso, c in days.items()}
+
+
+def _write(db, user_id, dates, days):
+    db.executemany("DELETE FROM user_day_rollup WHERE user_id=? AND date=?", [(user_id, d) for d in dates])
+    db.executemany(
+        "INSERT INTO user_day_rollup (user_id,date,scheduled,done,has_reason) VALUES (?,?,?,?,?)",
+        [(user_id, iso, *days[iso]) for iso in sorted(days)]
+    )
+
+
+def ensure(db, store, user_id, until):
+    """Extend the user's rows through `until` (a date). Returns True if it wrote."""
+    until = until.isoformat()
+    through = horizon(db, user_id)
+    if through is not None and through >= until:
+        return False
+    if through is None:
+        db.execute("DELETE FROM user_day_rollup WHERE user_id=?", (user_id,))
+        start = first_day(db, store, user_id)
+    else:
+        start = (datetime.date.fromisoformat(through) + datetime.timedelta(days=1)).isoformat()
+    if start is not None and start <= until:
+        days = compute_days(db, store, user_id, start, until)
+        _write(db, user_id, [], days)
+    db.execute("""
+        INSERT INTO user_rollup_state (user_id,through) VALUES (?,?)
+        ON CONFLICT(user_id) DO UPDATE SET through=excluded.through
+    """, (user_id, until))
+    return True
+
+
+def refresh(db, store, user_id, dates):
+    """Recompute the rows of `dates` (ISO) that are within the user's horizon."""
+    through = horizon(db, user_id)
+    dates = sorted({d for d in dates if through is not None and d <= through})
+    if not dates:
+        return
+    habits = _habits(db, user_id)
+    days = {}
+    for month in sorted({d[:7] for d in dates}):
+        in_month = [d for d in dates if d.startswith(month)]
+        computed = compute_days(db, store, user_id, in_month[0], in_month[-1], habits)
+        days.update((d, computed[d]) for d in in_month if d in computed)
+    _write(db, user_id, dates, days)
+
+
+def refresh_from(db, store, user_id, date):
+    """Recompute every row from `date` (a date) to the horizon."""
+    through = horizon(db, user_id)
+    start = date.isoformat()
+    if through is None or start > through:
+        return
+    days = compute_days(db, store, user_id, start, through)
+    db.execute("DELETE FROM user_day_rollup WHERE user_id=? AND date>=?", (user_id, start))
+    _write(db, user_id, [], days)
+
+
+def reset(db, user_id):
+    """Drop the user's rows; the next ensure() rebuilds them."""
+    db.execute("DELETE FROM user_day_rollup WHERE user_id=?", (user_id,))
+    db.execute("DELETE FROM user_rollup_state WHERE user_id=?", (user_id,))
+
+
+def totals(db, user_id, start, end):
+    """(scheduled, done) summed over [start, end] (dates); ensure() it first."""
+    row = db.execute("""
+        SELECT COALESCE(SUM(scheduled), 0) AS scheduled, COALESCE(SUM(done), 0) AS done
+        FROM user_day_rollup WHERE user_id=? AND date>=? AND date<=?
+    """, (user_id, start.isoformat(), end.isoformat())).fetchone()
+    return row["scheduled"], row["done"]
+
+
+def check(db, store, user_id):
+    """[(iso_date, stored, expected)] for rows within the horizon that disagree with the raw data."""
+    through = horizon(db, user_id)
+    if through is None:
+        return []
+    stored = {
+        r["date"]: (r["scheduled"], r["done"], r["has_reason"])
+        for r in db.execute(
+            "SELECT date, scheduled, done, has_reason FROM user_day_rollup WHERE user_id=? AND date<=?",
+            (user_id, through)
+        )
+    }
+    start = min([*stored, first_day(db, store, user_id) or through])
+    expected = compute_days(db, store, user_id, start, through)
+    return [
+        (d, stored.get(d), expected.get(d))
+        for d in sorted(set(stored) | set(expected))
+        if stored.get(d) != expected.get(d)
+    ]
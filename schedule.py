@@ -0,0 +1,126 @@
+"""Habit scheduling rules.
+
+A habit is due on the days its frequency selects, from its created_on date
+onward. These slots are computed, not stored: habit_entry only holds what the
+user recorded (completions, and misses on days off the schedule). Readers
+merge the two.
+
+The rule exists in three forms that must agree: per month as a day bitmask
+(frequency_mask, memoized, which is_scheduled and month_mask read), as NumPy
+day arrays for the analytics engine (scheduled_ordinals) and as an SQL
+expression (slot_sql).
+
+"Today" depends on where the user is: local_today() resolves it in an IANA
+time zone, falling back to the server's local date.
+"""
+import calendar
+import datetime
+import functools
+import logging
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+
+FREQUENCIES = ("daily", "weekly", "monthly")
+
+log = logging.getLogger(__name__)
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_SATURDAY = 5
+
+
+@functools.lru_cache(maxsize=4096)
+def frequency_mask(frequency, year, month):
+    """Bit d-1 set for every day d of the month that `frequency` selects:
+    daily every day, weekly on Saturdays, monthly on the 2nd last day."""
+    first_weekday, days = calendar.monthrange(year, month)
+    if frequency == "daily":
+        return (1 << days) - 1
+    if frequency == "weekly":
+        mask = 0
+        for d in range((_SATURDAY - first_weekday) % 7 + 1, days + 1, 7):
+            mask |= 1 << (d - 1)
+        return mask
+    if frequency == "monthly":
+        return 1 << (days - 2)
+    return 0
+
+
+def is_scheduled(frequency, date):
+    """True when `frequency` selects `date` (see frequency_mask)."""
+    return bool(frequency_mask(frequency, date.year, date.month) >> (date.day - 1) & 1)
+
+
+def is_slot(habit, date):
+    """True when `habit` (a row with frequency and created_on) is due on `date`."""
+    created = habit["created_on"]
+    return bool(created) and date.isoformat() >= created and is_scheduled(habit["frequency"], date)
+
+
+def month_mask(habit, month):
+    """Bit d-1 set for every day d of `month` on which `habit` is due."""
+    created = habit["created_on"]
+    key = f"{month.year:04d}-{month.month:02d}"
+    if not created or created[:7] > key:
+        return 0
+    mask = frequency_mask(habit["frequency"], month.year, month.month)
+    if created[:7] == key:
+        mask &= -1 << (int(created[8:10]) - 1)  # from the creation day on
+    return mask
+
+
+@functools.lru_cache(maxsize=256)
+def zone(name):
+    """ZoneInfo for an IANA time zone name, or None when it is empty or unknown.
+
+    Unknown names are logged (once each): callers fall back to the server's
+    date, and a host without a zone database (no tzdata) knows no names.
+    """
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        log.warning("unknown time zone %r, using the server's local date", name)
+        return None
+
+
+def local_today(tz=None):
+    """The current date in time zone `tz` (a name); the server's date when
+    `tz` is None or unknown."""
+    z = zone(tz)
+    return datetime.datetime.now(z).date() if z else datetime.date.today()
+
+
+def local_date(timestamp, tz=None):
+    """The date of Unix time `timestamp` in time zone `tz` (a name); in the
+    server's time zone when `tz` is None or unknown."""
+    return datetime.datetime.fromtimestamp(timestamp, zone(tz)).date()
+
+
+def scheduled_ordinals(frequency, start, end):
+    """date.toordinal() of every scheduled day in [start, end], ascending."""
+    lo, hi = start.toordinal(), end.toordinal()
+    if hi < lo or frequency not in FREQUENCIES:
+        return np.empty(0, dtype=np.int64)
+    if frequency == "daily":
+        return np.arange(lo, hi + 1, dtype=np.int64)
+    if frequency == "weekly":
+        # date(1, 1, 1) has ordinal 1 and is a Monday
+        first = lo + (_SATURDAY - (lo - 1) % 7) % 7
+        return np.arange(first, hi + 1, 7, dtype=np.int64)
+    months = np.arange(np.datetime64(start.isoformat()[:7]), np.datetime64(end.isoformat()[:7]) + 1)
+    days = ((months + 1).astype("datetime64[D]") - 2).astype(np.int64) + _EPOCH_ORDINAL
+    return days[(days >= lo) & (days <= hi)]
+
+
+def slot_sql(habit="h", date="he.date"):
+    """SQL condition: habit table alias `habit` is due on the date expression `date`."""
+    return f"""(
+        {habit}.created_on <= {date} AND (
+            {habit}.frequency = 'daily'
+            OR ({habit}.frequency = 'weekly' AND strftime('%w', {date}) = '6')
+            OR ({habit}.frequency = 'monthly'
+                AND {date} = date({date}, 'start of month', '+1 month', '-2 days'))
+        )
+    )"""
@@ -0,0 +1,133 @@
+"""Spreading users' data over several SQLite files.
+
+The DATABASE file is the catalog: it holds the user table and user_shard,
+which maps each user to the shard file with their habits, entries, reasons
+and everything derived from them. Users without a mapping keep their data in
+the catalog file itself, which is where all data lives when sharding is off.
+
+Shards are named "shard-<n>" (SHARD_COUNT files, users placed by id modulo
+the count) or "user-<id>" (SHARD_PER_USER, one file each). New users are
+mapped when they register; move_user() and `flask rebalance-shards` move
+existing users to where the current settings place them.
+
+Functions take open connections (row_factory=sqlite3.Row) and never commit.
+"""
+import os
+
+# Tables with a user_id column, copied as they are
+USER_TABLES = ("day_reason", "cache_generation", "export_job", "user_day_rollup", "user_rollup_state")
+# Tables keyed by habit id, copied with the habit ids of the target file.
+# habit_aggregate is left behind: it is recomputed on the next read.
+HABIT_TABLES = ("habit_entry", "habit_month")
+
+
+class ShardRouter:
+    def __init__(self, catalog, directory, count=0, per_user=False):
+        self.catalog = catalog
+        self.directory = directory
+        self.count = count
+        self.per_user = per_user
+        self._shards = {}  # user_id -> shard name; mappings only change offline
+
+    @property
+    def enabled(self):
+        return self.per_user or self.count > 0
+
+    def target(self, user_id):
+        """Shard the current settings place a user in (None: the catalog file)."""
+        if self.per_user:
+            return f"user-{user_id}"
+        if self.count:
+            return f"shard-{user_id % self.count}"
+        return None
+
+    def path(self, shard):
+        return self.catalog if shard is None else os.path.join(self.directory, f"{shard}.db")
+
+    def shard_of(self, catalog_db, user_id):
+        """Shard holding a user's data now (None: the catalog file)."""
+        if user_id not in self._shards:
+            row = catalog_db.execute("SELECT shard FROM user_shard WHERE user_id=?", (user_id,)).fetchone()
+            self._shards[user_id] = row["shard"] if row else None
+        return self._shards[user_id]
+
+    def assign(self, catalog_db, user_id):
+        """Map a new user to their target shard."""
+        self.set_shard(catalog_db, user_id, self.target(user_id))
+
+    def set_shard(self, catalog_db, user_id, shard):
+        if shard is None:
+            catalog_db.execute("DELETE FROM user_shard WHERE user_id=?", (user_id,))
+        else:
+            catalog_db.execute("""
+                INSERT INTO user_shard (user_id,shard) VALUES (?,?)
+                ON CONFLICT(user_id) DO UPDATE SET shard=excluded.shard
+            """, (user_id, shard))
+        self._shards[user_id] = shard
+
+    def users(self, catalog_db, shard):
+        """Ids of the users whose data is in `shard`."""
+        if shard is None:
+            sql, params = "SELECT id FROM user WHERE id NOT IN (SELECT user_id FROM user_shard) ORDER BY id", ()
+        else:
+            sql, params = "SELECT user_id AS id FROM user_shard WHERE shard=? ORDER BY user_id", (shard,)
+        return [r["id"] for r in catalog_db.execute(sql, params)]
+
+    def shards(self, catalog_db):
+        """Every shard in use, the catalog file (None) first."""
+        return [None] + [r["shard"] for r in catalog_db.execute("SELECT DISTINCT shard FROM user_shard ORDER BY shard")]
+
+
+def delete_user_data(db, user_id):
+    """Remove everything stored for a user from one file."""
+    habits = f"SELECT id FROM habit WHERE user_id={int(user_id)}"
+    for table in (*HABIT_TABLES, "habit_aggregate"):
+        db.execute(f"DELETE FROM {table} WHERE habit_id IN ({habits})")
+    db.execute("DELETE FROM habit WHERE user_id=?", (user_id,))
+    for table in USER_TABLES:
+        db.execute(f"DELETE FROM {table} WHERE user_id=?", (user_id,))
+
+
+def stored_users(db):
+    """Ids of the users with any data in one file."""
+    union = " UNION ".join(f"SELECT user_id FROM {t}" for t in ("habit", *USER_TABLES))
+    return {r[0] for r in db.execute(union)}
+
+
+def _copy(dst, table, rows, skip=(), **override):
+    rows = list(rows)
+    if not rows:
+        return 0
+    cols = [c for c in rows[0].keys() if c not in skip]
+    dst.executemany(
+        f"INSERT INTO {table} ({','.join(cols)}) VALUES ({','.join('?' * len(cols))})",
+        [[override[c](r[c]) if c in override else r[c] for c in cols] for r in rows]
+    )
+    return len(rows)
+
+
+def move_user(src, dst, user_id):
+    """Copy a user's data from `src` into `dst`, replacing whatever `dst` had.
+
+    Habits get new ids in `dst`. Returns the number of rows copied. The
+    caller commits `dst`, remaps the user, then deletes from `src`.
+    """
+    delete_user_data(dst, user_id)
+    ids = {}
+    for h in src.execute("SELECT * FROM habit WHERE user_id=? ORDER BY id", (user_id,)).fetchall():
+        cur = dst.execute(
+            "INSERT INTO habit (user_id,name,frequency,created_on) VALUES (?,?,?,?)",
+            (user_id, h["name"], h["frequency"], h["created_on"])
+        )
+        ids[h["id"]] = cur.lastrowid
+    n = len(ids)
+    for table in HABIT_TABLES:
+        n += _copy(dst, table, src.execute(
+            f"SELECT * FROM {table} WHERE habit_id IN (SELECT id FROM habit WHERE user_id=?)", (user_id,)
+        ), skip=("id",), habit_id=ids.__getitem__)
+    for table in USER_TABLES:
+        n += _copy(dst, table, src.execute(f"SELECT * FROM {table} WHERE user_id=?", (user_id,)))
+    # Habit ids changed, so nothing cached under the old generations may be reused
+    dst.execute("UPDATE cache_generation SET gen=gen+1 WHERE user_id=?", (user_id,))
+    dst.execute("INSERT OR IGNORE INTO cache_generation (user_id,scope,gen) VALUES (?,'habits',1)", (user_id,))
+    return n
@@ -0,0 +1,475 @@
+"""Storage layouts for what users record about their habit slots.
+
+"rows" (the default) keeps one habit_entry row per recorded day. "bitset"
+keeps one habit_month row per habit and month (month as the integer YYYYMM)
+with two 31-bit masks, bit d-1 standing for day d:
+
+    done_mask   completed days
+    sched_mask  the month's slots: the habit's schedule plus any day
+                recorded off the schedule (an explicit miss)
+
+A month without a habit_month row has no completions and exactly the
+computed schedule (schedule.month_mask), so rows are only written with the
+first completion of a month. Both layouts answer the same questions through
+the same methods; routes read and write through get_backend(STORAGE), and
+convert() moves existing data from one layout to the other.
+
+Methods take an open connection (row_factory=sqlite3.Row) and never commit.
+"""
+import abc, datetime, itertools
+
+import numpy as np
+
+from analytics import entry_missed_sql, habit_metrics, load_entry_arrays, load_habit_schedules, merge_slots
+from schedule import month_mask, slot_sql
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_BITS = np.arange(31, dtype=np.int64)
+
+
+def iter_batched(cur, size=1000):
+    """Rows of `cur`, fetched `size` at a time."""
+    while True:
+        batch = cur.fetchmany(size)
+        if not batch:
+            break
+        yield from batch
+
+
+def _month_bounds(month):
+    first = month.replace(day=1)
+    return first, (first + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+
+
+class Storage(abc.ABC):
+    """What every layout answers; habit_metrics() and slot_arrays() are built on entry_arrays()."""
+
+    name = None
+
+    @abc.abstractmethod
+    def month_slots(self, db, user_id, habits, month):
+        """Every slot of `habits` in `month`, ordered by date, then habit id."""
+
+    @abc.abstractmethod
+    def entry_arrays(self, db, user_id=None, habit_id=None, since=None, until=None):
+        """Recorded days as (habit_ids, day ordinals, completed) arrays, as load_entry_arrays() returns them."""
+
+    @abc.abstractmethod
+    def iter_days(self, db, user_id, start, end):
+        """(iso_date, {habit_id: completed}) for each day in [start, end] with
+        recorded slots, ascending. The window is read at once: keep it short."""
+
+    @abc.abstractmethod
+    def first_date(self, db, user_id):
+        """The user's earliest recorded ISO date, or None."""
+
+    @abc.abstractmethod
+    def next_date(self, db, user_id, since):
+        """An ISO date on or after `since` (ISO) and at or before the next
+        recorded day (nothing is recorded in between), or None when nothing is."""
+
+    @abc.abstractmethod
+    def recorded(self, db, habit_ids, dates):
+        """The (habit_id, iso_date) pairs among `habit_ids` x `dates` that have something recorded."""
+
+    @abc.abstractmethod
+    def write(self, db, habits, done, missed, cleared):
+        """Record (habit_id, iso_date) slots as completed, explicit misses or cleared."""
+
+    @abc.abstractmethod
+    def entry_slot(self, db, user_id, entry_id):
+        """The (habit_id, iso_date) of a stored entry id of the user's, or None."""
+
+    @abc.abstractmethod
+    def delete_from(self, db, habit_id, date):
+        """Forget what was recorded for `habit_id` on or after `date`."""
+
+    @staticmethod
+    @abc.abstractmethod
+    def missed_sql(habit="h", date="dr.date"):
+        """(join, condition) SQL telling whether `habit` missed `date`."""
+
+    def habit_metrics(self, db, today, user_id=None, habit_id=None, since=None):
+        """analytics.habit_metrics() over recorded days and computed slots up to `today`."""
+        arrays = self.entry_arrays(db, user_id, habit_id, since, until=today)
+        habits = load_habit_schedules(db, user_id, habit_id)
+        return habit_metrics(*merge_slots(*arrays, habits, today, since), today)
+
+    def slot_arrays(self, db, habit, since, until):
+        """(day ordinals, completed) of every slot of `habit` in [since, until],
+        recorded or computed, ascending; since=None reads from the beginning."""
+        arrays = self.entry_arrays(db, habit_id=habit["id"], since=since, until=until)
+        _, days, completed = merge_slots(*arrays, [habit], until, since)
+        return days, completed
+
+
+class RowStorage(Storage):
+    """One habit_entry row per recorded (habit, day)."""
+
+    name = "rows"
+
+    def month_slots(self, db, user_id, habits, month):
+        """Every slot of `habits` in `month`, ordered by date, then habit id.
+
+        Dicts with id (None when nothing is stored), habit_id, date and
+        completed. Stored entries come from one range query.
+        """
+        first, last = _month_bounds(month)
+        stored = {
+            (r["habit_id"], r["date"]): r
+            for r in db.execute("""
+                SELECT id, habit_id, date, completed
+                FROM habit_entry
+                WHERE habit_id IN (SELECT id FROM habit WHERE user_id=?) AND date>=? AND date<=?
+            """, (user_id, first.isoformat(), last.isoformat()))
+        }
+
+        habits = sorted(habits, key=lambda h: h["id"])
+        masks = [month_mask(h, first) for h in habits]
+        slots = []
+        for d in range(1, last.day + 1):
+            iso = first.replace(day=d).isoformat()
+            for h, mask in zip(habits, masks):
+                e = stored.get((h["id"], iso))
+                if e is None and not mask >> (d - 1) & 1:
+                    continue
+                slots.append({
+                    "id": e["id"] if e else None,
+                    "habit_id": h["id"],
+                    "date": iso,
+                    "completed": e["completed"] if e else 0,
+                })
+        return slots
+
+    def entry_arrays(self, db, user_id=None, habit_id=None, since=None, until=None):
+        """Recorded days as (habit_ids, day ordinals, completed) arrays; see load_entry_arrays."""
+        return load_entry_arrays(db, user_id, habit_id, since, until)
+
+    def iter_days(self, db, user_id, start, end):
+        """(iso_date, {habit_id: completed}) for each day in [start, end] with recorded slots.
+
+        Rows come in (habit, date) order, straight off the covering index
+        (no sort), and are grouped by date here.
+        """
+        days = {}
+        for r in db.execute("""
+            SELECT he.habit_id, he.date, he.completed
+            FROM habit h
+            JOIN habit_entry he ON he.habit_id = h.id
+            WHERE h.user_id=? AND he.date>=? AND he.date<=?
+            ORDER BY h.id, he.date
+        """, (user_id, start, end)):
+            days.setdefault(r["date"], {})[r["habit_id"]] = r["completed"]
+        for iso in sorted(days):
+            yield iso, days[iso]
+
+    def first_date(self, db, user_id):
+        return db.execute(
+            "SELECT MIN(date) FROM habit_entry WHERE habit_id IN (SELECT id FROM habit WHERE user_id=?)",
+            (user_id,)
+        ).fetchone()[0]
+
+    def next_date(self, db, user_id, since):
+        """The next recorded day on or after `since`: one index seek per habit."""
+        return db.execute("""
+            SELECT MIN((SELECT date FROM habit_entry WHERE habit_id = h.id AND date>=? ORDER BY date LIMIT 1))
+            FROM habit h WHERE h.user_id=?
+        """, (since, user_id)).fetchone()[0]
+
+    def recorded(self, db, habit_ids, dates):
+        """The (habit_id, iso_date) pairs among `habit_ids` x `dates` that have something recorded."""
+        if not habit_ids or not dates:
+            return set()
+        return {
+            (r["habit_id"], r["date"])
+            for r in db.execute(f"""
+                SELECT habit_id, date FROM habit_entry
+                WHERE habit_id IN ({",".join("?" * len(habit_ids))})
+                  AND date IN ({",".join("?" * len(dates))})
+            """, [*habit_ids, *dates])
+        }
+
+    def write(self, db, habits, done, missed, cleared):
+        """Record (habit_id, iso_date) slots as completed, as explicit misses,
+        or clear them back to the computed default. `habits` maps id -> row."""
+        upsert = """
+            INSERT INTO habit_entry (habit_id,date,completed) VALUES (?,?,?)
+            ON CONFLICT(habit_id,date) DO UPDATE SET completed=excluded.completed
+        """
+        db.executemany(upsert, [(hid, iso, 1) for hid, iso in done])
+        db.executemany(upsert, [(hid, iso, 0) for hid, iso in missed])
+        db.executemany("DELETE FROM habit_entry WHERE habit_id=? AND date=?", cleared)
+
+    def entry_slot(self, db, user_id, entry_id):
+        """(habit_id, iso_date) of a stored entry the user owns, else None."""
+        row = db.execute("""
+            SELECT he.habit_id, he.date
+            FROM habit_entry he
+            JOIN habit h ON h.id = he.habit_id
+            WHERE he.id=? AND h.user_id=?
+        """, (entry_id, user_id)).fetchone()
+        return (row["habit_id"], row["date"]) if row else None
+
+    def delete_from(self, db, habit_id, date):
+        """Forget what was recorded for a habit on and after `date`."""
+        db.execute("DELETE FROM habit_entry WHERE habit_id=? AND date>=?", (habit_id, date.isoformat()))
+
+    missed_sql = staticmethod(entry_missed_sql)
+
+
+class BitsetStorage(Storage):
+    """One habit_month row per (habit, month) with done and slot bit masks."""
+
+    name = "bitset"
+
+    def month_slots(self, db, user_id, habits, month):
+        """Same as RowStorage.month_slots (ids are always None)."""
+        first, last = _month_bounds(month)
+        masks = {
+            r["habit_id"]: (r["done_mask"], r["sched_mask"])
+            for r in db.execute("""
+                SELECT habit_id, done_mask, sched_mask
+                FROM habit_month
+                WHERE month=? AND habit_id IN (SELECT id FROM habit WHERE user_id=?)
+            """, (_month_key(first), user_id))
+        }
+        habits = sorted(habits, key=lambda h: h["id"])
+        per_habit = [
+            (h["id"], *masks[h["id"]]) if h["id"] in masks else (h["id"], 0, month_mask(h, first))
+            for h in habits
+        ]
+
+        slots = []
+        for d in range(1, last.day + 1):
+            bit = 1 << (d - 1)
+            iso = first.replace(day=d).isoformat()
+            for hid, done, sched in per_habit:
+                if (sched | done) & bit:
+                    slots.append({"id": None, "habit_id": hid, "date": iso, "completed": 1 if done & bit else 0})
+        return slots
+
+    def entry_arrays(self, db, user_id=None, habit_id=None, since=None, until=None):
+        """Recorded days as (habit_ids, day ordinals, completed) arrays, decoded from the masks."""
+        where, params = [], []
+        if user_id is not None:
+            where.append("habit_id IN (SELECT id FROM habit WHERE user_id = ?)")
+            params.append(user_id)
+        if habit_id is not None:
+            where.append("habit_id = ?")
+            params.append(habit_id)
+        if since is not None:
+            where.append("month >= ?")
+            params.append(_month_key(since))
+        if until is not None:
+            where.append("month <= ?")
+            params.append(_month_key(until))
+
+        cur = db.cursor()
+        cur.row_factory = None
+        rows = cur.execute(f"""
+            SELECT habit_id, month, done_mask, sched_mask | done_mask
+            FROM habit_month
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY habit_id, month
+        """, params).fetchall()
+        if not rows:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+
+        hid, month, done, slots = np.array(rows, dtype=np.int64).T
+        months = ((month // 100 - 1970) * 12 + month % 100 - 1).astype("datetime64[M]")
+        first = months.astype("datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL
+        days = first[:, None] + _BITS
+        keep = ((slots[:, None] >> _BITS) & 1).astype(bool)
+        if since is not None:
+            keep &= days >= since.toordinal()
+        if until is not None:
+            keep &= days <= until.toordinal()
+        # Row-major flattening keeps the (habit, date) order
+        return (
+            np.broadcast_to(hid[:, None], days.shape)[keep],
+            days[keep],
+            (done[:, None] >> _BITS)[keep] & 1,
+        )
+
+    def iter_days(self, db, user_id, start, end):
+        """(iso_date, {habit_id: completed}) for each day in [start, end] with recorded slots.
+
+        Months come in primary key (habit, month) order and are decoded and
+        grouped by date here.
+        """
+        days = {}
+        for r in db.execute("""
+            SELECT hm.habit_id, hm.month, hm.done_mask, hm.sched_mask
+            FROM habit h
+            JOIN habit_month hm ON hm.habit_id = h.id
+            WHERE h.user_id=? AND hm.month>=? AND hm.month<=?
+            ORDER BY h.id, hm.month
+        """, (user_id, _month_key(start), _month_key(end))):
+            month = r["month"]
+            done, bits = r["done_mask"], r["sched_mask"] | r["done_mask"]
+            while bits:
+                low = bits & -bits
+                iso = f"{month // 100:04d}-{month % 100:02d}-{low.bit_length():02d}"
+                if start <= iso <= end:
+                    days.setdefault(iso, {})[r["habit_id"]] = 1 if done & low else 0
+                bits ^= low
+        for iso in sorted(days):
+            yield iso, days[iso]
+
+    def first_date(self, db, user_id):
+        """Earliest completion or explicit miss, as RowStorage answers it."""
+        cur = db.execute("""
+            SELECT hm.month, hm.done_mask, hm.sched_mask, h.frequency, h.created_on
+            FROM habit_month hm
+            JOIN habit h ON h.id = hm.habit_id
+            WHERE h.user_id=?
+            ORDER BY hm.month ASC
+        """, (user_id,))
+        for month, rows in itertools.groupby(iter_batched(cur), key=lambda r: r["month"]):
+            first = _month_date(month)
+            bits = 0
+            for r in rows:
+                # Scheduled days without a completion are the computed default
+                bits |= r["done_mask"] | (r["sched_mask"] & ~month_mask(r, first))
+            if bits:
+                return first.replace(day=(bits & -bits).bit_length()).isoformat()
+        return None
+
+    def next_date(self, db, user_id, since):
+        """The first day of the next stored month, or `since` within its month."""
+        month = db.execute("""
+            SELECT MIN((SELECT month FROM habit_month WHERE habit_id = h.id AND month>=? ORDER BY month LIMIT 1))
+            FROM habit h WHERE h.user_id=?
+        """, (_month_key(since), user_id)).fetchone()[0]
+        if month is None:
+            return None
+        return max(since, _month_date(month).isoformat())
+
+    def recorded(self, db, habit_ids, dates):
+        """The (habit_id, iso_date) pairs among `habit_ids` x `dates` that are slots of a stored month."""
+        if not habit_ids or not dates:
+            return set()
+        months = sorted({_month_key(d) for d in dates})
+        masks = {
+            (r["habit_id"], r["month"]): r["bits"]
+            for r in db.execute(f"""
+                SELECT habit_id, month, sched_mask | done_mask AS bits FROM habit_month
+                WHERE habit_id IN ({",".join("?" * len(habit_ids))})
+                  AND month IN ({",".join("?" * len(months))})
+            """, [*habit_ids, *months])
+        }
+        return {
+            (hid, iso)
+            for hid in habit_ids for iso in dates
+            if masks.get((hid, _month_key(iso)), 0) >> (int(iso[8:10]) - 1) & 1
+        }
+
+    def write(self, db, habits, done, missed, cleared):
+        """Same as RowStorage.write: set or clear bits, one upsert per (habit, month)."""
+        changes = {}  # (habit_id, month) -> [set done, clear done, add slot]
+        for group, index in ((done, 0), (missed, 1), (cleared, 1)):
+            for hid, iso in group:
+                c = changes.setdefault((hid, _month_key(iso)), [0, 0, 0])
+                bit = 1 << (int(iso[8:10]) - 1)
+                c[index] |= bit
+                c[2] |= bit
+        db.executemany("""
+            INSERT INTO habit_month (habit_id,month,done_mask,sched_mask) VALUES (?,?,?,?)
+            ON CONFLICT(habit_id,month) DO UPDATE SET
+                done_mask = (done_mask | ?) & ~?,
+                sched_mask = sched_mask | ?
+        """, [
+            (hid, month, set_done, month_mask(habits[hid], _month_date(month)) | add_slot,
+             set_done, clear_done, add_slot)
+            for (hid, month), (set_done, clear_done, add_slot) in changes.items()
+        ])
+
+    def entry_slot(self, db, user_id, entry_id):
+        return None  # no per-day rows, so no entry ids
+
+    def delete_from(self, db, habit_id, date):
+        """Forget what was recorded for a habit on and after `date`."""
+        keep = (1 << (date.day - 1)) - 1
+        db.execute("DELETE FROM habit_month WHERE habit_id=? AND month>?", (habit_id, _month_key(date)))
+        db.execute("""
+            UPDATE habit_month SET done_mask = done_mask & ?, sched_mask = sched_mask & ?
+            WHERE habit_id=? AND month=?
+        """, (keep, keep, habit_id, _month_key(date)))
+
+    @staticmethod
+    def missed_sql(habit="h", date="dr.date"):
+        """(join, condition) SQL telling whether `habit` missed `date`, for habit_month masks."""
+        bit = f"(1 << (CAST(strftime('%d', {date}) AS INTEGER) - 1))"
+        return (
+            f"LEFT JOIN habit_month hm ON hm.habit_id = {habit}.id"
+            f" AND hm.month = CAST(strftime('%Y%m', {date}) AS INTEGER)",
+            f"""CASE WHEN hm.habit_id IS NULL THEN {slot_sql(habit, date)}
+                ELSE (hm.sched_mask & {bit}) != 0 AND (hm.done_mask & {bit}) = 0 END""",
+        )
+
+
+def _month_key(date):
+    """YYYYMM of a date or ISO date string."""
+    if isinstance(date, str):
+        return int(date[:4]) * 100 + int(date[5:7])
+    return date.year * 100 + date.month
+
+
+def _month_date(key):
+    return datetime.date(key // 100, key % 100, 1)
+
+
+BACKENDS = {backend.name: backend for backend in (RowStorage(), BitsetStorage())}
+
+
+def get_backend(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"unknown storage backend: {name!r} (expected one of {', '.join(BACKENDS)})")
+
+
+def convert(db, target):
+    """Rebuild the `target` layout from the other one. Returns rows written."""
+    if target == "bitset":
+        db.execute("DELETE FROM habit_month")
+        # Each (habit, date) is unique, so summing the day bits ORs them
+        db.execute("""
+            INSERT INTO habit_month (habit_id, month, done_mask, sched_mask)
+            SELECT habit_id, CAST(strftime('%Y%m', date) AS INTEGER),
+                   SUM(CASE WHEN completed = 1 THEN 1 << (CAST(strftime('%d', date) AS INTEGER) - 1) ELSE 0 END),
+                   SUM(1 << (CAST(strftime('%d', date) AS INTEGER) - 1))
+            FROM habit_entry
+            WHERE habit_id IN (SELECT id FROM habit)
+            GROUP BY habit_id, CAST(strftime('%Y%m', date) AS INTEGER)
+        """)
+        habits = {h["id"]: h for h in db.execute("SELECT id, frequency, created_on FROM habit")}
+        db.executemany(
+            "UPDATE habit_month SET sched_mask = sched_mask | ? WHERE habit_id=? AND month=?",
+            [
+                (month_mask(habits[r["habit_id"]], _month_date(r["month"])), r["habit_id"], r["month"])
+                for r in db.execute("SELECT habit_id, month FROM habit_month").fetchall()
+            ]
+        )
+        return db.execute("SELECT COUNT(*) FROM habit_month").fetchone()[0]
+
+    if target == "rows":
+        db.execute("DELETE FROM habit_entry")
+        habits = {h["id"]: h for h in db.execute("SELECT id, frequency, created_on FROM habit")}
+        rows = []
+        for r in db.execute("SELECT * FROM habit_month WHERE habit_id IN (SELECT id FROM habit)").fetchall():
+            first = _month_date(r["month"])
+            schedule = month_mask(habits[r["habit_id"]], first)
+            bits = r["sched_mask"] | r["done_mask"]
+            while bits:
+                low = bits & -bits
+                # Scheduled, not-done days are the computed default: nothing to store
+                if r["done_mask"] & low or not schedule & low:
+                    day = first.replace(day=low.bit_length()).isoformat()
+                    rows.append((r["habit_id"], day, 1 if r["done_mask"] & low else 0))
+                bits ^= low
+        db.executemany("INSERT INTO habit_entry (habit_id,date,completed) VALUES (?,?,?)", rows)
+        return len(rows)
+
+    get_backend(target)  # raises for unknown names
@@ -1,47 +1,285 @@
-import pytest
-from app import app, db, User, Habit, HabitLog
-
-@pytest.fixture
-def client():
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    with app.test_client() as client:
-        with app.app_context():
-            db.create_all()
-        yield client
-
-def register_and_login(client):
-    client.post('/register', data={'email':'test@example.com','password':'pass'})
-    client.post('/login', data={'email':'test@example.com','password':'pass'})
-
-def test_register_login_logout(client):
-    rv = client.post('/register', data={'email':'a@b.com','password':'p'})
+import datetime
+import sqlite3
+import threading
+
+import numpy as np
+
+from analytics import habit_metrics, merge_slots
+from conftest import sign_up
+
+
+def add_habit(client, name, frequency="daily"):
+    rv = client.post("/home", data={"action": "add", "habit_name": name, "frequency": frequency})
+    assert rv.status_code == 302
+
+
+def habits_by_name(db, user_id):
+    return {h["name"]: h for h in db.execute("SELECT * FROM habit WHERE user_id=?", (user_id,))}
+
+
+def test_register_login_logout(streakly):
+    client = streakly.app.test_client()
+    rv = client.post("/register", data={"email": "a@b.com", "password": "p"})
     assert rv.status_code == 302
-    rv = client.post('/login', data={'email':'a@b.com','password':'p'})
+    rv = client.post("/login", data={"email": "a@b.com", "password": "p"})
     assert rv.status_code == 302
-    rv = client.get('/logout')
+    assert client.get("/home").status_code == 200
+    rv = client.get("/logout")
     assert rv.status_code == 302
+    assert client.get("/home").headers["Location"].endswith("/login")
 
-def test_add_daily_habit(client):
-    register_and_login(client)
-    rv = client.post('/add_habit', data={'name':'Daily Test','frequency':'daily'})
-    assert rv.status_code == 302
-    habit = Habit.query.filter_by(name='Daily Test').first()
-    assert habit.frequency == 'daily'
-
-def test_add_weekly_monthly_habits(client):
-    register_and_login(client)
-    client.post('/add_habit', data={'name':'Weekly Test','frequency':'weekly'})
-    client.post('/add_habit', data={'name':'Monthly Test','frequency':'monthly'})
-    h_weekly = Habit.query.filter_by(name='Weekly Test').first()
-    h_monthly = Habit.query.filter_by(name='Monthly Test').first()
-    assert h_weekly.frequency == 'weekly'
-    assert h_monthly.frequency == 'monthly'
-
-def test_habit_logging_and_streak(client):
-    register_and_login(client)
-    client.post('/add_habit', data={'name':'Daily Habit','frequency':'daily'})
-    habit = Habit.query.filter_by(name='Daily Habit').first()
-    client.post('/update', data={'goal_id': habit.id, 'day':'2025-12-25', 'completed':'on'})
-    log = HabitLog.query.filter_by(habit_id=habit.id).first()
-    assert log.completed == 1
\ No newline at end of file
+
+def test_wrong_password_is_rejected(streakly):
+    client = streakly.app.test_client()
+    client.post("/register", data={"email": "c@d.com", "password": "p"})
+    client.post("/login", data={"email": "c@d.com", "password": "nope"})
+    with client.session_transaction() as s:
+        assert "user_id" not in s
+
+
+def test_add_daily_habit(client, user_db):
+    add_habit(client, "Daily Test")
+    habit = habits_by_name(user_db(client.user_id), client.user_id)["Daily Test"]
+    assert habit["frequency"] == "daily"
+    assert habit["created_on"] is not None
+
+
+def test_add_weekly_monthly_habits(client, user_db):
+    add_habit(client, "Weekly Test", "weekly")
+    add_habit(client, "Monthly Test", "monthly")
+    habits = habits_by_name(user_db(client.user_id), client.user_id)
+    assert habits["Weekly Test"]["frequency"] == "weekly"
+    assert habits["Monthly Test"]["frequency"] == "monthly"
+
+
+def test_habit_logging_and_streak(streakly, client, user_db):
+    add_habit(client, "Daily Habit")
+    db = user_db(client.user_id)
+    habit = habits_by_name(db, client.user_id)["Daily Habit"]
+    today = habit["created_on"]
+
+    rv = client.post("/update_completion", json={"habit_id": habit["id"], "date": today, "completed": 1})
+    assert rv.json["success"]
+    stats = client.get(f"/api/home/{today[:7]}/stats").json
+    assert [h["streak"] for h in stats["habits"] if h["id"] == habit["id"]] == [1]
+
+    client.post("/update_completion", json={"habit_id": habit["id"], "date": today, "completed": 0})
+    stats = client.get(f"/api/home/{today[:7]}/stats").json
+    assert [h["streak"] for h in stats["habits"] if h["id"] == habit["id"]] == [0]
+
+
+def test_malformed_month_shows_the_current_month(client):
+    assert client.get("/home?month=2026-13").status_code == 200
+    assert client.get("/api/home/2026-13/grid").status_code == 400
+
+
+# ---------------- Home API ----------------
+def test_home_parts_answer_304_until_their_data_changes(client, user_db):
+    add_habit(client, "Run")
+    run = habits_by_name(user_db(client.user_id), client.user_id)["Run"]
+    month = run["created_on"][:7]
+    parts = ("grid", "stats", "summary")
+
+    def etags():
+        tags = {}
+        for part in parts:
+            rv = client.get(f"/api/home/{month}/{part}")
+            assert rv.status_code == 200 and rv.json["month"] == month
+            tags[part] = rv.headers["ETag"]
+            again = client.get(f"/api/home/{month}/{part}", headers={"If-None-Match": tags[part]})
+            assert again.status_code == 304 and again.data == b""
+            assert again.headers["ETag"] == tags[part]
+        return tags
+
+    seen = [etags()]
+    client.post("/update_completion", json={"habit_id": run["id"], "date": run["created_on"], "completed": 1})
+    seen.append(etags())
+    client.post("/update_reason", json={"date": run["created_on"], "reason": "Tired"})
+    seen.append(etags())
+    add_habit(client, "Gym", "weekly")
+    seen.append(etags())
+    for part in parts:
+        assert len({tags[part] for tags in seen}) == len(seen), part
+    stale = client.get(f"/api/home/{month}/stats", headers={"If-None-Match": seen[0]["stats"]})
+    assert stale.status_code == 200 and [h["name"] for h in stale.json["habits"]] == ["Gym", "Run"]
+
+
+# ---------------- Computed slots ----------------
+def test_migration_7_keeps_only_what_the_schedule_cannot_say(streakly, tmp_path):
+    db = sqlite3.connect(tmp_path / "old.db")
+    db.row_factory = sqlite3.Row
+    streakly.migrate(db, target=6)
+    db.executemany("INSERT INTO habit (id,user_id,name,frequency,created_on) VALUES (?,1,?,?,'2026-01-01')", [
+        (1, "Run", "daily"), (2, "Gym", "weekly"), (3, "Pay", "monthly"),
+    ])
+    entries = {
+        (1, "2026-01-05", 0): False,     # scheduled and not done: the computed slot says the same
+        (1, "2026-01-06", None): False,
+        (1, "2026-01-07", 1): True,      # completions always stay
+        (1, "2025-12-30", 0): True,      # before created_on: an explicit miss
+        (2, "2026-01-03", 0): False,     # a Saturday
+        (2, "2026-01-05", 0): True,      # a Monday, off the schedule
+        (3, "2026-01-30", 0): False,     # second last day of January
+        (3, "2026-01-31", 0): True,
+        (9, "2026-01-05", 0): False,     # habit gone
+        (9, "2026-01-06", 1): True,
+    }
+    db.executemany("INSERT INTO habit_entry (habit_id,date,completed) VALUES (?,?,?)", list(entries))
+    db.execute("INSERT INTO habit_aggregate (habit_id,total,done) VALUES (1,7,1)")
+    db.commit()
+
+    assert streakly.migrate(db, target=7) == 7
+    kept = {tuple(r) for r in db.execute("SELECT habit_id, date, completed FROM habit_entry")}
+    assert kept == {e for e, keep in entries.items() if keep}
+    assert db.execute("SELECT COUNT(*) FROM habit_aggregate").fetchone()[0] == 0
+    db.close()
+
+
+def test_merge_slots_stored_entries_win():
+    habits = [{"id": 1, "frequency": "daily", "created_on": "2026-01-01"}]
+    day = datetime.date(2026, 1, 1).toordinal()
+    # Stored: done on the 2nd, an explicit miss the day before created_on
+    ids, days, done = merge_slots(
+        np.array([1, 1]), np.array([day - 1, day + 1]), np.array([0, 1]),
+        habits, datetime.date(2026, 1, 4),
+    )
+    assert ids.tolist() == [1] * 5
+    assert days.tolist() == [day - 1, day, day + 1, day + 2, day + 3]
+    assert done.tolist() == [0, 0, 1, 0, 0]
+
+
+def test_merge_slots_from_since():
+    habits = [{"id": 1, "frequency": "weekly", "created_on": "2026-01-01"},
+              {"id": 2, "frequency": "daily", "created_on": None}]
+    empty = np.empty(0, dtype=np.int64)
+    ids, days, _ = merge_slots(empty, empty, empty, habits, datetime.date(2026, 1, 31),
+                               since=datetime.date(2026, 1, 11))
+    assert [datetime.date.fromordinal(d).day for d in days] == [17, 24, 31]
+    assert set(ids.tolist()) == {1}
+
+
+def test_unvisited_days_count_as_misses(streakly, client, user_db):
+    add_habit(client, "Read")
+    db = user_db(client.user_id)
+    habit = habits_by_name(db, client.user_id)["Read"]
+    today = datetime.date.fromisoformat(habit["created_on"])
+    start = today - datetime.timedelta(days=9)
+    db.execute("UPDATE habit SET created_on=? WHERE id=?", (start.isoformat(), habit["id"]))
+    db.commit()
+    for d in (start, start + datetime.timedelta(days=1), today):
+        client.post("/update_completion", json={"habit_id": habit["id"], "date": d.isoformat(), "completed": 1})
+
+    # Nothing stored for the seven days in between, yet they are slots
+    stored = db.execute("SELECT COUNT(*) FROM habit_entry WHERE habit_id=?", (habit["id"],)).fetchone()[0]
+    assert stored in (0, 3)  # 0 with STORAGE=bitset
+    with streakly.app.app_context():
+        m = streakly.store.habit_metrics(db, today, habit_id=habit["id"])[habit["id"]]
+    assert (m["total"], m["done"], m["current_streak"], m["longest_streak"]) == (10, 3, 1, 2)
+    assert m == habit_metrics(*merge_slots(
+        np.array([habit["id"]] * 3),
+        np.array([start.toordinal(), start.toordinal() + 1, today.toordinal()]),
+        np.array([1, 1, 1]),
+        [dict(habit, created_on=start.isoformat())], today,
+    ), today)[habit["id"]]
+
+
+# ---------------- Connections ----------------
+def test_connections_use_wal_and_the_configured_pragmas(streakly):
+    with streakly.app.app_context():
+        db = streakly.get_db()
+        assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert db.execute("PRAGMA synchronous").fetchone()[0] == 1  # normal
+        assert db.execute("PRAGMA busy_timeout").fetchone()[0] == streakly.SQLITE_PRAGMAS["busy_timeout"]
+
+
+def test_connections_are_reused_per_thread(streakly):
+    def current():
+        with streakly.app.app_context():
+            return streakly.get_db()
+
+    assert current() is current()
+    other = []
+    t = threading.Thread(target=lambda: other.append(current()))
+    t.start()
+    t.join()
+    assert other[0] is not current()
+
+
+def test_unfinished_writes_do_not_leak_into_the_next_request(streakly):
+    with streakly.app.app_context():
+        db = streakly.get_db()
+        db.execute("INSERT INTO user (email, password) VALUES ('leak@example.com', 'x')")
+    with streakly.app.app_context():
+        db = streakly.get_db()
+        assert not db.in_transaction
+        assert db.execute("SELECT 1 FROM user WHERE email='leak@example.com'").fetchone() is None
+
+
+# ---------------- Batched completions ----------------
+def test_batch_applies_only_the_users_own_slots(streakly, client, user_db):
+    other = sign_up(streakly)
+    add_habit(client, "Mine")
+    add_habit(other, "Theirs")
+    add_habit(other, "Theirs too")
+    mine = habits_by_name(user_db(client.user_id), client.user_id)["Mine"]
+    # Habit ids are per data file: with sharding, "Theirs" may share Mine's id
+    theirs = next(h for h in habits_by_name(user_db(other.user_id), other.user_id).values() if h["id"] != mine["id"])
+    today = mine["created_on"]
+
+    rv = client.post("/update_completions", json={"changes": [
+        {"habit_id": mine["id"], "date": today, "completed": 1},
+        {"habit_id": theirs["id"], "date": today, "completed": 1},
+    ]})
+    assert rv.status_code == 200
+    assert rv.json == {
+        "success": False, "updated": 1, "skipped": [{"habit_id": theirs["id"], "date": today}],
+    }
+    with streakly.app.app_context():
+        recorded = streakly.store.recorded(user_db(other.user_id), [theirs["id"]], [today])
+    assert not recorded
+
+
+def test_batch_skips_entry_ids_of_other_users(streakly, client, user_db):
+    other = sign_up(streakly)
+    add_habit(client, "Mine")
+    add_habit(other, "Theirs")
+    add_habit(other, "Theirs too")
+    for c in (client, other):
+        c.post("/mark_all_done_today")
+
+    def entry_ids(user_id):  # none with STORAGE=bitset
+        return {r[0] for r in user_db(user_id).execute(
+            "SELECT he.id FROM habit_entry he JOIN habit h ON h.id = he.habit_id WHERE h.user_id=?", (user_id,))}
+    # Entry ids are per data file too: pick one that is not also the client's
+    entry_id = min(entry_ids(other.user_id) - entry_ids(client.user_id), default=1)
+    rv = client.post("/update_completions", json={"changes": [{"entry_id": entry_id, "completed": 1}]})
+    assert rv.json["skipped"] == [{"entry_id": entry_id}]
+
+
+def test_batch_skips_days_off_the_schedule(client, user_db):
+    add_habit(client, "Gym", "weekly")
+    gym = habits_by_name(user_db(client.user_id), client.user_id)["Gym"]
+    day = datetime.date.fromisoformat(gym["created_on"])
+    while day.weekday() == 5:  # anything but a Saturday
+        day += datetime.timedelta(days=1)
+    rv = client.post("/update_completions", json={"changes": [
+        {"habit_id": gym["id"], "date": day.isoformat(), "completed": 1},
+    ]})
+    assert rv.json["updated"] == 0 and not rv.json["success"]
+
+
+def test_batch_later_duplicates_win(client, user_db):
+    add_habit(client, "Run")
+    run = habits_by_name(user_db(client.user_id), client.user_id)["Run"]
+    change = {"habit_id": run["id"], "date": run["created_on"]}
+    rv = client.post("/update_completions", json={"changes": [dict(change, completed=1), dict(change, completed=0)]})
+    assert rv.json == {"success": True, "updated": 1, "skipped": []}
+    stats = client.get(f"/api/home/{run['created_on'][:7]}/stats").json
+    assert [h["m_done"] for h in stats["habits"]] == [0]
+
+
+def test_batch_rejects_malformed_or_oversized_bodies(streakly, client):
+    assert client.post("/update_completions", json={"changes": ["x"]}).status_code == 400
+    assert client.post("/update_completions", json={}).status_code == 400
+    too_many = [{"habit_id": 1, "date": "2026-01-01", "completed": 1}] * (streakly.MAX_COMPLETION_BATCH + 1)
+    assert client.post("/update_completions", json={"changes": too_many}).status_code == 400
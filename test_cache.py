@@ -0,0 +1,90 @@
+import datetime
+import pickle
+
+import pytest
+
+import cache
+from cache import ALL_SCOPES, StatsCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """cache.time.monotonic(), moved on with clock.now += seconds."""
+    class Clock:
+        now = 1000.0
+    monkeypatch.setattr(cache.time, "monotonic", lambda: Clock.now)
+    return Clock
+
+
+def test_least_recently_used_entries_go_first():
+    c = StatsCache(max_entries=2)
+    c.put("a", 1, 1, ["2026-01"])
+    c.put("b", 2, 1, ["2026-01"])
+    assert c.get("a") == 1
+    c.put("c", 3, 1, ["2026-01"])
+    assert (c.get("a"), c.get("b"), c.get("c")) == (1, None, 3)
+    assert c.stats()["evictions"] == 1
+
+
+def test_entries_expire(clock):
+    c = StatsCache(ttl=10)
+    c.put("a", 1, 1, ["habits"])
+    clock.now += 10
+    assert c.get("a") == 1
+    clock.now += 1
+    assert c.get("a") is None
+    assert c.stats()["entries"] == 0 and c.stats()["misses"] == 1
+
+
+def test_entries_stay_under_the_byte_budget():
+    value = list(range(100))
+    size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    c = StatsCache(max_bytes=2 * size)
+    for key in "abc":
+        c.put(key, value, 1, ["habits"])
+    assert c.get("a") is None and c.get("b") == c.get("c") == value
+    assert c.stats()["bytes"] == 2 * size
+    c.put("big", list(range(1000)), 1, ["habits"])  # larger than the budget: not kept
+    assert c.get("big") is None and c.get("c") == value
+
+
+def test_invalidate_drops_the_users_entries_for_those_scopes():
+    c = StatsCache()
+    c.put("jan", 1, 1, ["2026-01", "habits"])
+    c.put("feb", 2, 1, ["2026-02"])
+    c.put("all", 3, 1, [ALL_SCOPES])
+    c.put("other", 4, 2, ["2026-01"])
+    c.invalidate(1, ["2026-01"])
+    assert [c.get(k) for k in ("jan", "feb", "all", "other")] == [None, 2, None, 4]
+    assert c.stats()["invalidations"] == 2
+
+
+# ---------------- Page cache ----------------
+def home_parts(client, month):
+    return {part: client.get(f"/api/home/{month}/{part}").json for part in ("grid", "stats", "summary")}
+
+
+def test_cached_pages_follow_the_generations(streakly, client, monkeypatch):
+    client.post("/home", data={"action": "add", "habit_name": "Run", "frequency": "daily"})
+    today = streakly.local_today().isoformat()
+    run = home_parts(client, today[:7])["stats"]["habits"][0]
+    assert home_parts(client, today[:7])["stats"]["habits"][0]["m_done"] == 0
+
+    # As if another worker wrote: its invalidate() does not reach this
+    # process, but the generations it bumped change the cache keys
+    monkeypatch.setattr(streakly.stats_cache, "invalidate", lambda user_id, scopes: None)
+    misses = streakly.stats_cache.misses
+    client.post("/update_completion", json={"habit_id": run["id"], "date": today, "completed": 1})
+    cached = home_parts(client, today[:7])
+    assert cached["stats"]["habits"][0]["m_done"] == 1
+    assert streakly.stats_cache.misses == misses + 1  # rebuilt once, then shared by the parts
+
+    client.post("/update_reason", json={"date": today, "reason": "Tired"})
+    client.post("/update_completion", json={"habit_id": run["id"], "date": today, "completed": 0})
+    last = (datetime.date.fromisoformat(today).replace(day=1) - datetime.timedelta(days=1)).isoformat()
+    for month in (today[:7], last[:7]):
+        home_parts(client, month)
+        cached = home_parts(client, month)
+        monkeypatch.setattr(streakly, "CACHE_ENABLED", False)
+        assert cached == home_parts(client, month)
+        monkeypatch.setattr(streakly, "CACHE_ENABLED", True)
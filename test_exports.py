@@ -0,0 +1,121 @@
+import datetime
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from conftest import sign_up
+from importer import read_rows
+from schedule import local_today
+
+
+def add_habit(client, name="Run", frequency="daily"):
+    client.post("/home", data={"action": "add", "habit_name": name, "frequency": frequency})
+
+
+def finished(client, job, timeout=10):
+    """The job's status once it is no longer queued or running."""
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client.get(job["status_url"]).json
+        if status["status"] not in ("queued", "running") or time.monotonic() > deadline:
+            return status
+        time.sleep(0.01)
+
+
+def test_exports_reach_the_end_of_the_calendar(client):
+    add_habit(client)
+    assert len(client.get("/api/history?end=9999-12-31&limit=5").json["days"]) == 5
+    days = client.get("/api/history?start=9999-12-30&end=9999-12-31").json["days"]
+    assert [d["date"] for d in days] == ["9999-12-30", "9999-12-31"]
+
+    for fmt in ("csv", "xlsx"):
+        rv = client.get(f"/export_excel?format={fmt}&start=9999-12-30&end=9999-12-31")
+        assert rv.status_code == 200
+        assert [r[2] for r in list(read_rows(io.BytesIO(rv.data), fmt))[1:]] == ["9999-12-30", "9999-12-31"]
+
+    job = client.post("/export_jobs", json={"format": "csv", "start": "9999-12-30", "end": "9999-12-31"}).json["job"]
+    assert finished(client, job)["status"] == "done"
+    assert client.get(f"/export_jobs/{job['id']}/download").data.decode().count("9999-12-3") == 2
+
+
+def test_exports_count_days_in_the_users_time_zone(streakly, client, user_db, monkeypatch):
+    monkeypatch.setattr(streakly, "DEFAULT_TIMEZONE", "Etc/GMT+12")
+    with client.session_transaction() as s:
+        s["tz"] = "Etc/GMT-14"  # always a day or two ahead of the default
+    add_habit(client)
+    rows = list(read_rows(io.BytesIO(client.get("/export_excel?format=csv").data), "csv"))
+    assert rows[-1][2] == local_today("Etc/GMT-14").isoformat()
+
+    job = client.post("/export_jobs", json={"format": "csv"}).json["job"]
+    assert finished(client, job)["status"] == "done"
+    noon_utc = datetime.datetime(2026, 1, 1, 12, tzinfo=datetime.timezone.utc).timestamp()
+    db = user_db(client.user_id)
+    db.execute("UPDATE export_job SET created_at=? WHERE id=?", (noon_utc, job["id"]))
+    db.commit()
+    rv = client.get(f"/export_jobs/{job['id']}/download")
+    assert "streakly_export_2026-01-02.csv" in rv.headers["Content-Disposition"]
+
+
+# ---------------- Export jobs ----------------
+@pytest.fixture
+def blocked(streakly, monkeypatch):
+    """Export jobs wait for blocked.set() before they run."""
+    gate = threading.Event()
+    run = streakly.run_export_job
+
+    def waiting(*args):
+        assert gate.wait(10)
+        return run(*args)
+    monkeypatch.setattr(streakly, "run_export_job", waiting)
+    yield gate
+    gate.set()
+
+
+def test_jobs_per_user_are_capped(streakly, client, blocked):
+    add_habit(client)
+    jobs = [client.post("/export_jobs", json={"format": "csv"}) for _ in range(streakly.export_jobs.max_active_per_user)]
+    assert [rv.status_code for rv in jobs] == [202] * len(jobs)
+    assert client.post("/export_jobs", json={"format": "csv"}).status_code == 429
+    assert sign_up(streakly).post("/export_jobs", json={"format": "csv"}).status_code == 202  # per user
+
+    job = jobs[0].json["job"]
+    assert "download_url" not in job
+    assert client.get(f"/export_jobs/{job['id']}/download").status_code == 409
+    blocked.set()
+    assert [finished(client, rv.json["job"])["status"] for rv in jobs] == ["done"] * len(jobs)
+    assert client.post("/export_jobs", json={"format": "csv"}).status_code == 202
+
+
+def test_failed_jobs_report_their_error(streakly, client, monkeypatch):
+    def broken(db, job, path, progress):
+        with open(path, "wb") as f:
+            f.write(b"half an export")
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(streakly, "run_export_job", broken)
+    job = client.post("/export_jobs", json={"format": "csv"}).json["job"]
+    status = finished(client, job)
+    assert (status["status"], status["error"]) == ("failed", "RuntimeError")
+    assert "download_url" not in status
+    assert client.get(f"/export_jobs/{job['id']}/download").status_code == 409
+    assert not [f for f in os.listdir(streakly.export_jobs.directory) if f.startswith(job["id"])]
+    assert sign_up(streakly).get(f"/export_jobs/{job['id']}/download").status_code == 404
+
+
+def test_cleanup_removes_expired_jobs_and_their_files(streakly, client, user_db):
+    add_habit(client)
+    job = client.post("/export_jobs", json={"format": "csv"}).json["job"]
+    assert finished(client, job)["status"] == "done"
+    db = user_db(client.user_id)
+    path = db.execute("SELECT path FROM export_job WHERE id=?", (job["id"],)).fetchone()[0]
+    assert os.path.exists(path)
+
+    jobs = streakly.export_jobs
+    jobs.cleanup(db)
+    assert os.path.exists(path)  # not expired yet
+    assert jobs.cleanup(db, now=time.time() + jobs.retention + 1) >= 1
+    assert not os.path.exists(path)
+    assert client.get(job["status_url"]).status_code == 404
+    assert client.get(f"/export_jobs/{job['id']}/download").status_code == 404
@@ -0,0 +1,151 @@
+import datetime
+import random
+
+import pytest
+
+import history
+from conftest import sign_up
+from storage import get_backend
+
+DAYS = 60
+
+
+@pytest.fixture
+def tracked(streakly, client, user_db):
+    """A client whose three habits started DAYS ago, with some completions and reasons."""
+    for name, freq in [("Run", "daily"), ("Gym", "weekly"), ("Pay", "monthly")]:
+        client.post("/home", data={"action": "add", "habit_name": name, "frequency": freq})
+    db = user_db(client.user_id)
+    created = db.execute("SELECT created_on FROM habit WHERE user_id=?", (client.user_id,)).fetchone()[0]
+    client.today = datetime.date.fromisoformat(created)
+    client.start = client.today - datetime.timedelta(days=DAYS)
+    db.execute("UPDATE habit SET created_on=? WHERE user_id=?", (client.start.isoformat(), client.user_id))
+    db.execute("DELETE FROM habit_aggregate WHERE habit_id IN (SELECT id FROM habit WHERE user_id=?)", (client.user_id,))
+    db.commit()
+    client.habits = {h["name"]: h for h in db.execute(
+        "SELECT id, name, frequency, created_on FROM habit WHERE user_id=?", (client.user_id,))}
+    client.post("/update_completions", json={"changes": [
+        {"habit_id": h["id"], "date": (client.start + datetime.timedelta(days=d)).isoformat(), "completed": 1}
+        for h in client.habits.values() for d in range(0, DAYS, 2)
+    ]})
+    for d in (3, 10, 11):
+        day = (client.start + datetime.timedelta(days=d)).isoformat()
+        client.post("/update_reason", json={"date": day, "reason": f"reason {d}"})
+    return client
+
+
+def pages(client, query, limit):
+    """Every page of /api/history?<query>, following the cursors."""
+    out = [client.get(f"/api/history?{query}&limit={limit}").json]
+    while out[-1]["next_cursor"]:
+        out.append(client.get(f"/api/history?cursor={out[-1]['next_cursor']}&limit={limit}").json)
+    return out
+
+
+def test_pages_add_up_to_the_whole_range(tracked):
+    whole = tracked.get("/api/history?limit=2000").json
+    assert whole["next_cursor"] is None
+    assert whole["days"][0]["date"] == tracked.start.isoformat()
+    assert whole["days"][-1]["date"] == tracked.today.isoformat()
+
+    paged = pages(tracked, "", 7)
+    assert len(paged) > 5
+    days = [d for p in paged for d in p["days"]]
+    assert days == whole["days"]
+    for p in paged[:-1]:  # whole days, about `limit` slots each
+        n = sum(len(d["slots"]) or 1 for d in p["days"])
+        assert 7 <= n < 7 + 3
+    assert [d["reason"] for d in days if d["reason"]] == ["reason 3", "reason 10", "reason 11"]
+
+
+def test_range_and_habit_filters(tracked):
+    start = tracked.start + datetime.timedelta(days=10)
+    end = tracked.start + datetime.timedelta(days=20)
+    days = [d for p in pages(tracked, f"start={start}&end={end}", 3) for d in p["days"]]
+    assert [d["date"] for d in days] == [(start + datetime.timedelta(days=i)).isoformat() for i in range(11)]
+
+    run = tracked.habits["Run"]
+    days = [d for p in pages(tracked, f"habit_id={run['id']}", 5) for d in p["days"]]
+    assert len(days) == DAYS + 1
+    assert {s["habit_id"] for d in days for s in d["slots"]} == {run["id"]}
+    assert [s["completed"] for d in days[:4] for s in d["slots"]] == [True, False, True, False]
+
+
+def test_cursors_are_signed_and_bound_to_the_user(streakly, tracked):
+    cursor = tracked.get("/api/history?limit=5").json["next_cursor"]
+    assert tracked.get(f"/api/history?cursor={cursor}").status_code == 200
+
+    forged = cursor[:-2] + ("AA" if not cursor.endswith("AA") else "BB")
+    assert tracked.get(f"/api/history?cursor={forged}").status_code == 400
+    unsigned = streakly.URLSafeSerializer("not the key", salt="history-cursor").dumps(
+        {"u": tracked.user_id, "s": "2000-01-01", "e": "2100-01-01", "h": None, "a": None})
+    assert tracked.get(f"/api/history?cursor={unsigned}").status_code == 400
+    # Someone else's cursor does not read their history
+    assert sign_up(streakly).get(f"/api/history?cursor={cursor}").status_code == 400
+
+
+def test_bad_requests(tracked):
+    assert tracked.get("/api/history?start=2026-02-30").status_code == 400
+    assert tracked.get("/api/history?habit_id=999999").status_code == 404
+    assert tracked.get("/api/history?limit=0").json["next_cursor"] is not None  # clamped to 1
+
+
+@pytest.mark.parametrize("layout", ["rows", "bitset"])
+def test_reads_skip_stretches_with_nothing_to_show(data_db, layout):
+    store = get_backend(layout)
+    data_db.execute("INSERT INTO habit (id,user_id,name,frequency,created_on) VALUES (1,1,'Run','daily','2026-01-30')")
+    data_db.execute("INSERT INTO day_reason (user_id,date,reason) VALUES (1,'1990-05-05','Sick')")
+    store.write(data_db, {1: {"id": 1, "frequency": "daily", "created_on": "2026-01-30"}},
+                [(1, "2001-02-03")], [], [])
+    habits = history.load_habits(data_db, 1)
+    assert history.first_day(data_db, store, 1) == "1990-05-05"
+
+    statements = []
+    data_db.set_trace_callback(statements.append)
+    days = list(history.iter_days(data_db, store, 1, habits, "0001-01-01", "2026-02-02"))
+    assert [(iso, [c == 1 for _, c in slots], reason) for iso, slots, reason in days] == [
+        ("1990-05-05", [], "Sick"),
+        ("2001-02-03", [True], ""),
+        *((iso, [False], "") for iso in ("2026-01-30", "2026-01-31", "2026-02-01", "2026-02-02")),
+    ]
+    assert len(statements) < 20  # not one read per month of the 2000 years
+    assert list(history.iter_days(data_db, store, 1, habits, "1990-05-06", "2001-02-02")) == []
+
+
+# ---------------- Aggregates ----------------
+def stored_aggregates(streakly, db, habits):
+    rows = (db.execute("SELECT * FROM habit_aggregate WHERE habit_id=?", (h["id"],)).fetchone() for h in habits.values())
+    return {r["habit_id"]: {k: r[k] for k in streakly.AGGREGATE_FIELDS} for r in rows if r is not None}
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_toggles_keep_aggregates_equal_to_a_full_recompute(streakly, tracked, user_db, seed):
+    db = user_db(tracked.user_id)
+    rnd = random.Random(seed)
+    for _ in range(60):
+        changes = [
+            {"habit_id": rnd.choice(list(tracked.habits.values()))["id"],
+             "date": (tracked.today - datetime.timedelta(days=rnd.randrange(-2, DAYS + 5))).isoformat(),
+             "completed": int(rnd.random() < 0.7)}
+            for _ in range(rnd.choice([1, 1, 4]))
+        ]
+        assert tracked.post("/update_completions", json={"changes": changes}).status_code == 200
+        with streakly.app.app_context():
+            for hid, stored in stored_aggregates(streakly, db, tracked.habits).items():
+                assert stored == streakly.compute_habit_aggregate(db, hid, tracked.today)
+
+
+def test_stale_aggregates_move_forward_to_today(streakly, tracked, user_db):
+    db = user_db(tracked.user_id)
+    habits = list(tracked.habits.values())
+    with streakly.app.app_context():
+        for k in (1, 9, DAYS + 3):
+            past = tracked.today - datetime.timedelta(days=k)
+            for h in habits:
+                streakly.save_habit_aggregate(db, h["id"], streakly.compute_habit_aggregate(db, h["id"], past), past)
+            db.commit()
+            aggs = streakly.load_habit_aggregates(db, habits, tracked.today)
+            for h in habits:
+                assert aggs[h["id"]]["as_of"] == tracked.today.isoformat()
+                assert {f: aggs[h["id"]][f] for f in streakly.AGGREGATE_FIELDS} == \
+                    streakly.compute_habit_aggregate(db, h["id"], tracked.today)
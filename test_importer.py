@@ -0,0 +1,104 @@
+import datetime
+import io
+
+import pytest
+
+from conftest import sign_up
+from importer import MAX_ERRORS, BadImportFile, import_rows, read_rows
+from storage import get_backend
+
+HEADER = ["Habit", "Frequency", "Date", "Completed", "Day Reason"]
+
+
+def csv_rows(text):
+    return read_rows(io.BytesIO(text.encode()), "csv")
+
+
+@pytest.mark.parametrize("layout", ["rows", "bitset"])
+def test_bad_rows_are_reported_by_number_and_skipped(data_db, layout):
+    store = get_backend(layout)
+    summary = import_rows(data_db, store, 1, csv_rows(
+        "Habit,Frequency,Date,Completed,Day Reason\n"
+        "Read,daily,2026-01-01,Yes,\n"      # row 2
+        "Read,daily,2026-01-02,No,Sick\n"
+        ",daily,2026-01-03,Yes,\n"
+        "Read,yearly,2026-01-03,Yes,\n"
+        "Read,daily,01/03/2026,Yes,\n"
+        "\n"                                 # blank rows are not counted
+        "Read,daily,2026-01-04,maybe,\n"    # row 8
+        "Gym,Weekly,2026-01-03,x,\n"
+    ), HEADER)
+
+    assert summary["rows"] == 7
+    assert summary["imported"] == 3
+    assert summary["habits_created"] == 2
+    assert summary["reasons"] == 1
+    assert [e["row"] for e in summary["errors"]] == [4, 5, 6, 8]
+    assert summary["error_count"] == 4
+    assert "Completed must be Yes or No" in summary["errors"][-1]["error"]
+    assert summary["months"] == {"2026-01"}
+
+    habits = {h["name"]: h for h in data_db.execute("SELECT * FROM habit")}
+    assert habits["Read"]["created_on"] == "2026-01-01"
+    assert habits["Gym"]["frequency"] == "weekly"
+    m = store.habit_metrics(data_db, datetime.date(2026, 1, 3), user_id=1)
+    assert (m[habits["Read"]["id"]]["total"], m[habits["Read"]["id"]]["done"]) == (3, 1)
+    assert data_db.execute("SELECT reason FROM day_reason WHERE date='2026-01-02'").fetchone()[0] == "Sick"
+
+
+def test_errors_are_capped(data_db):
+    body = "".join(f"Read,daily,bad-{i},Yes\n" for i in range(MAX_ERRORS + 5))
+    summary = import_rows(data_db, get_backend("rows"), 1, csv_rows("Habit,Frequency,Date,Completed\n" + body), HEADER)
+    assert summary["error_count"] == MAX_ERRORS + 5
+    assert len(summary["errors"]) == MAX_ERRORS
+
+
+def test_unreadable_files(data_db):
+    store = get_backend("rows")
+    with pytest.raises(BadImportFile, match="empty"):
+        import_rows(data_db, store, 1, csv_rows(""), HEADER)
+    with pytest.raises(BadImportFile, match="Missing column: Date"):
+        import_rows(data_db, store, 1, csv_rows("Habit,Frequency,Completed\n"), HEADER)
+    with pytest.raises(BadImportFile):
+        import_rows(data_db, store, 1, read_rows(io.BytesIO(b"not a workbook"), "xlsx"), HEADER)
+
+
+def test_existing_habits_are_matched_by_name_and_frequency(data_db):
+    data_db.execute("INSERT INTO habit (id,user_id,name,frequency,created_on) VALUES (5,1,'Read','daily','2026-01-01')")
+    summary = import_rows(data_db, get_backend("rows"), 1, csv_rows(
+        "Habit,Frequency,Date,Completed\nRead,daily,2026-01-02,Yes\nRead,weekly,2026-01-03,Yes\n"
+    ), HEADER)
+    assert summary["habits_created"] == 1
+    assert 5 in summary["habit_ids"]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "xlsx"])
+def test_export_import_round_trip(streakly, client, user_db, fmt):
+    for name, freq in [("Run", "daily"), ("Gym", "weekly"), ("Pay", "monthly")]:
+        client.post("/home", data={"action": "add", "habit_name": name, "frequency": freq})
+    db = user_db(client.user_id)
+    today = datetime.date.fromisoformat(db.execute("SELECT created_on FROM habit WHERE user_id=?", (client.user_id,)).fetchone()[0])
+    start = today - datetime.timedelta(days=75)
+    db.execute("UPDATE habit SET created_on=? WHERE user_id=?", (start.isoformat(), client.user_id))
+    db.commit()
+    habits = [h["id"] for h in db.execute("SELECT id FROM habit WHERE user_id=?", (client.user_id,))]
+    changes = [
+        {"habit_id": hid, "date": (start + datetime.timedelta(days=d)).isoformat(), "completed": 1}
+        for hid in habits for d in range(0, 76, 3)
+    ]
+    client.post("/update_completions", json={"changes": changes})
+    client.post("/update_reason", json={"date": (start + datetime.timedelta(days=1)).isoformat(), "reason": "Tired"})
+    exported = client.get(f"/export_excel?format={fmt}&end={today}").data
+
+    other = sign_up(streakly)
+    rv = other.post("/import", data={"file": (io.BytesIO(exported), f"history.{fmt}")},
+                    content_type="multipart/form-data")
+    assert rv.json["success"], rv.json
+    assert rv.json["habits_created"] == 3
+
+    def table(data):
+        rows = [list(r) for r in read_rows(io.BytesIO(data), fmt)]
+        return sorted(rows[1:]), rows[0]
+    before = table(exported)
+    assert len(before[0]) > 76 and ["Run", "daily", start.isoformat(), "Yes"] in [r[:4] for r in before[0]]
+    assert table(other.get(f"/export_excel?format={fmt}&end={today}").data) == before
@@ -0,0 +1,99 @@
+import contextlib
+import time
+
+import pytest
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash
+
+from conftest import sign_up
+from passwords import HashingBusy, PasswordHasher, method_prefix
+
+FAST = "pbkdf2:sha256:1000"
+SLOW = "pbkdf2:sha256:1000000"
+
+
+def stored_user(streakly, user_id):
+    with contextlib.closing(streakly.connect_db()) as db:
+        return db.execute("SELECT email, password FROM user WHERE id=?", (user_id,)).fetchone()
+
+
+def log_in(streakly, email, password):
+    return streakly.app.test_client().post("/login", data={"email": email, "password": password})
+
+
+def test_method_prefix_and_needs_rehash():
+    assert method_prefix("scrypt") == "scrypt:32768:8:1"
+    assert method_prefix("scrypt:16384:8:2") == "scrypt:16384:8:2"
+    assert method_prefix("pbkdf2") == f"pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}"
+    assert method_prefix("pbkdf2:sha512") == f"pbkdf2:sha512:{DEFAULT_PBKDF2_ITERATIONS}"
+    for bad in ("md5", "scrypt:1", "pbkdf2:sha256:1:2"):
+        with pytest.raises(ValueError):
+            method_prefix(bad)
+
+    hasher = PasswordHasher(FAST, workers=0)
+    assert not hasher.needs_rehash(hasher.hash("pw"))
+    assert not hasher.needs_rehash(generate_password_hash("pw", "pbkdf2:sha256:1000"))
+    assert hasher.needs_rehash(generate_password_hash("pw", "pbkdf2:sha256:2000"))
+    assert hasher.needs_rehash(generate_password_hash("pw", "scrypt"))
+
+
+def test_sign_in_rehashes_after_the_method_changes(streakly, monkeypatch):
+    client = sign_up(streakly)
+    email, old = stored_user(streakly, client.user_id)
+    assert old.startswith(method_prefix(FAST) + "$")
+
+    monkeypatch.setattr(streakly.hasher, "method", "pbkdf2:sha256:2000")
+    assert log_in(streakly, email, "wrong").status_code == 200
+    assert stored_user(streakly, client.user_id)["password"] == old
+    assert log_in(streakly, email, "pass").status_code == 302
+    new = stored_user(streakly, client.user_id)["password"]
+    assert new.startswith("pbkdf2:sha256:2000$")
+    assert log_in(streakly, email, "pass").status_code == 302
+    assert stored_user(streakly, client.user_id)["password"] == new
+
+
+def test_busy_hashing_answers_503(streakly, monkeypatch):
+    client = sign_up(streakly)
+    email = stored_user(streakly, client.user_id)["email"]
+
+    def busy(*args):
+        raise HashingBusy()
+    monkeypatch.setattr(streakly.hasher, "_run", busy)
+    assert log_in(streakly, email, "pass").status_code == 503
+    rv = streakly.app.test_client().post("/register", data={"email": "busy@example.com", "password": "pw"})
+    assert rv.status_code == 503
+    assert b"Too many sign-ins" in rv.data
+
+    # A rehash that cannot run now waits for the next sign-in
+    monkeypatch.undo()
+    monkeypatch.setattr(streakly.hasher, "method", "pbkdf2:sha256:2000")
+    monkeypatch.setattr(streakly.hasher, "hash", busy)
+    assert log_in(streakly, email, "pass").status_code == 302
+    assert stored_user(streakly, client.user_id)["password"].startswith(method_prefix(FAST) + "$")
+
+
+def test_a_broken_pool_is_replaced(caplog):
+    hasher = PasswordHasher(FAST, workers=1, max_pending=2)
+    stored = hasher.hash("pw")
+    pool = hasher._executor
+    for process in list(pool._processes.values()):
+        process.kill()
+        process.join()
+    with pytest.raises(HashingBusy):
+        hasher.hash("pw")
+    assert "pool broke" in caplog.text
+    assert hasher.verify(stored, "pw") and hasher._executor is not pool
+    assert hasher._slots._value == 2
+    hasher._executor.shutdown()
+
+
+def test_hashes_hold_their_slot_until_they_finish():
+    hasher = PasswordHasher(SLOW, workers=1, max_pending=2, timeout=0.01)
+    for _ in range(2):
+        with pytest.raises(HashingBusy):  # gave up waiting; still hashing
+            hasher.hash("pw")
+    started = time.monotonic()
+    with pytest.raises(HashingBusy):
+        hasher.hash("pw")
+    assert time.monotonic() - started < 0.01  # refused, not queued
+    hasher._executor.shutdown(wait=True)
+    assert hasher._slots._value == 2
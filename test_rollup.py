@@ -0,0 +1,100 @@
+import datetime
+
+import pytest
+
+import rollup
+
+JAN_30 = datetime.date(2026, 1, 30)
+
+
+@pytest.fixture
+def pin_today(streakly, monkeypatch):
+    """Set the app's today (in every time zone) with pin_today(date)."""
+    return lambda day: monkeypatch.setattr(streakly, "local_today", lambda tz=None: day)
+
+
+def rows(db, user_id):
+    return {
+        r["date"]: (r["scheduled"], r["done"], r["has_reason"])
+        for r in db.execute("SELECT * FROM user_day_rollup WHERE user_id=?", (user_id,))
+    }
+
+
+def assert_current(streakly, db, user_id):
+    """The stored rollup agrees with the raw data and with a full rebuild."""
+    with streakly.app.app_context():
+        through = rollup.horizon(db, user_id)
+        assert through is not None
+        assert rollup.check(db, streakly.store, user_id) == []
+        stored = rows(db, user_id)
+        rollup.reset(db, user_id)
+        rollup.ensure(db, streakly.store, user_id, datetime.date.fromisoformat(through))
+        assert rows(db, user_id) == stored
+        db.rollback()
+
+
+def test_route_writes_keep_the_rollup_current(streakly, client, user_db, pin_today):
+    pin_today(JAN_30)
+    for name, freq in [("Run", "daily"), ("Gym", "weekly")]:
+        client.post("/home", data={"action": "add", "habit_name": name, "frequency": freq})
+    db = user_db(client.user_id)
+    db.execute("UPDATE habit SET created_on='2026-01-01' WHERE user_id=?", (client.user_id,))
+    db.execute("DELETE FROM user_rollup_state WHERE user_id=?", (client.user_id,))
+    db.commit()
+    habits = {h["name"]: h["id"] for h in db.execute("SELECT * FROM habit WHERE user_id=?", (client.user_id,))}
+
+    assert client.get("/analytics").status_code == 200  # builds the rollup
+    assert rollup.horizon(db, client.user_id) == "2026-01-31"
+    assert rows(db, client.user_id)["2026-01-03"] == (2, 0, 0)  # a Saturday
+
+    for day, done in [("2026-01-03", 1), ("2026-01-05", 1), ("2026-01-03", 0), ("2026-01-10", 1)]:
+        client.post("/update_completion", json={"habit_id": habits["Gym"], "date": day, "completed": done})
+        client.post("/update_completion", json={"habit_id": habits["Run"], "date": day, "completed": done})
+        assert_current(streakly, db, client.user_id)
+    assert rows(db, client.user_id)["2026-01-10"] == (2, 2, 0)
+    assert rows(db, client.user_id)["2026-01-05"] == (1, 1, 0)  # Gym is not due on a Monday
+
+    client.post("/update_reason", json={"date": "2026-01-04", "reason": "Sick"})
+    assert rows(db, client.user_id)["2026-01-04"] == (1, 0, 1)
+    client.post("/update_reason", json={"date": "2026-01-04", "reason": ""})
+    assert rows(db, client.user_id)["2026-01-04"] == (1, 0, 0)
+    assert_current(streakly, db, client.user_id)
+
+    client.post("/home", data={"action": "add", "habit_name": "Pay", "frequency": "monthly"})
+    assert rows(db, client.user_id)["2026-01-30"] == (2, 0, 0)  # Run and Pay, created today
+    assert_current(streakly, db, client.user_id)
+
+    client.post("/home", data={"action": "remove", "habit_id": habits["Gym"]})
+    assert rollup.horizon(db, client.user_id) is None  # reset, rebuilt on the next read
+    client.get("/analytics")
+    assert rows(db, client.user_id)["2026-01-10"] == (1, 1, 0)
+    assert_current(streakly, db, client.user_id)
+
+    # A new month moves the horizon on
+    pin_today(datetime.date(2026, 2, 2))
+    client.get("/analytics")
+    assert rollup.horizon(db, client.user_id) == "2026-02-28"
+    client.post("/update_completion", json={"habit_id": habits["Run"], "date": "2026-02-01", "completed": 1})
+    assert rows(db, client.user_id)["2026-02-01"] == (1, 1, 0)
+    assert_current(streakly, db, client.user_id)
+
+
+def test_rebuild_rollups_check_fails_on_drift(streakly, client, user_db):
+    client.post("/home", data={"action": "add", "habit_name": "Run", "frequency": "daily"})
+    client.post("/mark_all_done_today")
+    client.get("/analytics")
+    cli = streakly.app.test_cli_runner()
+    assert cli.invoke(args=["rebuild-rollups"]).exit_code == 0
+    assert cli.invoke(args=["rebuild-rollups", "--check"]).exit_code == 0
+
+    db = user_db(client.user_id)
+    day = db.execute("SELECT MAX(date) FROM user_day_rollup WHERE user_id=? AND done=1",
+                     (client.user_id,)).fetchone()[0]
+    db.execute("UPDATE user_day_rollup SET done=0 WHERE user_id=? AND date=?", (client.user_id, day))
+    db.commit()
+    result = cli.invoke(args=["rebuild-rollups", "--check"])
+    assert result.exit_code == 1
+    assert f"user {client.user_id} {day}: stored (1, 0, 0) != expected (1, 1, 0)" in result.output
+
+    assert cli.invoke(args=["rebuild-rollups"]).exit_code == 0
+    assert cli.invoke(args=["rebuild-rollups", "--check"]).exit_code == 0
@@ -0,0 +1,79 @@
+import calendar
+import datetime
+
+import pytest
+
+from schedule import (FREQUENCIES, frequency_mask, is_scheduled, is_slot, local_today, month_mask,
+                      scheduled_ordinals, zone)
+
+
+def days(start, end):
+    d = start
+    while d <= end:
+        yield d
+        d += datetime.timedelta(days=1)
+
+
+def test_daily_weekly_monthly_rules():
+    # October 2026: Saturdays are the 3rd, 10th, 17th, 24th and 31st
+    month = [datetime.date(2026, 10, d) for d in range(1, 32)]
+    assert all(is_scheduled("daily", d) for d in month)
+    assert [d.day for d in month if is_scheduled("weekly", d)] == [3, 10, 17, 24, 31]
+    assert [d.day for d in month if is_scheduled("monthly", d)] == [30]
+    assert not is_scheduled("yearly", month[0])
+
+
+def test_monthly_is_second_last_day_in_february():
+    assert is_scheduled("monthly", datetime.date(2024, 2, 28))  # leap year
+    assert is_scheduled("monthly", datetime.date(2023, 2, 27))
+
+
+@pytest.mark.parametrize("frequency", FREQUENCIES)
+def test_frequency_mask_matches_weekday_rules(frequency):
+    for year in (2023, 2024):
+        for month in range(1, 13):
+            n = calendar.monthrange(year, month)[1]
+            expected = {
+                "daily": lambda d: True,
+                "weekly": lambda d: d.weekday() == 5,
+                "monthly": lambda d: d.day == n - 1,
+            }[frequency]
+            mask = frequency_mask(frequency, year, month)
+            for d in range(1, n + 1):
+                assert bool(mask >> (d - 1) & 1) == expected(datetime.date(year, month, d))
+            assert mask >> n == 0
+
+
+def test_month_mask_starts_at_created_on():
+    habit = {"frequency": "daily", "created_on": "2026-10-15"}
+    assert month_mask(habit, datetime.date(2026, 9, 1)) == 0
+    assert month_mask(habit, datetime.date(2026, 10, 1)) == sum(1 << (d - 1) for d in range(15, 32))
+    assert month_mask(habit, datetime.date(2026, 11, 1)) == (1 << 30) - 1
+    assert month_mask({"frequency": "daily", "created_on": None}, datetime.date(2026, 10, 1)) == 0
+
+
+@pytest.mark.parametrize("frequency", FREQUENCIES)
+def test_forms_agree(frequency):
+    habit = {"frequency": frequency, "created_on": "2024-01-10"}
+    start, end = datetime.date(2024, 1, 1), datetime.date(2025, 3, 31)
+    by_date = [d.toordinal() for d in days(start, end) if is_slot(habit, d)]
+    by_array = scheduled_ordinals(frequency, datetime.date(2024, 1, 10), end).tolist()
+    by_mask = [
+        d.toordinal() for d in days(start, end) if month_mask(habit, d.replace(day=1)) >> (d.day - 1) & 1
+    ]
+    assert by_date == by_array == by_mask
+
+
+def test_local_today_uses_the_zone():
+    utc = datetime.datetime.now(datetime.timezone.utc)
+    assert local_today("UTC") in (utc.date(), (utc + datetime.timedelta(seconds=5)).date())
+    # UTC+12 and UTC-12 are exactly one day apart ("Etc/GMT-12" is UTC+12)
+    assert local_today("Etc/GMT-12") - local_today("Etc/GMT+12") == datetime.timedelta(days=1)
+
+
+@pytest.mark.parametrize("name", [None, "", "Not/AZone", "../etc/passwd", "America"])
+def test_unknown_zones_fall_back_to_server_date(name, caplog):
+    zone.cache_clear()
+    assert zone(name) is None
+    assert local_today(name) == datetime.date.today()
+    assert ("unknown time zone" in caplog.text) == bool(name)
@@ -0,0 +1,117 @@
+import contextlib
+
+import pytest
+
+import shards
+from conftest import sign_up
+from shards import ShardRouter
+
+
+@pytest.fixture
+def files(streakly, tmp_path):
+    """Two fully migrated data files, `src` and `dst`."""
+    with contextlib.ExitStack() as stack:
+        yield [stack.enter_context(contextlib.closing(streakly.connect_db(str(tmp_path / f"{name}.db"))))
+               for name in ("src", "dst")]
+
+
+def seed(db, user_id, habit_ids):
+    db.executemany("INSERT INTO habit (id,user_id,name,frequency,created_on) VALUES (?,?,?,'daily','2026-01-01')",
+                   [(hid, user_id, f"habit {hid}") for hid in habit_ids])
+    for hid in habit_ids:
+        db.execute("INSERT INTO habit_entry (habit_id,date,completed) VALUES (?,'2026-01-02',1)", (hid,))
+        db.execute("INSERT INTO habit_month (habit_id,month,done_mask,sched_mask) VALUES (?,202601,2,2147483647)",
+                   (hid,))
+        db.execute("INSERT INTO habit_aggregate (habit_id,total,done,as_of) VALUES (?,2,1,'2026-01-02')", (hid,))
+    db.execute("INSERT INTO day_reason (user_id,date,reason) VALUES (?,'2026-01-03','Sick')", (user_id,))
+    db.execute("INSERT INTO cache_generation (user_id,scope,gen) VALUES (?,'habits',4)", (user_id,))
+    db.execute("INSERT INTO user_day_rollup (user_id,date,scheduled,done) VALUES (?,'2026-01-02',2,2)", (user_id,))
+    db.execute("INSERT INTO user_rollup_state (user_id,through) VALUES (?,'2026-01-31')", (user_id,))
+
+
+def test_move_user_copies_a_users_data_under_new_habit_ids(files):
+    src, dst = files
+    seed(src, 1, [1, 2])
+    seed(src, 2, [3])
+    seed(dst, 7, [1, 2])   # another user already holds these ids in dst
+    seed(dst, 1, [5])      # a stale copy, replaced
+    # 2 habits, their entries and months, and a row in each user table but export_job
+    assert shards.move_user(src, dst, 1) == 2 + 2 + 2 + 4
+
+    moved = {h["name"]: h["id"] for h in dst.execute("SELECT * FROM habit WHERE user_id=1")}
+    assert set(moved) == {"habit 1", "habit 2"} and not set(moved.values()) & {1, 2, 5}
+    entries = {(r["habit_id"], r["date"]) for r in dst.execute("SELECT * FROM habit_entry")}
+    assert {(moved["habit 1"], "2026-01-02"), (moved["habit 2"], "2026-01-02")} <= entries
+    assert (5, "2026-01-02") not in entries
+    assert dst.execute("SELECT COUNT(*) FROM habit_month WHERE habit_id IN (?,?)",
+                       tuple(moved.values())).fetchone()[0] == 2
+    # Aggregates are recomputed on the next read; cached pages must not be reused
+    assert dst.execute("SELECT COUNT(*) FROM habit_aggregate WHERE habit_id IN (?,?)",
+                       tuple(moved.values())).fetchone()[0] == 0
+    assert dst.execute("SELECT gen FROM cache_generation WHERE user_id=1").fetchone()[0] == 5
+    assert dst.execute("SELECT reason FROM day_reason WHERE user_id=1").fetchone()[0] == "Sick"
+    assert shards.stored_users(dst) == {1, 7}
+
+    shards.delete_user_data(src, 1)
+    assert shards.stored_users(src) == {2}
+    assert src.execute("SELECT COUNT(*) FROM habit_entry").fetchone()[0] == 1
+
+
+def test_router_places_users(tmp_path):
+    by_count = ShardRouter("catalog.db", str(tmp_path), count=4)
+    assert by_count.enabled and by_count.target(6) == "shard-2"
+    assert by_count.path("shard-2") == str(tmp_path / "shard-2.db")
+    assert by_count.path(None) == "catalog.db"
+    per_user = ShardRouter("catalog.db", str(tmp_path), count=4, per_user=True)
+    assert per_user.target(6) == "user-6"
+    off = ShardRouter("catalog.db", str(tmp_path))
+    assert not off.enabled and off.target(6) is None
+
+
+def test_router_mapping(files, tmp_path):
+    catalog, _ = files
+    router = ShardRouter("catalog.db", str(tmp_path), count=2)
+    catalog.executemany("INSERT INTO user (id,email) VALUES (?,?)", [(1, "a"), (2, "b"), (3, "c")])
+    router.assign(catalog, 1)
+    router.assign(catalog, 2)
+    assert [router.shard_of(catalog, u) for u in (1, 2, 3)] == ["shard-1", "shard-0", None]
+    assert router.users(catalog, None) == [3] and router.users(catalog, "shard-1") == [1]
+    assert router.shards(catalog) == [None, "shard-0", "shard-1"]
+    router.set_shard(catalog, 1, None)
+    assert router.shard_of(catalog, 1) is None and router.users(catalog, None) == [1, 3]
+
+
+def test_rebalance_moves_users_and_keeps_their_data(streakly, monkeypatch):
+    client = sign_up(streakly)
+    client.post("/home", data={"action": "add", "habit_name": "Run", "frequency": "daily"})
+    client.post("/mark_all_done_today")
+
+    def history():  # habits get new ids in the file they move to
+        days = client.get("/api/history").json["days"]
+        return [(d["date"], [(s["habit"], s["completed"]) for s in d["slots"]]) for d in days]
+    before = history()
+    assert before and before[-1][1] == [("Run", True)]
+
+    # Whatever the suite runs with, move everyone somewhere else and back
+    router = streakly.router
+    src = router.target(client.user_id)
+    cli = streakly.app.test_cli_runner()
+    try:
+        if router.per_user:
+            monkeypatch.setattr(router, "per_user", False)
+            monkeypatch.setattr(router, "count", 0)
+        else:
+            monkeypatch.setattr(router, "per_user", True)
+        dst = router.target(client.user_id)
+        out = cli.invoke(args=["rebalance-shards"]).output
+        assert f"user {client.user_id}: {src or 'catalog'} -> {dst or 'catalog'}" in out
+        with streakly.app.app_context():
+            assert router.shard_of(streakly.get_catalog_db(), client.user_id) == dst
+        assert history() == before
+        assert "0 users moved" in cli.invoke(args=["rebalance-shards"]).output
+    finally:
+        monkeypatch.undo()  # the suite's own settings
+        cli.invoke(args=["rebalance-shards"])
+    with streakly.app.app_context():
+        assert router.shard_of(streakly.get_catalog_db(), client.user_id) == src
+    assert history() == before
@@ -0,0 +1,113 @@
+import datetime
+import random
+
+import pytest
+
+import history
+from schedule import is_slot
+from storage import BitsetStorage, RowStorage, Storage, convert, get_backend
+
+START = datetime.date(2025, 12, 20)
+TODAY = datetime.date(2026, 3, 10)
+
+rows, bitset = RowStorage(), BitsetStorage()
+
+
+def days(start, end):
+    d = start
+    while d <= end:
+        yield d
+        d += datetime.timedelta(days=1)
+
+
+@pytest.fixture
+def habits(data_db):
+    db = data_db
+    db.executemany("INSERT INTO habit (id,user_id,name,frequency,created_on) VALUES (?,1,?,?,?)", [
+        (1, "Run", "daily", "2026-01-01"),
+        (2, "Gym", "weekly", "2026-01-01"),
+        (3, "Pay", "monthly", "2025-12-01"),
+    ])
+    return {h["id"]: h for h in db.execute("SELECT id, name, frequency, created_on FROM habit")}
+
+
+def write_both(db, habits, seed=0):
+    """Random completions, explicit misses and clears written to both layouts,
+    split the way apply_completion_changes() splits them."""
+    rnd = random.Random(seed)
+    for _ in range(3):  # later rounds overwrite and clear earlier ones
+        done, missed, cleared = [], [], []
+        for h in habits.values():
+            for d in days(START, TODAY + datetime.timedelta(days=5)):
+                r = rnd.random()
+                if r < 0.4:
+                    done.append((h["id"], d.isoformat()))
+                elif r < 0.5:
+                    (cleared if is_slot(h, d) else missed).append((h["id"], d.isoformat()))
+        for store in (rows, bitset):
+            store.write(db, habits, done, missed, cleared)
+
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        Storage()
+    assert get_backend("rows").name == "rows" and get_backend("bitset").name == "bitset"
+    with pytest.raises(ValueError):
+        get_backend("columns")
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_layouts_answer_the_same(data_db, habits, seed):
+    db = data_db
+    write_both(db, habits, seed)
+
+    for month in (datetime.date(2025, 12, 1), datetime.date(2026, 1, 1), datetime.date(2026, 3, 1)):
+        strip = lambda slots: [dict(s, id=None) for s in slots]
+        assert strip(rows.month_slots(db, 1, habits.values(), month)) == \
+            strip(bitset.month_slots(db, 1, habits.values(), month))
+
+    for since in (None, datetime.date(2026, 2, 1)):
+        assert rows.habit_metrics(db, TODAY, user_id=1, since=since) == \
+            bitset.habit_metrics(db, TODAY, user_id=1, since=since)
+        for h in habits.values():
+            a, b = rows.slot_arrays(db, h, since, TODAY), bitset.slot_arrays(db, h, since, TODAY)
+            assert a[0].tolist() == b[0].tolist() and a[1].tolist() == b[1].tolist()
+
+    def walk(store):
+        hs = history.load_habits(db, 1)
+        return [
+            (iso, [(h["id"], c == 1) for h, c in slots])
+            for iso, slots, _ in history.iter_days(db, store, 1, hs, "2025-12-01", TODAY.isoformat())
+        ]
+    assert walk(rows) == walk(bitset)
+
+    assert rows.first_date(db, 1) == bitset.first_date(db, 1)
+    # Writers only ask about days off the schedule (is it an explicit miss?)
+    off = {
+        (h["id"], d.isoformat()) for h in habits.values() for d in days(START, TODAY)
+        if not is_slot(h, d)
+    }
+    dates = sorted({d for _, d in off})
+    assert rows.recorded(db, list(habits), dates) & off == bitset.recorded(db, list(habits), dates) & off
+
+
+def test_convert_round_trip(data_db, habits):
+    db = data_db
+    write_both(db, habits, seed=3)
+    entries = sorted(tuple(r) for r in db.execute("SELECT habit_id, date, completed FROM habit_entry"))
+    months = sorted(tuple(r) for r in db.execute("SELECT habit_id, month, done_mask, sched_mask FROM habit_month"))
+
+    convert(db, "bitset")
+    assert sorted(tuple(r) for r in db.execute("SELECT habit_id, month, done_mask, sched_mask FROM habit_month")) == months
+    convert(db, "rows")
+    assert sorted(tuple(r) for r in db.execute("SELECT habit_id, date, completed FROM habit_entry")) == entries
+
+
+def test_delete_from_forgets_the_same_days(data_db, habits):
+    db = data_db
+    write_both(db, habits, seed=4)
+    for store in (rows, bitset):
+        store.delete_from(db, 1, datetime.date(2026, 2, 14))
+    assert rows.habit_metrics(db, TODAY, habit_id=1) == bitset.habit_metrics(db, TODAY, habit_id=1)
+    for store in (rows, bitset):
+        assert len(store.entry_arrays(db, habit_id=1, since=datetime.date(2026, 2, 14))[1]) == 0